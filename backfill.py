@@ -0,0 +1,202 @@
+"""
+按交易日回填全部股票的历史交易记录文件.
+逐只股票调用get_whole_trade_record_data需要约一个小时,且集中请求单只股票接口.本模块按交易日调用全市场接口,
+分两步完成回填:
+1. 拉取: 交易日按chunk_days个一组获取全市场数据,每组按股票追加到SPOOL_PATH目录下的暂存文件,
+   每组完成后记录检查点,中断后以resume=True重新运行从检查点继续.
+2. 转置: 逐只读取暂存文件,去重 排序 前复权后写入TRADE_RECORD_PATH目录.
+NOTE:
+内存占用只与chunk_days个交易日的全市场数据和单只股票的全部历史相关,与回填年数和股票数量无关.
+前复权需要每只股票最新的复权因子,因此暂存文件保存未复权收盘价和复权因子,在转置时统一计算.
+每组交易日和每只股票的转置作为单元记录在作业日志中,检查点仍是继续运行的依据.
+"""
+import os
+import json
+import shutil
+import time
+from functools import partial
+from typing import Dict, List
+import pandas as pd
+import tsswindustry as sw
+import fetch
+import journal
+import tradecal
+from data import DAILY_BASIC_FIELDS, get_market_trade_record_by_date
+from path import DATA_PACKAGE_PATH, TRADE_RECORD_PATH
+
+SPOOL_PATH = os.path.join(DATA_PACKAGE_PATH, "backfill-spool")  # 按股票暂存的目录
+CHECKPOINT_FILE = os.path.join(SPOOL_PATH, "checkpoint.json")  # 检查点文件
+SPOOL_COLUMNS = [field for field in DAILY_BASIC_FIELDS if field != 'close'] + ['close', 'pct_chg', 'adj_factor']
+# 与create_trade_record_csv_table生成的文件列顺序一致
+TRADE_RECORD_COLUMNS = SPOOL_COLUMNS[:2] + ['company', 'industry'] + SPOOL_COLUMNS[2:-1]
+
+def load_checkpoint() -> Dict:
+    """
+    读取检查点
+    :return: {'pulled': 已拉取的最后一个交易日, 'transposed': 已转置的股票代码列表},不存在时返回空字典
+    """
+    if not os.path.exists(CHECKPOINT_FILE):
+        return {}
+    with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint: Dict) -> None:
+    """
+    写入检查点,先写临时文件再替换,中断时不会留下不完整的检查点
+    :param checkpoint: 检查点
+    """
+    tmp_file = CHECKPOINT_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+def spool_chunk(df: pd.DataFrame) -> None:
+    """
+    将一组交易日的全市场数据按股票追加到暂存文件
+    :param df: get_market_trade_record_by_date返回值的合并
+    """
+    df = df.reindex(columns=SPOOL_COLUMNS)
+    for ts_code, group in df.groupby('ts_code'):
+        spool_file = os.path.join(SPOOL_PATH, f"{ts_code[0:6]}.csv")
+        group.to_csv(spool_file, mode='a', index=False, header=not os.path.exists(spool_file))
+
+def pull_trade_dates(trade_dates: List[str], chunk_days: int = 60, pro=None, job_id: int = None) -> None:
+    """
+    按交易日拉取全市场数据并写入暂存文件
+    :param trade_dates: 升序排列的交易日列表
+    :param chunk_days: 每组交易日数量,决定内存占用
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :param job_id: 作业日志编号,为None时不记录
+    NOTE:
+    一组交易日全部获取成功后才写入暂存文件并推进检查点,重试后仍然失败时抛出异常,下次运行从该组继续.
+    """
+    checkpoint = load_checkpoint()
+    pulled = checkpoint.get('pulled', '')
+    trade_dates = [date for date in trade_dates if date > pulled]
+    func = partial(get_market_trade_record_by_date, pro=pro)
+    for index in range(0, len(trade_dates), chunk_days):
+        chunk = trade_dates[index:index+chunk_days]
+        unit = f'{chunk[0]}-{chunk[-1]}'
+        start = time.monotonic()
+        frames = []
+        for trade_date, df, error in fetch.fetch_all(func, chunk):
+            if error is not None:
+                if job_id is not None:
+                    journal.record_unit(job_id, unit, error, time.monotonic() - start)
+                raise RuntimeError(f'{trade_date}全市场交易记录获取失败: {error}')
+            if not df.empty:
+                frames.append(df)
+        if frames:
+            spool_chunk(pd.concat(frames, ignore_index=True))
+        checkpoint['pulled'] = chunk[-1]
+        save_checkpoint(checkpoint)
+        if job_id is not None:
+            journal.record_unit(job_id, unit, None, time.monotonic() - start)
+        print(f'已拉取至{chunk[-1]}, {index+len(chunk)}/{len(trade_dates)}个交易日.' + ' '*20 + '\r', end='', flush=True)
+
+def transpose_stock(code: str) -> bool:
+    """
+    将一只股票的暂存文件转换为历史交易记录文件
+    :param code: 股票代码, 例如: '600000' or '000001'
+    :return: 是否写入了交易记录文件
+    """
+    spool_file = os.path.join(SPOOL_PATH, f"{code}.csv")
+    if not os.path.exists(spool_file):
+        return False
+    df = pd.read_csv(spool_file, dtype={'trade_date': str})
+    # 中断后重新拉取的交易日可能重复写入暂存文件
+    df = df.drop_duplicates(subset=['trade_date'], keep='last')
+    df = df.sort_values(by='trade_date', ascending=False)  # 按日期降序排列
+    latest_adj = df['adj_factor'].dropna()
+    if not latest_adj.empty:
+        qfq_close = (df['close'] * df['adj_factor'] / latest_adj.iloc[0]).round(2)
+        df['close'] = qfq_close.fillna(df['close'])
+    company, industry = sw.get_name_and_class_by_code(code=code)
+    df['company'] = company
+    df['industry'] = industry
+    df = df.reindex(columns=TRADE_RECORD_COLUMNS)
+    df['trade_date'] = df['trade_date'].astype('object')
+
+    dest_path = os.path.join(TRADE_RECORD_PATH, industry)
+    if not os.path.exists(dest_path):
+        os.mkdir(dest_path)
+    file_path = os.path.join(dest_path, f"{code}.csv")
+    df.to_csv(file_path + '.tmp', index=False)
+    os.replace(file_path + '.tmp', file_path)
+    return True
+
+def transpose_spool(codes: List[str], job_id: int = None) -> List[str]:
+    """
+    逐只转置暂存文件,已转置的股票记录在检查点中
+    :param codes: 股票代码列表
+    :param job_id: 作业日志编号,为None时不记录
+    :return: 没有暂存数据的股票代码列表
+    """
+    checkpoint = load_checkpoint()
+    transposed = set(checkpoint.get('transposed', []))
+    empty = []
+    for index, code in enumerate(codes):
+        if code in transposed:
+            continue
+        start = time.monotonic()
+        if not transpose_stock(code):
+            empty.append(code)
+        transposed.add(code)
+        if job_id is not None:
+            journal.record_unit(job_id, code, None, time.monotonic() - start)
+        if (index + 1) % 100 == 0 or index == len(codes) - 1:
+            checkpoint['transposed'] = sorted(transposed)
+            save_checkpoint(checkpoint)
+            print(f'已转置{index+1}/{len(codes)}只股票.' + ' '*20 + '\r', end='', flush=True)
+    return empty
+
+def run_backfill(
+    start_date: str = '19901219',
+    end_date: str = None,
+    chunk_days: int = 60,
+    codes: List[str] = None,
+    pro=None,
+    keep_spool: bool = False,
+    resume: bool = False
+) -> List[str]:
+    """
+    回填全部股票的历史交易记录文件
+    :param start_date: 开始日期, 例如: '19901219'
+    :param end_date: 结束日期,默认为今日
+    :param chunk_days: 每组交易日数量
+    :param codes: 需要写入交易记录文件的股票代码,默认为申万行业全部股票
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :param keep_spool: 完成后是否保留暂存目录
+    :param resume: 是否从上一次中断的检查点继续,否则清空暂存目录重新回填
+    :return: 没有暂存数据的股票代码列表
+    """
+    if not resume and os.path.exists(SPOOL_PATH):
+        shutil.rmtree(SPOOL_PATH)
+    if not os.path.exists(SPOOL_PATH):
+        os.makedirs(SPOOL_PATH)
+    end_date = end_date if end_date is not None else time.strftime('%Y%m%d', time.localtime(time.time()))
+    codes = codes if codes is not None else [item[0][0:6] for item in sw.get_all_stocks()]
+    checkpoint = load_checkpoint()
+    if checkpoint.get('end_date', end_date) < end_date:
+        # 拉取完成后重新运行时只补充新交易日,已转置的文件需要重新生成
+        checkpoint.pop('transposed', None)
+    checkpoint['end_date'] = end_date
+    save_checkpoint(checkpoint)
+    job_id = journal.start_job('create-trade-csv', resume)
+    pull_trade_dates(tradecal.get_trade_days(start_date, end_date, pro=pro), chunk_days, pro, job_id)
+    empty = transpose_spool(codes, job_id)
+    journal.finish_job(job_id)
+    if not keep_spool:
+        shutil.rmtree(SPOOL_PATH)
+    return empty
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='按交易日回填全部股票的历史交易记录文件')
+    parser.add_argument('--resume', action='store_true', help='从上一次中断的检查点继续')
+    args = parser.parse_args()
+    start = time.time()
+    empty = run_backfill(resume=args.resume)
+    print(f'历史交易记录文件回填完成,耗时{time.time()-start:.2f}秒.' + ' '*20)
+    if empty:
+        print(f'以下股票没有交易记录: {empty}')
@@ -0,0 +1,486 @@
+"""
+合成行情基准测试.
+在临时数据根目录下按生产格式生成可配置规模的合成行情,再对回测 查询函数 评估和写入计时,结果保存为JSON,
+不同版本的结果可以相互比较,不需要生产数据和网络.
+合成数据:
+1. 交易日历: 工作日开市,覆盖至今日之后一年多,不会触发trade_cal请求.
+2. 申万行业成分: 以datasource录制文件的形式写入,tsswindustry在重放模式下读取.
+3. ROE长表和宽表 curve表 三个指数估值表: 经roestore和data的建表 写入函数生成.
+4. 交易记录csv文件: 列顺序与backfill.TRADE_RECORD_COLUMNS相同,按日期降序.
+用法:
+    python benchmark.py --stocks 200 --years 10 --output bench.json
+    python benchmark.py --compare base.json bench.json  # 打印各项耗时之比
+    python benchmark.py --startup  # 只检查启动预算,超出时退出码为1
+NOTE:
+path中的路径在导入时确定,本模块先设置QUANT_ROOT_PATH和QUANT_DATASOURCE=replay,再导入项目模块,
+因此项目模块只在函数内部导入,同一进程只能针对一个数据根目录运行.
+每项计时重复repeat次,取最小值和中位数,比较时以中位数为准.
+启动检查在空数据根目录 不设置仓库路径环境变量的新进程中以python -X importtime导入strategy,
+要求累计导入耗时不超过IMPORT_BUDGET,不加载HEAVY_MODULES,也不创建任何文件或目录.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import datetime
+import platform
+import tempfile
+import subprocess
+from typing import Callable, Dict, List
+import numpy as np
+import pandas as pd
+
+INDUSTRIES = ['银行', '医药生物', '食品饮料', '电子', '计算机', '机械设备', '有色金属', '公用事业', '家用电器', '汽车']
+INDEXES = ['000300', '000905', '399006']
+CONDITIONS = {  # 各策略固定的测试条件
+    'ROE': {'roe_list': [15]*5, 'period': 5, 'holding_time': 6, 'trade_month': 6},
+    'ROE-DIVIDEND': {'roe_list': [12]*5, 'period': 5, 'dividend': 1, 'holding_time': 12, 'trade_month': 6},
+    'ROE-MOS': {'roe_list': [12]*7, 'mos_range': [-1, 1], 'holding_time': 12, 'trade_month': 6},
+    'ROE-MOS-DIVIDEND': {'roe_list': [12]*7, 'mos_range': [-1, 1], 'dividend': 1, 'holding_time': 12, 'trade_month': 6},
+    'ROE-MOS-MULTI-YIELD': {'roe_list': [12]*7, 'mos_range': [-1, 1], 'multi_value': 1.0, 'holding_time': 12, 'trade_month': 6},
+}
+THRESHOLD = 1.10  # 比较时中位数变慢超过该倍数记为退化
+IMPORT_BUDGET = 1.0  # 导入strategy的累计耗时上限(秒),回测工作进程的启动时间
+HEAVY_MODULES = ('matplotlib', 'tushare', 'requests', 'apscheduler')  # 导入strategy时不应加载的模块
+
+def configure_root(root: str) -> None:
+    """
+    设置数据根目录和重放模式,须在导入任何项目模块之前调用
+    :param root: 数据根目录
+    """
+    if 'path' in sys.modules and sys.modules['path'].ROOT_PATH != root:
+        raise RuntimeError('path模块已按其它数据根目录导入,请在新进程中运行')
+    os.environ['QUANT_ROOT_PATH'] = root
+    os.environ['QUANT_DATASOURCE'] = 'replay'
+
+def stock_codes(stocks: int) -> List[str]:
+    """
+    合成股票代码,沪市和深市交替
+    :param stocks: 股票数量
+    :return: 例如: ['600000', '000001', '600001', ...]
+    """
+    return [f'{600000 + i//2:06d}' if i % 2 == 0 else f'{1 + i//2:06d}' for i in range(stocks)]
+
+def full_code(code: str) -> str:
+    """
+    带后缀的股票代码
+    :param code: 股票代码, 例如: '600000'
+    :return: 例如: '600000.SH'
+    """
+    return code + '.SH' if code.startswith('6') else code + '.SZ'
+
+def write_calendar(first: datetime.date, last: datetime.date) -> List[str]:
+    """
+    写入工作日开市的交易日历
+    :param first: 第一天
+    :param last: 最后一天
+    :return: 今日之前的交易日列表, 例如: ['20160104', ...]
+    """
+    import tradecal
+    from path import TRADE_CAL_TABLE
+    days = pd.date_range(first, last, freq='D')
+    rows = [(day.strftime('%Y%m%d'), int(day.weekday() < 5)) for day in days]
+    con = tradecal.connect()
+    with con:
+        con.executemany(f"INSERT OR REPLACE INTO '{TRADE_CAL_TABLE}' (cal_date, is_open) VALUES (?, ?)", rows)
+    con.close()
+    today = datetime.date.today().strftime('%Y%m%d')
+    return [date for date, is_open in rows if is_open and date < today]
+
+def write_industry_records(codes: List[str], listing: Dict[str, str], rng: np.random.Generator) -> Dict[str, str]:
+    """
+    以录制文件写入申万行业分类和成分股,调用参数与tsswindustry一致
+    :param codes: 股票代码
+    :param listing: {股票代码: 纳入日期}
+    :param rng: 随机数发生器
+    :return: {股票代码: 行业名称}
+    """
+    import datasource
+    def save(api, kwargs, result):
+        file_path = datasource.record_file(api, (), kwargs)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            pickle.dump(result, f)
+    index_codes = [f'8011{i:02d}.SI' for i in range(len(INDUSTRIES))]
+    save('pro.index_classify', {'index_code': '', 'level': 'L1', 'src': 'SW2021', 'fields': ['index_code', 'industry_name']},
+         pd.DataFrame({'index_code': index_codes, 'industry_name': INDUSTRIES}))
+    industry = {code: INDUSTRIES[i % len(INDUSTRIES)] for i, code in enumerate(codes)}
+    fields = ["index_code", "index_name", "con_code", "con_name", "in_date", "out_date", "is_new"]
+    for index_code, name in zip(index_codes, INDUSTRIES):
+        members = [code for code in codes if industry[code] == name]
+        out_date = [None if rng.random() > 0.05 else '20991231' for _ in members]  # 少量股票带退出日期
+        save('pro.index_member', {'index_code': index_code, 'fields': fields}, pd.DataFrame({
+            'index_code': index_code, 'index_name': f'{name}(申万)', 'con_code': [full_code(code) for code in members],
+            'con_name': [f'合成{code}' for code in members], 'in_date': [listing[code] for code in members],
+            'out_date': out_date, 'is_new': 'Y',
+        }, columns=fields))
+    return industry
+
+def write_roe(codes: List[str], industry: Dict[str, str], years: List[int], rng: np.random.Generator) -> None:
+    """
+    写入ROE长表并重建宽表
+    :param codes: 股票代码
+    :param industry: {股票代码: 行业名称}
+    :param years: 年度列表
+    :param rng: 随机数发生器
+    """
+    import roestore
+    quality = rng.uniform(0, 30, len(codes))
+    roe = quality[:, None] + rng.normal(0, 4, (len(codes), len(years)))
+    con = roestore.connect()
+    with con:
+        roestore.upsert_stocks(con, [(full_code(code), f'合成{code}', industry[code]) for code in codes])
+        roestore.upsert_roe(con, [
+            (full_code(code), year, round(float(roe[i, j]), 4))
+            for i, code in enumerate(codes) for j, year in enumerate(years)
+        ])
+        roestore.refresh_wide_table(con)
+    con.close()
+
+def write_curve_and_indexes(trade_days: List[str], rng: np.random.Generator) -> None:
+    """
+    写入curve表和三个指数估值表
+    :param trade_days: 交易日列表
+    :param rng: 随机数发生器
+    """
+    import sqlite3
+    import data
+    from path import CURVE_SQLITE3, CURVE_TABLE, INDEX_VALUE
+    value = np.clip(3.0 + np.cumsum(rng.normal(0, 0.01, len(trade_days))), 1.5, 5.0).round(4)
+    con = sqlite3.connect(CURVE_SQLITE3)
+    with con:
+        data.ensure_curve_table(con)
+        con.executemany(
+            f"INSERT OR REPLACE INTO '{CURVE_TABLE}' (date1, value1) VALUES (?, ?)",
+            [(f'{day[0:4]}-{day[4:6]}-{day[6:8]}', float(v)) for day, v in zip(trade_days, value)]
+        )
+    con.close()
+    con = sqlite3.connect(INDEX_VALUE)
+    for index in INDEXES:
+        code = index + '.SH' if index.startswith('000') else index + '.SZ'
+        pct_chg = rng.normal(0.03, 1.3, len(trade_days)).round(4)
+        pb = np.clip(1.5 * np.exp(np.cumsum(rng.normal(0, 0.01, len(trade_days)))), 0.5, 8).round(4)
+        pe = (pb / rng.uniform(0.08, 0.14)).round(4)
+        df = pd.DataFrame({
+            'ts_code': code, 'trade_date': trade_days, 'pb': pb, 'pe': pe, 'pe_ttm': pe,
+            'turnover_rate': rng.uniform(0.3, 2, len(trade_days)).round(4),
+            'turnover_rate_f': rng.uniform(0.5, 3, len(trade_days)).round(4),
+            'roe_est': (pb / pe).round(4), 'pct_chg': pct_chg,
+            'close': (3000 * np.cumprod(1 + pct_chg / 100)).round(2),
+            'vol': rng.uniform(1e7, 5e7, len(trade_days)).round(0),
+            'amount': rng.uniform(1e7, 5e7, len(trade_days)).round(0),
+        })
+        with con:
+            data.ensure_index_table(con, code)
+            data.upsert_index_rows(con, code, df)
+    con.close()
+
+def synthetic_trade_record(code: str, name: str, industry: str, days: List[str], rng: np.random.Generator) -> pd.DataFrame:
+    """
+    合成一只股票的交易记录,列顺序与backfill.TRADE_RECORD_COLUMNS相同,按日期降序
+    :param code: 股票代码
+    :param name: 公司简称
+    :param industry: 行业名称
+    :param days: 升序排列的交易日
+    :param rng: 随机数发生器
+    :return: DataFrame
+    """
+    from backfill import TRADE_RECORD_COLUMNS
+    n = len(days)
+    pct_chg = rng.normal(0.04, 2.2, n).clip(-10, 10).round(4)
+    close = (rng.uniform(5, 50) * np.cumprod(1 + pct_chg / 100)).round(2)
+    pb = (rng.uniform(0.6, 5) * np.exp(np.cumsum(rng.normal(0, 0.01, n)))).round(4)
+    pe = (pb * rng.uniform(5, 15)).round(4)
+    dv_ratio = np.clip(rng.uniform(0, 5) + rng.normal(0, 0.2, n), 0, None).round(4)
+    total_share = rng.uniform(1e4, 1e6)
+    df = pd.DataFrame({
+        'ts_code': full_code(code), 'trade_date': days, 'company': name, 'industry': industry,
+        'pe_ttm': pe, 'pb': pb, 'ps_ttm': (pe / 3).round(4), 'dv_ratio': dv_ratio, 'dv_ttm': dv_ratio,
+        'turnover_rate': rng.uniform(0.1, 5, n).round(4), 'turnover_rate_f': rng.uniform(0.1, 8, n).round(4),
+        'volume_ratio': rng.uniform(0.5, 2, n).round(2), 'total_share': total_share, 'float_share': total_share * 0.8,
+        'free_share': total_share * 0.5, 'total_mv': (close * total_share).round(2),
+        'circ_mv': (close * total_share * 0.8).round(2), 'pe': pe, 'ps': (pe / 3).round(4),
+        'close': close, 'pct_chg': pct_chg,
+    }, columns=TRADE_RECORD_COLUMNS)
+    return df.iloc[::-1]
+
+def build_market(stocks: int = 200, years: int = 10, seed: int = 0) -> Dict:
+    """
+    在当前数据根目录下生成合成行情,须先调用configure_root
+    :param stocks: 股票数量
+    :param years: 交易记录覆盖的年数,ROE多覆盖7年,使第一个时间组也有完整的7年ROE
+    :param seed: 随机种子
+    :return: 合成行情的规模 {'stocks', 'years', 'trade_days', 'csv_bytes', 'seconds'}
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    first = datetime.date(today.year - years, 1, 1)
+    trade_days = write_calendar(first, today + datetime.timedelta(days=400))
+    codes = stock_codes(stocks)
+    # 约四分之一的股票在期间内上市
+    listing = {code: trade_days[int(rng.integers(0, len(trade_days) // 2))] if rng.random() < 0.25 else trade_days[0]
+               for code in codes}
+    industry = write_industry_records(codes, listing, rng)
+    write_roe(codes, industry, list(range(first.year - 7, today.year)), rng)
+    write_curve_and_indexes(trade_days, rng)
+    from path import TRADE_RECORD_PATH
+    csv_bytes = 0
+    for code in codes:
+        dest_dir = os.path.join(TRADE_RECORD_PATH, industry[code])
+        os.makedirs(dest_dir, exist_ok=True)
+        days = [day for day in trade_days if day >= listing[code]]
+        csv_file = os.path.join(dest_dir, f'{code}.csv')
+        synthetic_trade_record(code, f'合成{code}', industry[code], days, rng).to_csv(csv_file, index=False)
+        csv_bytes += os.path.getsize(csv_file)
+    return {
+        'stocks': stocks, 'years': years, 'seed': seed, 'trade_days': len(trade_days),
+        'csv_bytes': csv_bytes, 'seconds': round(time.perf_counter() - start, 3),
+    }
+
+def time_call(func: Callable, repeat: int = 3, calls: int = 1) -> Dict:
+    """
+    重复执行func并计时
+    :param func: 无参数函数
+    :param repeat: 重复次数
+    :param calls: func内部执行的操作次数,用于计算每次操作的耗时
+    :return: {'repeat', 'calls', 'best', 'median', 'per_call_ms'}
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    median = float(np.median(seconds))
+    return {
+        'repeat': repeat, 'calls': calls, 'best': round(min(seconds), 6), 'median': round(median, 6),
+        'per_call_ms': round(median / calls * 1000, 4),
+    }
+
+def run_benchmarks(repeat: int = 3, samples: int = 50, seed: int = 0) -> Dict[str, Dict]:
+    """
+    对合成行情计时
+    :param repeat: 每项重复次数
+    :param samples: 查询函数的(股票, 日期)样本数
+    :param seed: 随机种子
+    :return: {项目名称: time_call的返回值}
+    """
+    import sqlite3
+    import data
+    import roestore
+    import generation
+    import tradecal
+    import utils
+    import tsswindustry as sw
+    from backfill import SPOOL_COLUMNS
+    from strategy import Strategy
+    from path import TRADE_RECORD_PATH, INDEX_VALUE
+    rng = random.Random(seed)
+    results = {}
+    codes = [item[0][0:6] for item in sw.get_all_stocks()]
+    today = datetime.date.today()
+    dates = [datetime.date.fromordinal(rng.randint(today.toordinal() - 3*365, today.toordinal() - 30)).isoformat()
+             for _ in range(samples)]
+    pairs = [(rng.choice(codes), date) for date in dates]
+
+    # 查询函数
+    lookups = {
+        'lookup.find_closest_row_in_trade_record': lambda: [utils.find_closest_row_in_trade_record(c, d) for c, d in pairs],
+        'lookup.find_closest_row_in_curve_table': lambda: [utils.find_closest_row_in_curve_table(d) for d in dates],
+        'lookup.calculate_MOS_7_from_2006': lambda: [utils.calculate_MOS_7_from_2006(c, d) for c, d in pairs],
+        'lookup.calculate_stock_rising_value': lambda: [
+            utils.calculate_stock_rising_value(c, d, today.isoformat()) for c, d in pairs],
+        'lookup.calculate_index_rising_value': lambda: [
+            utils.calculate_index_rising_value('000300', d, today.isoformat()) for d in dates],
+        'lookup.in_index_or_not': lambda: [sw.in_index_or_not(c, d) for c, d in pairs],
+        'lookup.nearest_trade_day': lambda: [tradecal.nearest_trade_day(d) for d in dates],
+    }
+    for name, func in lookups.items():
+        results[name] = time_call(func, repeat, samples)
+
+    # 各策略回测 收益对比和评估
+    strategy = Strategy()
+    for name, test_condition in CONDITIONS.items():
+        condition = {'strategy': name, 'test_condition': test_condition}
+        results[f'backtest.{name}'] = time_call(lambda: strategy.run_strategy_backtest(condition), repeat)
+    condition = {'strategy': 'ROE-MOS', 'test_condition': CONDITIONS['ROE-MOS']}
+    result = strategy.run_strategy_backtest(condition)
+    results['backtest.test_strategy_portfolio'] = time_call(
+        lambda: strategy.test_strategy_portfolio('ROE-MOS', result, max_numbers=10**6), repeat)
+    portfolio = strategy.test_strategy_portfolio('ROE-MOS', result, max_numbers=10**6)
+    results['backtest.evaluate_portfolio_effect'] = time_call(
+        lambda: strategy.evaluate_portfolio_effect(condition, result, portfolio), repeat)
+
+    # 写入: 按交易日追加交易记录 指数估值upsert ROE upsert 发布数据集版本
+    last_dates = {}
+    for code in codes:
+        csv_file = os.path.join(TRADE_RECORD_PATH, sw.get_name_and_class_by_code(code)[1], f'{code}.csv')
+        last_dates[code] = pd.read_csv(csv_file, dtype={'trade_date': str}, usecols=['trade_date'], nrows=1).loc[0, 'trade_date']
+    future_days = tradecal.get_trade_days(today.strftime('%Y%m%d'), (today + datetime.timedelta(days=60)).strftime('%Y%m%d'))
+    def append_day():
+        day = future_days.pop(0)
+        market = pd.DataFrame({column: 1.0 for column in SPOOL_COLUMNS}, index=range(len(codes)))
+        market['ts_code'] = [full_code(code) for code in codes]
+        market['trade_date'] = day
+        data.write_market_trade_records({day: market}, last_dates)
+        last_dates.update({code: day for code in codes})
+    results['ingest.write_market_trade_records'] = time_call(append_day, repeat, len(codes))
+    con = sqlite3.connect(INDEX_VALUE)
+    index_rows = pd.read_sql("SELECT * FROM '000300.SH'", con)
+    con.close()
+    def upsert_index():
+        con = sqlite3.connect(INDEX_VALUE)
+        with con:
+            data.upsert_index_rows(con, '000300.SH', index_rows)
+        con.close()
+    results['ingest.upsert_index_rows'] = time_call(upsert_index, repeat, len(index_rows))
+    roe_rows = [(full_code(code), today.year - 1, 10.0) for code in codes]
+    def upsert_roe():
+        con = roestore.connect()
+        with con:
+            roestore.upsert_roe(con, roe_rows)
+            roestore.refresh_wide_table(con, [row[0] for row in roe_rows])
+        con.close()
+    results['ingest.upsert_roe'] = time_call(upsert_roe, repeat, len(roe_rows))
+    results['ingest.publish'] = time_call(generation.publish, repeat)
+    return results
+
+def import_seconds(module: str) -> float:
+    """
+    在新进程中导入模块的耗时
+    :param module: 模块名称
+    :return: 秒数
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=os.environ.copy())
+    return float(output.stdout.strip().splitlines()[-1])
+
+def check_startup(module: str = 'strategy', budget: float = IMPORT_BUDGET) -> Dict:
+    """
+    以python -X importtime在新进程中导入模块,检查启动耗时和导入副作用
+    :param module: 模块名称
+    :param budget: 累计导入耗时上限(秒)
+    :return: {'module', 'seconds', 'budget', 'heavy', 'created', 'ok'},
+             heavy为已加载的HEAVY_MODULES,created为导入后数据根目录下出现的文件和目录
+    """
+    root = tempfile.mkdtemp(prefix='quant-startup-')
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('MACBOOK_REPOSITORY_PATH', 'IMAC_REPOSITORY_PATH', 'QUANT_PROFILE')}
+    env['QUANT_ROOT_PATH'] = root
+    code = f"import sys; import {module}; print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}})))"
+    try:
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        created = sorted(os.listdir(root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    # stderr每行为"import time: 自身微秒 | 累计微秒 | 模块名称",顶层模块名称前没有缩进
+    seconds = None
+    for line in output.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == module:
+            seconds = int(fields[1]) / 1e6
+    loaded = set(output.stdout.split())
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+    ok = seconds is not None and seconds <= budget and not heavy and not created
+    return {'module': module, 'seconds': seconds, 'budget': budget, 'heavy': heavy, 'created': created, 'ok': ok}
+
+def print_startup(check: Dict) -> None:
+    """
+    打印check_startup的结果
+    :param check: check_startup的返回值
+    """
+    print(f"导入{check['module']}累计耗时{check['seconds']:.3f}秒, 预算{check['budget']:.3f}秒"
+          f"{'' if check['seconds'] <= check['budget'] else ', 超出预算'}.")
+    if check['heavy']:
+        print(f"导入时加载了{check['heavy']}, 应在首次使用时导入.")
+    if check['created']:
+        print(f"导入时在数据根目录下创建了{check['created']}.")
+
+def compare(base: Dict, new: Dict, threshold: float = THRESHOLD) -> List[str]:
+    """
+    比较两次结果的中位数并打印
+    :param base: 基准结果
+    :param new: 新结果
+    :param threshold: 退化阈值
+    :return: 退化的项目名称列表
+    """
+    regressions = []
+    print(f"{'项目':<50}{'基准':>12}{'本次':>12}{'比值':>8}")
+    for name in sorted(set(base['results']) | set(new['results'])):
+        old, cur = base['results'].get(name), new['results'].get(name)
+        if old is None or cur is None:
+            print(f"{name:<50}{'-' if old is None else old['median']:>12}{'-' if cur is None else cur['median']:>12}")
+            continue
+        ratio = cur['median'] / old['median'] if old['median'] > 0 else float('inf')
+        flag = ' 退化' if ratio > threshold else ''
+        print(f"{name:<50}{old['median']:>12.4f}{cur['median']:>12.4f}{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+def main(stocks: int, years: int, repeat: int, samples: int, seed: int, root: str = None, keep: bool = False) -> Dict:
+    """
+    生成合成行情并计时
+    :param stocks: 股票数量
+    :param years: 年数
+    :param repeat: 每项重复次数
+    :param samples: 查询函数的样本数
+    :param seed: 随机种子
+    :param root: 数据根目录,默认为新建的临时目录
+    :param keep: 完成后是否保留数据根目录
+    :return: {'meta': {...}, 'market': build_market的返回值, 'results': run_benchmarks的返回值,
+              'startup': check_startup的返回值}
+    """
+    root = root if root is not None else tempfile.mkdtemp(prefix='quant-bench-')
+    configure_root(root)
+    try:
+        market = build_market(stocks, years, seed)
+        results = run_benchmarks(repeat, samples, seed)
+        for module in ('path', 'utils', 'strategy'):
+            results[f'startup.import_{module}'] = {'repeat': 1, 'calls': 1, 'best': import_seconds(module)}
+            results[f'startup.import_{module}']['median'] = results[f'startup.import_{module}']['best']
+        startup = check_startup()
+        results['startup.importtime_strategy'] = {'repeat': 1, 'calls': 1, 'best': startup['seconds'],
+                                                  'median': startup['seconds']}
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    meta = {
+        'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+        'platform': platform.platform(), 'cpus': os.cpu_count(), 'repeat': repeat, 'samples': samples,
+    }
+    return {'meta': meta, 'market': market, 'results': results, 'startup': startup}
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='合成行情基准测试')
+    parser.add_argument('--stocks', type=int, default=200, help='股票数量')
+    parser.add_argument('--years', type=int, default=10, help='交易记录覆盖的年数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    parser.add_argument('--samples', type=int, default=50, help='查询函数的样本数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--root', default=None, help='数据根目录,默认为临时目录')
+    parser.add_argument('--keep', action='store_true', help='保留数据根目录')
+    parser.add_argument('--output', default=None, help='结果JSON文件,默认打印到标准输出')
+    parser.add_argument('--startup', action='store_true', help='只检查导入strategy的耗时预算和导入副作用')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='比较两个结果JSON文件,不运行基准测试')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f1, open(args.compare[1], 'r', encoding='utf-8') as f2:
+            sys.exit(1 if compare(json.load(f1), json.load(f2)) else 0)
+    if args.startup:
+        check = check_startup()
+        print_startup(check)
+        sys.exit(0 if check['ok'] else 1)
+    report = main(args.stocks, args.years, args.repeat, args.samples, args.seed, args.root, args.keep)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
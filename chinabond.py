@@ -0,0 +1,105 @@
+"""
+中债信息网10年期国债到期收益率抓取.
+1. 只请求交易日: 日期序列取自tradecal本地交易日历,周末和节假日不再发送请求.
+2. 连接复用: 每个工作线程持有一个requests.Session,连接池保持长连接,失败请求和服务端错误由urllib3按指数退避重试.
+3. 有界并发: 调用方以fetch.fetch_all或journal.fetch_journaled执行,max_workers取CHINABOND_WORKERS.
+4. 原始响应缓存: 解析成功的响应以日期命名保存在CHINABOND_CACHE_PATH目录,重建curve表时直接读取缓存.
+NOTE:
+交易日历为上交所日历,银行间市场在调休周末开市的个别日期不再抓取,
+find_closest_row_in_curve_table按最接近日期取值,不受影响.
+"""
+import os
+import threading
+from io import StringIO
+from typing import List, TYPE_CHECKING
+import pandas as pd
+import datasource
+import telemetry
+import tradecal
+from path import CHINABOND_CACHE_PATH, CHINABOND_WORKERS, CHINABOND_RETRIES
+
+if TYPE_CHECKING:
+    import requests
+
+URL = "https://yield.chinabond.com.cn/cbweb-cbrc-web/cbrc/queryGjqxInfo"
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.4 Safari/605.1.15'}
+TIMEOUT = (5, 30)  # 连接和读取超时秒数
+
+_local = threading.local()  # 每个线程各自的Session
+
+def get_session() -> 'requests.Session':
+    """
+    获取当前线程的Session,第一次调用时创建并挂载带重试的连接池
+    :return: requests.Session
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        import requests  # 只在实际抓取时导入,导入data不加载requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(
+            total=CHINABOND_RETRIES, backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST'])
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CHINABOND_WORKERS, max_retries=retry)
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+def parse_yield(text: str) -> float:
+    """
+    从响应页面解析10年期国债到期收益率
+    :param text: 响应文本
+    :return: 10年期国债到期收益率,页面中没有数据时为0
+    """
+    try:
+        df_list = pd.read_html(io=StringIO(text))
+        return float(df_list[0].loc[0, '10年'])
+    except (KeyError, ValueError, IndexError):
+        return 0
+
+def query_yield_page(date_str: str) -> str:
+    """
+    请求指定日期的收益率页面
+    :param date_str: 日期字符串,例如: '2021-10-29'
+    :return: 响应文本
+    """
+    response = get_session().post(url=URL, data={'workTime': date_str, 'locale': 'cn_ZH'}, timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.text
+
+def fetch_yield(date_str: str, use_cache: bool = True) -> float:
+    """
+    获取指定日期10年期国债到期收益率,优先读取缓存
+    :param date_str: 日期字符串,例如: '2021-10-29'
+    :param use_cache: 是否读取和写入原始响应缓存
+    :return: 10年期国债到期收益率,没有数据时为0
+    """
+    cache_file = os.path.join(CHINABOND_CACHE_PATH, f"{date_str}.html")
+    if use_cache and os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return parse_yield(f.read())
+    text = datasource.call('chinabond', query_yield_page, date_str)
+    telemetry.count_response(text)
+    curve_value = parse_yield(text)
+    if use_cache and curve_value != 0:  # 当日数据尚未发布时不缓存,下次重新请求
+        if not os.path.exists(CHINABOND_CACHE_PATH):
+            os.makedirs(CHINABOND_CACHE_PATH, exist_ok=True)
+        with open(cache_file + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(cache_file + '.tmp', cache_file)
+    return curve_value
+
+def get_trade_date_strs(begin: str, end: str) -> List[str]:
+    """
+    获取期间内的交易日
+    :param begin: 开始日期, 例如: '2006-03-01'
+    :param end: 结束日期, 例如: '2024-06-30'
+    :return: 升序排列的日期字符串列表, 例如: ['2006-03-01', '2006-03-02', ...]
+    """
+    days = tradecal.get_trade_days(begin.replace('-', ''), end.replace('-', ''))
+    return [f"{day[0:4]}-{day[4:6]}-{day[6:8]}" for day in days]
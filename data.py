@@ -8,16 +8,25 @@ import os
 import time
 import datetime
 import sqlite3
-import requests
-from io import StringIO
 from functools import partial
-from typing import Dict, Literal
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal
 import pandas as pd
-import tushare as ts
 import tsswindustry as sw
-from path import (TRADE_RECORD_PATH, INDICATOR_ROE_FROM_1991, CURVE_SQLITE3, ROE_TABLE, 
-                CURVE_TABLE, INDEX_VALUE, TEST_CONDITION_SQLITE3, TEST_CONDITION_PATH)
+import fetch
+import generation
+import journal
+import roestore
+import chinabond
+import telemetry
+import tradecal
+from path import (TRADE_RECORD_PATH, INDICATOR_ROE_FROM_1991, CURVE_SQLITE3, ROE_TABLE,
+                ROE_STOCK_TABLE, ROE_STAGING_TABLE, CURVE_TABLE, INDEX_VALUE, TEST_CONDITION_SQLITE3, TEST_CONDITION_PATH,
+                CHINABOND_WORKERS, TRADE_UPDATE_MAX_DAYS, TRADE_UPDATE_CHUNK_DAYS, ensure_dirs)
+
+# daily_basic接口字段,trade record csv文件中的close以前复权收盘价替换
+DAILY_BASIC_FIELDS = ["ts_code", "trade_date", "close", "pe_ttm", "pb", "ps_ttm",
+    "dv_ratio", "dv_ttm", "turnover_rate", "turnover_rate_f", "volume_ratio",
+    "total_share", "float_share", "free_share", "total_mv", "circ_mv", "pe", "ps"]
 
 def get_IPO_date(code: str) -> str:
     """
@@ -27,7 +36,7 @@ def get_IPO_date(code: str) -> str:
     """
     ipo_data = "1991-01-01"
     full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-    pro = ts.pro_api()
+    pro = fetch.pro_api()
     df = pro.query(
         'stock_basic', exchange='', list_status='L', 
         fields='ts_code,symbol,name,area,industry,list_date'
@@ -47,13 +56,10 @@ def get_whole_trade_record_data(code: str) -> pd.DataFrame:
     :return: 股票历史交易记录文件
     """
     full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-    pro = ts.pro_api()
-    fields = ["ts_code", "trade_date", "close", "pe_ttm", "pb", "ps_ttm",
-        "dv_ratio", "dv_ttm", "turnover_rate", "turnover_rate_f", "volume_ratio",
-        "total_share", "float_share", "free_share", "total_mv", "circ_mv", "pe", "ps"]
-    result = pro.daily_basic(ts_code=full_code, fields=fields)
+    pro = fetch.pro_api()
+    result = pro.daily_basic(ts_code=full_code, fields=DAILY_BASIC_FIELDS)
     # qfq close replace close
-    df = ts.pro_bar(ts_code=full_code, adj='qfq')
+    df = fetch.pro_bar(ts_code=full_code, adj='qfq')
     df = df[['trade_date', 'close']]
     result = result.drop(columns='close')
     result = pd.merge(result, df, on='trade_date', how='left')
@@ -65,6 +71,49 @@ def get_whole_trade_record_data(code: str) -> pd.DataFrame:
     result = pd.merge(result, tmp, on='trade_date', how='left')
     return result
 
+def get_market_trade_record_by_date(trade_date: str, pro=None) -> pd.DataFrame:
+    """
+    使用tushare获取全市场某一交易日的交易记录,daily_basic daily adj_factor各调用一次
+    :param trade_date: 交易日, 例如: '20240603'
+    :param pro: Tushare pro接口,默认为fetch.pro_api(),也可以传入回放录制数据的替身对象
+    :return: 全市场交易记录,包括DAILY_BASIC_FIELDS pct_chg和adj_factor,close为未复权收盘价
+    """
+    pro = pro if pro is not None else fetch.pro_api()
+    result = pro.daily_basic(trade_date=trade_date, fields=DAILY_BASIC_FIELDS)
+    daily = pro.daily(trade_date=trade_date, fields='ts_code,trade_date,close,pct_chg')
+    adj = pro.adj_factor(trade_date=trade_date, fields='ts_code,trade_date,adj_factor')
+    daily = pd.merge(daily, adj, on=['ts_code', 'trade_date'], how='left')
+    result = result.drop(columns='close')
+    result = pd.merge(result, daily, on=['ts_code', 'trade_date'], how='left')
+    return result
+
+def get_ROE_report_periods() -> List[str]:
+    """
+    获取1991至上年度的年报报告期
+    :return: 升序排列的报告期列表, 例如: ['19911231', ..., '20231231']
+    NOTE:
+    当前月份是1-4月份,截至前年年报,5-12月份截至上年年报
+    """
+    last_year = time.localtime().tm_year-2 if time.localtime().tm_mon in [1, 2, 3, 4] \
+        else time.localtime().tm_year-1
+    return [f"{year}1231" for year in range(1991, last_year+1)]
+
+def get_ROE_indicators_by_period(period: str, pro=None) -> pd.Series:
+    """
+    使用tushare fina_indicator_vip接口获取全市场某一报告期的ROE
+    :param period: 报告期, 例如: '20231231'
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 以ts_code为索引的ROE序列
+    NOTE:
+    同一报告期有更正公告时接口返回多行,与get_ROE_indicators_from_Tushare一致取第一行
+    """
+    pro = pro if pro is not None else fetch.pro_api()
+    df = pro.fina_indicator_vip(period=period, fields='ts_code,end_date,roe')
+    if df is None or df.empty:
+        return pd.Series(dtype=float)
+    df = df.drop_duplicates(subset=['ts_code'], keep='first')
+    return df.set_index('ts_code')['roe']
+
 def get_ROE_indicators_from_Tushare(code: str) -> Dict:
     """
     获取公司1991至上年度年度ROE值,用于初始化indicator_roe_from_1991.sqlite3文件
@@ -73,15 +122,11 @@ def get_ROE_indicators_from_Tushare(code: str) -> Dict:
     NOTE:
     当前月份是1-4月份,获取前年年度ROE,5-12月份获取上年年度ROE
     """
-    start_year = '19911231'
-    year_field = str(time.localtime().tm_year-2) if time.localtime().tm_mon in [1, 2, 3, 4] \
-        else str(time.localtime().tm_year-1)
-    end_year = year_field + '1231'
-    periods = pd.date_range(start=start_year, end=end_year, freq='y').strftime("%Y%m%d")
+    periods = get_ROE_report_periods()
     full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
 
     result = {}  # 定义返回值
-    pro = ts.pro_api()
+    pro = fetch.pro_api()
     for period in periods:
         res = pro.fina_indicator(fields="roe", ts_code=full_code, period=period)
         if res is None:
@@ -99,22 +144,10 @@ def get_yield_data_from_china_bond(date_str: str) -> float:
     从chinabond中债信息网获取指定日期10年期国债到期收益率表格
     :param date_str: 日期字符串,例如: '2021-10-29'
     :return: 10年期国债到期收益率
+    NOTE:
+    复用线程内连接池和原始响应缓存,见chinabond模块.
     """
-    curve_value = 0
-    url = "https://yield.chinabond.com.cn/cbweb-cbrc-web/cbrc/queryGjqxInfo"
-    data = {
-        'workTime': date_str,
-        'locale': 'cn_ZH',
-    }
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.4 Safari/605.1.15'}   
-    time.sleep(0.05)
-    response = requests.post(url=url, headers=headers, data=data)
-    try:
-        df_list = pd.read_html(io=StringIO(response.text))
-        curve_value = float(df_list[0].loc[0, '10年'])
-    except KeyError:
-        ...
+    curve_value = chinabond.fetch_yield(date_str)
     print(f"{date_str} 10年期国债到期收益率为{curve_value}." + '\r', end='', flush=True)
     return curve_value
 
@@ -147,7 +180,7 @@ def check_stockcodes_integrity(
         if not os.path.exists(dest_dir):
             os.mkdir(dest_dir)
         trade_files = os.listdir(dest_dir)
-        trade_codes = [f.split('.')[0] for f in trade_files if f.endswith(".csv")]
+        trade_codes = {f.split('.')[0] for f in trade_files if f.endswith(".csv")}  # 集合查找
         dest_stocks = sw.get_stocks_of_specific_class(stock_class=stock_class)
         dest_codes = [item[0][0:6] for item in dest_stocks]
         diff_codes = [code for code in dest_codes if code not in trade_codes]
@@ -155,48 +188,132 @@ def check_stockcodes_integrity(
             result['trade_record_path'][stock_class] = diff_codes
     sw_stocks = sw.get_all_stocks()
     sw_codes = [item[0][0:6] for item in sw_stocks]  # 不含后缀的全部股票代码
-    con = sqlite3.connect(roe_sqlite)  # 获取roe_table数据表中的全部股票代码
+    con = roestore.connect(roe_sqlite)  # 获取roe_table数据表中的全部股票代码
     with con:
         sql = f""" SELECT stockcode FROM "{roe_table}" """
         df = pd.read_sql(sql, con)
         roe_codes = df['stockcode'].values.tolist()
         roe_codes = [code[0:6] for code in roe_codes]  # 不含后缀的全部股票代码
-    result['roe_table'] = [code for code in sw_codes if code not in roe_codes]
-    result['to_remove'] = [code for code in roe_codes if code not in sw_codes]
+    sw_set, roe_set = set(sw_codes), set(roe_codes)
+    result['roe_table'] = [code for code in sw_codes if code not in roe_set]
+    result['to_remove'] = [code for code in roe_codes if code not in sw_set]
     return result
 
-def create_curve_value_table(days: int):
+def create_curve_value_table(days: int, resume: bool = False):
     """
     创建10年期国债到期收益率插入curve表中,数据从2006-03-01开始.
+    只请求本地交易日历中的交易日,已缓存的原始响应不再下载.
     :param days: 从昨天起向前推days天数
+    :param resume: 是否继续上一次未完成的作业,跳过已完成的日期
     :return: None
+    NOTE:
+    每100个日期写入一次,作业日志记录每个日期的状态,中断后以resume=True继续.
     """
     yesterday = datetime.date.today() + datetime.timedelta(days=-1)
     begin = yesterday + datetime.timedelta(days=-days)
-    date_list = pd.date_range(begin, yesterday)
-    date_str = [str(date)[0:10] for date in date_list]  # 生成日期序列
-    with ThreadPoolExecutor() as pool:
-        value_list = pool.map(get_yield_data_from_china_bond, date_str)
-
+    date_str = chinabond.get_trade_date_strs(str(begin), str(yesterday))  # 只请求交易日
+    job_id = journal.start_job('create-curve', resume)
     con = sqlite3.connect(CURVE_SQLITE3)
     with con:
-        sql = f"""
-            CREATE TABLE IF NOT EXISTS '{CURVE_TABLE}' (
-            date1 TEXT PRIMARY KEY NOT NULL,
-            value1 REAL DEFAULT 0
-        )"""
-        con.executescript(sql)  # 创建curve表格
-
-        sql = f"""select * from '{CURVE_TABLE}' """
-        df = pd.read_sql_query(sql, con)
-        for date, value in zip(date_str, value_list):  # 在第一行插入日期和值，遇重复日期，略过
-            df.loc[-1] = [date, value]
-            df.index += 1
-            df = df.sort_index()
-
-        df = df[df['value1'] != 0]  # 去除value1为0的行
-        df.drop_duplicates(subset=['date1'], keep='last', inplace=True)
-        df.to_sql(name=CURVE_TABLE, con=con, index=False, if_exists='replace')
+        ensure_curve_table(con)
+    sql = f"""INSERT OR REPLACE INTO '{CURVE_TABLE}' (date1, value1) VALUES (?, ?)"""
+    rows = []
+    # 重试由chinabond的连接池完成
+    results = journal.fetch_journaled(job_id, chinabond.fetch_yield, date_str, max_workers=CHINABOND_WORKERS, retries=0)
+    for count, (date, value, error) in enumerate(results, start=1):
+        if error is None and value != 0:  # 去除value1为0的行
+            rows.append((date, value))
+            telemetry.count('rows_written')  # 计入该日期单元,稍后批量写入
+        if len(rows) >= 100:
+            with con:
+                con.executemany(sql, rows)
+            rows = []
+        print(f"{date} 10年期国债到期收益率为{value}, {count}/{len(date_str)}." + '\r', end='', flush=True)
+    with con:
+        con.executemany(sql, rows)
+    con.close()
+    journal.finish_job(job_id)
+
+def ensure_curve_table(con: sqlite3.Connection) -> None:
+    """
+    创建curve表格.旧版本以to_sql(if_exists='replace')重写的表格没有主键,
+    按date1去重后重建为以date1为主键的表格,使INSERT OR REPLACE按日期覆盖.
+    :param con: sqlite3.Connection
+    :return: None
+    """
+    sql = f"""
+        CREATE TABLE IF NOT EXISTS '{CURVE_TABLE}' (
+        date1 TEXT PRIMARY KEY NOT NULL,
+        value1 REAL DEFAULT 0
+    )"""
+    con.execute(sql)  # 创建curve表格
+    columns = {row[1]: row[5] for row in con.execute(f"PRAGMA table_info('{CURVE_TABLE}')")}
+    if columns.get('date1'):  # date1已是主键
+        return
+    con.execute(f"""ALTER TABLE '{CURVE_TABLE}' RENAME TO '{CURVE_TABLE}_old'""")
+    con.execute(sql)
+    sql = f"""
+        INSERT OR REPLACE INTO '{CURVE_TABLE}' (date1, value1)
+        SELECT date1, value1 FROM '{CURVE_TABLE}_old' WHERE value1 != 0 ORDER BY rowid DESC
+    """
+    con.execute(sql)  # 旧表中新日期在前,倒序插入使重复日期保留靠前的行
+    con.execute(f"""DROP TABLE '{CURVE_TABLE}_old'""")
+
+# 指数估值表字段,trade_date为主键
+INDEX_COLUMNS = ['ts_code', 'trade_date', 'pb', 'pe', 'pe_ttm', 'turnover_rate', 'turnover_rate_f',
+    'roe_est', 'pct_chg', 'close', 'vol', 'amount']
+
+def ensure_index_table(con: sqlite3.Connection, full_code: str) -> None:
+    """
+    创建以trade_date为主键的指数估值表格.旧版本以to_sql(if_exists='replace')重写的表格没有主键,
+    按trade_date去重后重建.
+    :param con: sqlite3.Connection
+    :param full_code: 指数代码, 例如: '000300.SH'
+    :return: None
+    """
+    sql = f"""
+        CREATE TABLE IF NOT EXISTS '{full_code}' (
+        ts_code TEXT NOT NULL,
+        trade_date TEXT PRIMARY KEY NOT NULL,
+        pb REAL DEFAULT 0,
+        pe REAL DEFAULT 0,
+        pe_ttm REAL DEFAULT 0,
+        turnover_rate REAL DEFAULT 0,
+        turnover_rate_f REAL DEFAULT 0,
+        roe_est REAL DEFAULT 0,
+        pct_chg REAL DEFAULT 0,
+        close REAL,
+        vol REAL,
+        amount REAL
+    ) WITHOUT ROWID"""
+    con.execute(sql)
+    columns = {row[1]: row[5] for row in con.execute(f"PRAGMA table_info('{full_code}')")}
+    if columns.get('trade_date'):  # trade_date已是主键
+        return
+    con.execute(f"""ALTER TABLE '{full_code}' RENAME TO '{full_code}_old'""")
+    con.execute(sql)
+    common = ', '.join(column for column in INDEX_COLUMNS if column in columns)
+    sql = f"""
+        INSERT OR REPLACE INTO '{full_code}' ({common})
+        SELECT {common} FROM '{full_code}_old' ORDER BY rowid DESC
+    """
+    con.execute(sql)  # 旧表中新数据在前,倒序插入使重复日期保留靠前的行
+    con.execute(f"""DROP TABLE '{full_code}_old'""")
+
+def upsert_index_rows(con: sqlite3.Connection, full_code: str, df: pd.DataFrame) -> None:
+    """
+    按trade_date批量写入指数估值数据,已存在的日期被覆盖
+    :param con: sqlite3.Connection
+    :param full_code: 指数代码, 例如: '000300.SH'
+    :param df: 指数估值数据,字段为INDEX_COLUMNS的子集
+    :return: None
+    """
+    columns = [column for column in INDEX_COLUMNS if column in df.columns]
+    df = df[columns].astype(object).where(df[columns].notna(), None)
+    marks = ', '.join(['?'] * len(columns))
+    sql = f"""INSERT OR REPLACE INTO '{full_code}' ({', '.join(columns)}) VALUES ({marks})"""
+    con.executemany(sql, df.itertuples(index=False, name=None))
+    telemetry.count('rows_written', len(df))
 
 def create_index_indicator_table(index: Literal["000300", "399006", "000905"] = "000300"):
     """
@@ -212,62 +329,46 @@ def create_index_indicator_table(index: Literal["000300", "399006", "000905"] =
     if index not in ['000300', '000905', '399006']:
         raise ValueError('请检查指数代码是否正确[000300, 000905, 399006]')
     full_code = index + '.SH' if index.startswith('000') else index + '.SZ'
+    # 每次下载3000条数据
+    pro = fetch.pro_api()
+    df_list = []
+    today = pd.Timestamp.today()
+    for i in range(100):
+        if i == 0:
+            start_date = (today - pd.Timedelta(days=3000)).strftime("%Y%m%d")
+            end_date = today.strftime("%Y%m%d")
+        else:
+            start_date = (today - pd.Timedelta(days=3000*(i+1))).strftime("%Y%m%d")
+            end_date = (today - pd.Timedelta(days=3000*i)).strftime("%Y%m%d")
+        df = pro.index_dailybasic(
+            **{"ts_code": full_code,"start_date": start_date, "end_date": end_date,},
+            fields='ts_code,trade_date,pb,pe,pe_ttm,turnover_rate,turnover_rate_f'
+        )
+        if not df.empty:
+            df_list.append(df)
+        else:
+            break
+    df = pd.concat(df_list)
+    df = df.sort_values(by='trade_date', ascending=False)
+    try:
+        df['roe_est'] = (df['pb'] / df['pe']).apply(lambda x: round(x, 4))  # 保留四位小数
+    except ZeroDivisionError:
+        df['roe_est'] = 0.0000
+    df_1 = pro.index_daily(
+        ts_code=full_code, fields="trade_date, pct_chg, close, vol, amount"
+    )
+    df_1 = df_1.sort_values(by='trade_date', ascending=False)
+    df = df.set_index('trade_date')
+    df_1 = df_1.set_index('trade_date')
+    df = df.join(df_1, how='inner')
+    df.reset_index(inplace=True)
+    df = df.sort_values(by='trade_date', ascending=False)
     con = sqlite3.connect(INDEX_VALUE)
     with con:
-        sql = f"""
-            DROP TABLE IF EXISTS '{full_code}'
-        """
-        con.executescript(sql)  # 首先删除表格清空
-
-        sql = f"""
-            CREATE TABLE IF NOT EXISTS '{full_code}' (
-            ts_code TEXT NOT NULL,
-            trade_date TEXT NOT NULL,
-            pb REAL DEFAULT 0,
-            pe REAL DEFAULT 0,
-            pe_ttm REAL DEFAULT 0,
-            turnover_rate REAL DEFAULT 0,
-            turnover_rate_f REAL DEFAULT 0,
-            roe_est REAL DEFAULT 0,
-            pct_chg REAL DEFAULT 0
-        )"""
-        con.executescript(sql)  # 创建表格
-        # 每次下载3000条数据
-        pro = ts.pro_api()
-        df_list = []
-        today = pd.Timestamp.today()
-        for i in range(100):
-            if i == 0:
-                start_date = (today - pd.Timedelta(days=3000)).strftime("%Y%m%d")
-                end_date = today.strftime("%Y%m%d")
-            else:
-                start_date = (today - pd.Timedelta(days=3000*(i+1))).strftime("%Y%m%d")
-                end_date = (today - pd.Timedelta(days=3000*i)).strftime("%Y%m%d")
-            df = pro.index_dailybasic(
-                **{"ts_code": full_code,"start_date": start_date, "end_date": end_date,},
-                fields='ts_code,trade_date,pb,pe,pe_ttm,turnover_rate,turnover_rate_f'
-            )
-            if not df.empty:
-                df_list.append(df)
-            else:
-                break
-            time.sleep(1)
-        df = pd.concat(df_list)
-        df = df.sort_values(by='trade_date', ascending=False)
-        try:
-            df['roe_est'] = (df['pb'] / df['pe']).apply(lambda x: round(x, 4))  # 保留四位小数
-        except ZeroDivisionError:
-            df['roe_est'] = 0.0000
-        df_1 = pro.index_daily(
-            ts_code=full_code, fields="trade_date, pct_chg, close, vol, amount"
-        )
-        df_1 = df_1.sort_values(by='trade_date', ascending=False)
-        df = df.set_index('trade_date')
-        df_1 = df_1.set_index('trade_date')
-        df = df.join(df_1, how='inner')
-        df.reset_index(inplace=True)
-        df = df.sort_values(by='trade_date', ascending=False)
-        df.to_sql(name=full_code, con=con, index=False, if_exists='replace')
+        con.execute(f"""DROP TABLE IF EXISTS '{full_code}'""")  # 首先删除表格清空
+        ensure_index_table(con, full_code)  # 创建表格
+        upsert_index_rows(con, full_code, df)
+    con.close()
 
 def create_trade_record_csv_table(code: str, rm_empty_rows: bool = False) -> None:
     """
@@ -289,7 +390,7 @@ def create_trade_record_csv_table(code: str, rm_empty_rows: bool = False) -> Non
         os.mkdir(dest_path)
     file_name = code + '.csv'
     file_path = os.path.join(TRADE_RECORD_PATH, swindustry, file_name)
-    df.to_csv(file_path, index=False)
+    generation.replace_csv(df, file_path)  # 已发布版本中的硬链接不受影响
     print(f'{code}历史交易记录文件下载成功,保存在{swindustry}目录下.'+ ' '*50 + '\r', end=" ", flush=True)
 
 def create_specific_class_trade_record_csv_table(stock_class: str, rm_empty_rows: bool = False):
@@ -301,8 +402,7 @@ def create_specific_class_trade_record_csv_table(stock_class: str, rm_empty_rows
     """
     stocks = [item[0][0:6] for item in sw.get_stocks_of_specific_class(stock_class=stock_class)]
     part_func = partial(create_trade_record_csv_table, rm_empty_rows=rm_empty_rows)
-    with ThreadPoolExecutor() as pool:
-        pool.map(part_func, stocks)
+    fetch.run_fetch(part_func, stocks)
 
 def create_all_stocks_trade_record_csv_table(rm_empty_rows: bool = False):
     """
@@ -312,8 +412,7 @@ def create_all_stocks_trade_record_csv_table(rm_empty_rows: bool = False):
     """
     stocks = [item[0][0:6] for item in sw.get_all_stocks()]
     part_func = partial(create_trade_record_csv_table, rm_empty_rows=rm_empty_rows)
-    with ThreadPoolExecutor() as pool:
-        pool.map(part_func, stocks)
+    fetch.run_fetch(part_func, stocks)
 
 def create_ROE_indicators_table_from_1991(code: str):
     """ 
@@ -322,34 +421,63 @@ def create_ROE_indicators_table_from_1991(code: str):
     :return: None
     """
     roe_dict = get_ROE_indicators_from_Tushare(code=code)  # 使用tushare接口
-    roe_dict = dict(sorted(roe_dict.items(), key=lambda x: x[0], reverse=True))  # 按照键降序排序
-    con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
+    full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
+    tmp = sw.get_name_and_class_by_code(code=code)
+    con = roestore.connect()
     with con:
-        full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-        fields = list(roe_dict.keys())
-
-        sql = f"""CREATE TABLE IF NOT EXISTS '{ROE_TABLE}' (""" +  "\n" + \
-        "stockcode TEXT PRIMARY KEY," + "\n" + "stockname TEXT," + "\n" + "stockclass TEXT," + "\n" 
-        for index, item in enumerate(fields):
-            if index == len(fields) - 1:  
-                sql += f"Y{item[0:4]} REAL" + "\n"
-            else:  
-                sql += f"Y{item[0:4]} REAL," + "\n"
-        sql += ")"
-        con.execute(sql)  # 创建表
-
-        tmp = sw.get_name_and_class_by_code(code=code)
-        insert_value =[full_code] + tmp + list(roe_dict.values())
-        sql = f"""INSERT OR IGNORE INTO '{ROE_TABLE}' VALUES (""" + "\n" 
-        for index, item in enumerate(insert_value):
-            if index == len(insert_value) - 1:
-                sql += "?" + "\n"
-            else:
-                sql += "?," + "\n"
-        sql += ")"
-        con.execute(sql, insert_value)  # 插入数据
+        roestore.upsert_stocks(con, [(full_code, tmp[0], tmp[1])])
+        roestore.upsert_roe(con, [
+            (full_code, int(period[0:4]), value) for period, value in roe_dict.items() if value is not None
+        ])
+        roestore.refresh_wide_table(con, [full_code])  # 出现新年度时整表重建
+    con.close()
     print(f"{full_code}历史ROE数据下载成功." + '\r', end='', flush=True)
 
+def create_ROE_indicators_table_by_period(codes: List[str] = None, pro=None, resume: bool = False) -> None:
+    """
+    按报告期批量创建indicator_roe_from_1991.sqlite3中的ROE表.
+    每个年报报告期调用一次fina_indicator_vip获取全市场ROE,每个报告期在一个事务中写入暂存表,
+    接口调用次数由每只股票约33次降为每个报告期一次.
+    :param codes: 股票代码列表,默认为申万行业全部股票
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :param resume: 是否继续上一次未完成的作业,跳过已写入的报告期
+    :return: None
+    NOTE:
+    新作业先清空暂存表.全部报告期成功后在一个事务中以暂存表替换长表和股票清单并重建宽表,
+    任一报告期重试后仍然失败时正在使用的ROE数据保持原样并抛出异常,
+    以resume=True重新运行只获取失败和未完成的报告期,已写入暂存表的报告期保留.
+    """
+    codes = codes if codes is not None else [item[0][0:6] for item in sw.get_all_stocks()]
+    periods = get_ROE_report_periods()
+    full_codes = [code + '.SH' if code.startswith('6') else code + '.SZ' for code in codes]
+    selected = set(full_codes)
+    job_id = journal.start_job('create-roe-table', resume)
+    done = journal.done_units(job_id)
+    con = roestore.connect()
+    if not done:  # 新作业
+        with con:
+            roestore.clear_staging(con)
+    failed = []
+    func = partial(get_ROE_indicators_by_period, pro=pro)
+    for period, roe, error in journal.fetch_journaled(job_id, func, periods):
+        if error is not None:
+            failed.append(period)
+            continue
+        with con:
+            roestore.upsert_roe(con, [
+                (ts_code, int(period[0:4]), float(value)) for ts_code, value in roe.dropna().items() if ts_code in selected
+            ], table=ROE_STAGING_TABLE)
+    if not failed and 'replace' not in done:  # 中断在替换之后时,不再以已清空的暂存表替换
+        stocks = [(full_code, *sw.get_name_and_class_by_code(code=code)) for code, full_code in zip(codes, full_codes)]
+        with con:
+            roestore.replace_from_staging(con, stocks)
+        journal.record_unit(job_id, 'replace')
+    con.close()
+    journal.finish_job(job_id)
+    if failed:
+        raise RuntimeError(f'以下报告期ROE数据获取失败: {sorted(failed)}')
+    print(f"{len(selected)}只股票{len(periods)}个报告期ROE数据创建成功." + ' '*20 + '\r', end='', flush=True)
+
 def invert_trade_record_to_win_stock_format(code: str, des_root_path: str):
     """
     将股票历史交易记录文件转换为WinStock格式,保存在des_path目录下.
@@ -396,37 +524,47 @@ def update_ROE_indicators_table_from_1991(code: str):
     else:
         last_filed = 'Y'+str(today.year-1)
 
-    # 获取表字段中最新的时间
-    con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
-    with con:
-        sql = f""" SELECT * FROM '{ROE_TABLE}' """
-        df = pd.read_sql_query(sql, con)
-
-        # 如果表中未包含最近一期的年度数据,则插入新列
-        contain_last_report = False if (last_filed not in df.columns) else True
-        if not contain_last_report:
-            df.insert(loc=3, column=last_filed, value=0.00)  # 在第四列插入
-            df.to_sql(name=ROE_TABLE, con=con, if_exists='replace', index=False)
-
-        # 使用Tushare下载最新ROE数据
-        full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-        period = last_filed[1:5] + '1231'
-        pro = ts.pro_api()
-        tmp = pro.fina_indicator(ts_code=full_code, period=period, fields='roe')
-        if tmp is None:
+    # 使用Tushare下载最新ROE数据
+    full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
+    period = last_filed[1:5] + '1231'
+    pro = fetch.pro_api()
+    tmp = pro.fina_indicator(ts_code=full_code, period=period, fields='roe')
+    if tmp is None:
+        last_roe = 0.00
+    elif isinstance(tmp, pd.DataFrame):
+        if tmp.empty:
             last_roe = 0.00
-        elif isinstance(tmp, pd.DataFrame):
-            if tmp.empty:
-                last_roe = 0.00
-            else:
-                last_roe = tmp.loc[0, 'roe']
-        sql = f""" UPDATE '{ROE_TABLE}' SET {last_filed}=? WHERE stockcode=? """
-        try:
-            con.execute(sql, (last_roe, full_code))
-        except sqlite3.IntegrityError:
-            ...
+        else:
+            last_roe = tmp.loc[0, 'roe']
+    con = roestore.connect()
+    with con:
+        roestore.upsert_roe(con, [(full_code, int(last_filed[1:5]), last_roe)])
+        roestore.refresh_wide_table(con, [full_code])  # 表中未包含最近一期的年度数据时整表重建
+    con.close()
     print(f"{full_code} {last_filed} ROE数据更新成功." + " "*20 + '\r', end='', flush=True)
 
+def update_ROE_indicators_table_by_period(pro=None) -> int:
+    """
+    按报告期批量更新最新的年度ROE至INDICATOR_ROE_FROM_1991数据库.
+    调用一次fina_indicator_vip获取全市场最新年报ROE,在一个事务中批量更新.
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 写入长表的股票数量,不含ROE为空值或不在股票清单中的股票
+    NOTE:
+    1-4月份更新至前两年的年度ROE,5-12月份更新至前一年的年度ROE.
+    只批量upsert长表中最新年度的数据并刷新宽表中这些股票的行,新年度出现时整表重建宽表.
+    """
+    last_year = int(get_ROE_report_periods()[-1][0:4])
+    roe = get_ROE_indicators_by_period(f'{last_year}1231', pro=pro)
+    con = roestore.connect()
+    with con:
+        stockcodes = {row[0] for row in con.execute(f"""SELECT stockcode FROM '{ROE_STOCK_TABLE}'""")}
+        rows = [(ts_code, last_year, float(value)) for ts_code, value in roe.dropna().items() if ts_code in stockcodes]
+        roestore.upsert_roe(con, rows)
+        roestore.refresh_wide_table(con, [row[0] for row in rows])
+    con.close()
+    print(f"Y{last_year} ROE数据更新成功,共{len(rows)}只股票." + " "*20 + '\r', end='', flush=True)
+    return len(rows)
+
 def update_trade_record_csv(code: str):
     """
     更新股票历史交易记录文件至今日最新数据.
@@ -446,13 +584,12 @@ def update_trade_record_csv(code: str):
     end_date = time.strftime('%Y%m%d', time.localtime(time.time()))
     # 获取数据
     full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-    pro = ts.pro_api()
-    fields = ["ts_code", "trade_date", "close", "pe_ttm", "pb", "ps_ttm",
-    "dv_ratio", "dv_ttm", "turnover_rate", "turnover_rate_f", "volume_ratio",
-    "total_share", "float_share", "free_share", "total_mv", "circ_mv", "pe", "ps"]
-    df1 = pro.daily_basic(ts_code=full_code, start_date=start_date, end_date=end_date, fields=fields)
+    pro = fetch.pro_api()
+    df1 = pro.daily_basic(
+        ts_code=full_code, start_date=start_date, end_date=end_date, fields=DAILY_BASIC_FIELDS
+    )
     # qfq close replace close
-    df2 = ts.pro_bar(ts_code=full_code, adj='qfq', start_date=start_date, end_date=end_date)
+    df2 = fetch.pro_bar(ts_code=full_code, adj='qfq', start_date=start_date, end_date=end_date)
     df2 = df2[['trade_date', 'close']]
     df1 = df1.drop(columns='close')
     df1 = pd.merge(df1, df2, on='trade_date', how='left')
@@ -472,9 +609,136 @@ def update_trade_record_csv(code: str):
     df_old.fillna(0, inplace=True)  # 填充空值
     df_new = pd.concat([df1, df_old], axis=0)  # 数据合并
     df_new['trade_date'] = df_new['trade_date'].astype('object')
-    df_new.to_csv(csv_file, index=False)  # 保存文件
+    generation.replace_csv(df_new, csv_file)  # 保存文件
     print(f"{full_code}历史交易记录文件更新成功." + " "*20 + '\r', end='', flush=True)
 
+def update_trade_record_csv_by_date(codes: List[str] = None, end_date: str = None, pro=None) -> int:
+    """
+    按交易日批量更新股票历史交易记录文件至今日最新数据.
+    每个缺失的交易日调用一次daily_basic daily adj_factor获取全市场数据,再按股票拆分追加到csv文件,
+    接口调用次数由每只股票三次降为每个交易日三次.
+    :param codes: 股票代码列表,默认为申万行业全部股票
+    :param end_date: 更新截止日期, 例如: '20240603',默认为今日
+    :param pro: Tushare pro接口,默认为fetch.pro_api(),也可以传入回放录制数据的替身对象
+    :return: 更新的股票数量
+    NOTE:
+    csv文件不存在的股票仍然调用create_trade_record_csv_table逐只创建.
+    获取区间只由最近TRADE_UPDATE_MAX_DAYS个交易日内有数据的股票决定,停牌 退市等原因更落后的股票不拉长区间:
+    区间内有交易数据的(已复牌)以update_trade_record_csv逐只补齐,其余跳过.
+    区间按TRADE_UPDATE_CHUNK_DAYS个交易日分段获取和写入,内存中只保留一段的数据.
+    前复权收盘价 = 收盘价 * 当日复权因子 / 本段最新复权因子,区间不超过一段时与pro_bar(adj='qfq')按更新区间复权的结果一致.
+    某个交易日重试后仍然失败时,只写入该交易日之前的数据,避免交易记录中间缺失.
+    每个交易日的获取状态和耗时记录在作业日志中,每段写入csv文件记为单元write-该段第一个交易日.
+    """
+    codes = codes if codes is not None else [item[0][0:6] for item in sw.get_all_stocks()]
+    end_date = end_date if end_date is not None else time.strftime('%Y%m%d', time.localtime(time.time()))
+    last_dates = {}
+    missing = []
+    for code in codes:
+        csv_file = os.path.join(TRADE_RECORD_PATH, sw.get_name_and_class_by_code(code=code)[1], code+'.csv')
+        if not os.path.exists(csv_file):
+            missing.append(code)
+            continue
+        head = pd.read_csv(csv_file, dtype={'trade_date': str}, usecols=['trade_date'], nrows=1)
+        if head.empty:
+            missing.append(code)
+            continue
+        last_dates[code] = head.loc[0, 'trade_date']
+    if missing:
+        fetch.run_fetch(create_trade_record_csv_table, missing, '正在创建trade-record csv文件')
+    if not last_dates:
+        return 0
+
+    # 最近TRADE_UPDATE_MAX_DAYS个交易日之前的最新日期视为停牌或退市,不参与决定获取区间
+    recent = tradecal.get_trade_days(tradecal.CALENDAR_BEGIN, end_date, pro=pro)[-TRADE_UPDATE_MAX_DAYS-1:]
+    if not recent:
+        return 0
+    current = {code: date for code, date in last_dates.items() if date >= recent[0]}
+    lagging = set(last_dates) - set(current)
+    start_date = min(current.values()) if current else recent[0]
+    trade_dates = [date for date in recent if date > start_date]
+    resumed = set()  # 获取区间内有交易数据的落后股票
+    updated = set()
+    failed = []
+    job_id = journal.start_job('update-trade-csv')
+    func = partial(get_market_trade_record_by_date, pro=pro)
+    for i in range(0, len(trade_dates), TRADE_UPDATE_CHUNK_DAYS):
+        chunk = trade_dates[i:i+TRADE_UPDATE_CHUNK_DAYS]
+        frames = {}
+        for trade_date, df, error in journal.fetch_journaled(job_id, func, chunk):
+            if error is not None:
+                failed.append(trade_date)
+            elif not df.empty:
+                frames[trade_date] = df
+                resumed.update(code for code in df['ts_code'].str[0:6] if code in lagging)
+        if failed:
+            print(f"{min(failed)}等{len(failed)}个交易日数据获取失败,只更新至该日之前." + ' '*20)
+            frames = {date: df for date, df in frames.items() if date < min(failed)}
+        start = time.monotonic()
+        write_error = None
+        with telemetry.collect() as written:
+            try:
+                updated.update(write_market_trade_records(frames, current))
+            except Exception as error:
+                write_error = error
+        journal.record_unit(job_id, f'write-{chunk[0]}', write_error, time.monotonic() - start, counters=written)
+        if write_error is not None:
+            journal.finish_job(job_id)
+            raise write_error
+        if failed:
+            break
+    journal.finish_job(job_id)
+    if resumed:
+        print(f"{len(resumed)}只股票最新日期早于最近{TRADE_UPDATE_MAX_DAYS}个交易日且已复牌,逐只补齐." + ' '*20)
+        failed_codes = fetch.run_fetch(update_trade_record_csv, sorted(resumed), '正在补齐复牌股票')
+        updated.update(resumed - set(failed_codes))
+    if len(lagging) > len(resumed):
+        print(f"{len(lagging) - len(resumed)}只股票停牌或退市,跳过." + ' '*20)
+    if not updated:
+        print("无可更新数据." + ' '*20 + '\r', end='', flush=True)
+        return 0
+    print(f"{len(trade_dates)}个交易日 {len(updated)}只股票历史交易记录文件更新成功." + " "*20 + '\r', end='', flush=True)
+    return len(updated)
+
+def write_market_trade_records(frames: Dict[str, pd.DataFrame], last_dates: Dict[str, str]) -> List[str]:
+    """
+    将按交易日获取的全市场数据前复权后追加到各股票的历史交易记录文件
+    :param frames: {交易日: get_market_trade_record_by_date返回值}
+    :param last_dates: {股票代码: csv文件中最新的交易日},只写入其中的股票
+    :return: 更新的股票代码列表
+    """
+    if not frames:
+        return []
+
+    market = pd.concat(frames.values(), ignore_index=True)
+    market['code'] = market['ts_code'].str[0:6]
+    market = market[market['code'].isin(last_dates.keys())]
+    market = market.sort_values(by='trade_date', ascending=False)
+    # 以本次更新期间最新复权因子前复权
+    latest_adj = market.groupby('ts_code')['adj_factor'].transform('first')
+    qfq_close = (market['close'] * market['adj_factor'] / latest_adj).round(2)
+    market['close'] = qfq_close.fillna(market['close'])
+
+    updated = []
+    for code, df1 in market.groupby('code'):
+        df1 = df1[df1['trade_date'] > last_dates[code]]
+        if df1.empty:
+            continue
+        tmp = sw.get_name_and_class_by_code(code=code)  # 插入公司简称和行业分类
+        csv_file = os.path.join(TRADE_RECORD_PATH, tmp[1], code+'.csv')
+        df_old = pd.read_csv(csv_file, dtype={'trade_date': str})
+        df1 = df1.drop(columns=['code', 'adj_factor'])
+        df1.insert(2, 'company', tmp[0])
+        df1.insert(3, 'industry', tmp[1])
+        df1 = df1.reindex(columns=df_old.columns)
+        df1.fillna(0, inplace=True)  # 填充空值
+        df_old.fillna(0, inplace=True)  # 填充空值
+        df_new = pd.concat([df1, df_old], axis=0)  # 数据合并
+        df_new['trade_date'] = df_new['trade_date'].astype('object')
+        generation.replace_csv(df_new, csv_file)  # 保存文件
+        updated.append(code)
+    return updated
+
 def update_index_indicator_table(index: Literal["000300", "399006", "000905"] = "000300"):
     """ 
     更新指数估值数据库,用以计算指数MOS
@@ -485,13 +749,12 @@ def update_index_indicator_table(index: Literal["000300", "399006", "000905"] =
     指标包括ts_code,trade_date,pb,pe,turnover_rate,pe_ttm,turnover_rate_f,pct_chg,close,vol,amount
     """
     full_code = index + '.SH' if index.startswith('000') else index + '.SZ'
-    pro = ts.pro_api()
+    pro = fetch.pro_api()
     con = sqlite3.connect(INDEX_VALUE)
     with con:
-        sql = f""" SELECT * FROM '{full_code}' """
-        df = pd.read_sql_query(sql, con)
-        df['trade_date'] = df['trade_date'].astype('object')
-        last_date = df['trade_date'][0]
+        ensure_index_table(con, full_code)
+        sql = f""" SELECT MAX(trade_date) FROM '{full_code}' """
+        last_date = con.execute(sql).fetchone()[0]
         today = pd.Timestamp.today().strftime("%Y%m%d")
         # 获取增量数据
         df1 = pro.index_dailybasic(
@@ -512,11 +775,9 @@ def update_index_indicator_table(index: Literal["000300", "399006", "000905"] =
         df2 = df2.set_index('trade_date')
         df1 = df1.join(df2, how='inner')
         df1.reset_index(inplace=True)
-        df1 = df1.sort_values(by='trade_date', ascending=False)
-        # 数据合并
-        df = pd.concat([df1, df], axis=0)
-        df = df.drop_duplicates(subset=['trade_date'], keep='first')
-        df.to_sql(name=full_code, con=con, index=False, if_exists='replace')
+        # 只写入新增的交易日,last_date当日的数据被覆盖
+        upsert_index_rows(con, full_code, df1)
+    con.close()
     print(f"{full_code}指数估值数据库更新成功." + ' '*20 + '\r', end='', flush=True)
 
 def update_curve_value_table():
@@ -538,7 +799,14 @@ def update_curve_value_table():
     print(f"国债收率表更新成功." + ' '*20 + '\r', end='', flush=True)
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='数据初始化和更新')
+    parser.add_argument('--resume', action='store_true', help='继续上一次未完成的批量创建作业,跳过已完成的单元,重试失败的单元')
+    args = parser.parse_args()
+    ensure_dirs()
     stocks = [item[0][0:6] for item in sw.get_all_stocks()]
+    PUBLISH_AFTER = {'CREATE-TRADE-CSV', 'CREATE-CURVE', 'CREATE-ROE-TABLE', 'UPDATE-TRADE-CSV', 'UPDATE-CURVE',
+                     'UPDATE-ROE-TABLE', 'CREATE-INDEX-VALUE', 'UPDATE-INDEX-VALUE', 'CHECK-INTEGRITY'}
     while True:
         print('-------------------------操作提示-------------------------')
         print('Create-Trade-CSV      Create-Curve       Create-Roe-Table')
@@ -551,34 +819,25 @@ if __name__ == '__main__':
             break
         elif msg.upper() == 'CREATE-TRADE-CSV':
             print('正在创建trade-record csv文件,请稍等...\r', end='', flush=True)
-            for index in range(0, len(stocks), 20):
-                codes = stocks[index:index+20]
-                with ThreadPoolExecutor() as pool:
-                    pool.map(create_trade_record_csv_table, codes)
-                time.sleep(1.5)
+            from backfill import run_backfill
+            empty = run_backfill(codes=stocks, resume=args.resume)
             print('trade record csv文件创建成功.'+ ' '*50)
+            if empty:
+                print(f'以下股票代码没有交易记录: {empty}')
         elif msg.upper() == 'CREATE-CURVE':
             print('正在创建curve表格,请稍等...\r', end='', flush=True)
             begin = datetime.date(2006, 3, 1)
             yesterday = datetime.date.today() + datetime.timedelta(days=-1)
             days = (yesterday - begin).days
-            create_curve_value_table(days=days)
+            create_curve_value_table(days=days, resume=args.resume)
             print('curve表格创建成功.'+ ' '*50)
         elif msg.upper() == 'CREATE-ROE-TABLE':
             print('正在创建indicators表格,请稍等...\r', end='', flush=True)
-            for index in range(0, len(stocks), 20):
-                codes = stocks[index:index+20]
-                with ThreadPoolExecutor() as pool:
-                    pool.map(create_ROE_indicators_table_from_1991, codes)
-                time.sleep(1.5)
+            create_ROE_indicators_table_by_period(stocks, resume=args.resume)
             print('indicators表格创建成功.'+ ' '*50)
         elif msg.upper() == 'UPDATE-TRADE-CSV':
             print('正在更新trade-record csv文件,请稍等...\r', end='', flush=True)
-            for index in range(0, len(stocks), 20):
-                codes = stocks[index:index+20]
-                with ThreadPoolExecutor() as pool:
-                    pool.map(update_trade_record_csv, codes)
-                time.sleep(1.5)
+            update_trade_record_csv_by_date(stocks)
             print('trade record csv文件更新成功.'+ ' '*50)
         elif msg.upper() == 'UPDATE-CURVE':
             print('正在更新curve表格,请稍等...\r', end='', flush=True)
@@ -586,19 +845,7 @@ if __name__ == '__main__':
             print('curve表格更新成功.'+ ' '*50)
         elif msg.upper() == 'UPDATE-ROE-TABLE':
             print('正在更新indicators表格,请稍等...\r', end='', flush=True)
-            con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
-            with con:
-                sql = f""" SELECT * FROM '{ROE_TABLE}' """
-                df = pd.read_sql_query(sql, con)
-                df = df[df.columns[:4]]  # 只取前四列
-                df = df[df.iloc[:, 3].isnull()]  # 取出最新年度ROE字段为空的股票代码
-                null_stocks = df['stockcode'].values.tolist()
-                null_stocks = [code[0:6] for code in null_stocks]
-            for index in range(0, len(null_stocks), 20):
-                null_codes = null_stocks[index:index+20]
-                with ThreadPoolExecutor() as pool:
-                    pool.map(update_ROE_indicators_table_from_1991, null_codes)
-                time.sleep(1.5)
+            update_ROE_indicators_table_by_period()
             print('indicators表格更新成功.'+ ' '*50)
         elif msg.upper() == 'CREATE-INDEX-VALUE':
             print('正在创建指数估值数据库,请稍等...\r', end='', flush=True)
@@ -646,28 +893,31 @@ if __name__ == '__main__':
                 print("indicator_roe_from_1991.sqlite3文件中缺失的股票代码:")
                 print(res["roe_table"])
                 print("开始补齐缺失的数据...")
-                with ThreadPoolExecutor() as pool:
-                    pool.map(create_ROE_indicators_table_from_1991, res["roe_table"])
+                journal.run_journaled('repair-roe-table', create_ROE_indicators_table_from_1991, res["roe_table"])
                 print("indicator_roe_from_1991.sqlite3文件中缺失的数据已补齐."+" "*50)
             if res["trade_record_path"]:
                 print("TRADE_RECORD_PATH目录中缺失的股票交易信息代码:")
                 print(res["trade_record_path"])
                 print("开始补齐缺失的交易信息文件...")
-                diff_codes = res["trade_record_path"].values()
-                for codes in diff_codes:
-                    with ThreadPoolExecutor() as pool:
-                        pool.map(create_trade_record_csv_table, codes)
+                diff_codes = [code for codes in res["trade_record_path"].values() for code in codes]
+                journal.run_journaled('repair-trade-csv', create_trade_record_csv_table, diff_codes)
                 print("TRADE_RECORD_PATH目录中缺失的交易信息文件已补齐."+" "*50)
             if res["to_remove"]:
                 print("indicator_roe_from_1991.sqlite3文件中多余的股票代码:")
                 print(res["to_remove"])
                 print("开始删除ROE_TABLE中非申万行业的股票清单...")
-                con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
+                con = roestore.connect()
                 with con:
-                    for code in res["to_remove"]:
-                        code = code + '.SH' if code.startswith('6') else code + '.SZ'
-                        sql = f""" DELETE FROM '{ROE_TABLE}' WHERE stockcode=? """
-                        con.execute(sql, (code,))
+                    stockcodes = [code + '.SH' if code.startswith('6') else code + '.SZ' for code in res["to_remove"]]
+                    roestore.delete_stocks(con, stockcodes)
+                    roestore.refresh_wide_table(con, stockcodes)
+                con.close()
                 print("ROE_TABLE中多余的股票代码已删除."+" "*50)
+            from integrity import scan, write_report, print_summary
+            report = scan()  # 校验交易记录文件内容
+            write_report(report)
+            print_summary(report)
         else:
             continue
+        if msg.upper() in PUBLISH_AFTER:  # 数据集已更新,发布新版本供回测读取
+            print(f'数据集版本{generation.publish()}已发布.' + ' '*50)
@@ -0,0 +1,140 @@
+"""
+可替换的数据源层,在Tushare和中债信息网的真实接口与本地录制数据之间切换.
+模式由环境变量QUANT_DATASOURCE选择,也可以调用configure()修改:
+live: 直接调用真实接口(默认)
+record: 调用真实接口,并把每次调用的返回值保存到DATASOURCE_PATH目录
+replay: 不访问网络,从DATASOURCE_PATH目录读取录制的返回值,可以附加模拟延迟和限流错误
+用法:
+    QUANT_DATASOURCE=record python data.py  # 联网录制一次
+    QUANT_DATASOURCE=replay QUANT_DATASOURCE_LATENCY=0.2 python data.py  # 离线重放
+NOTE:
+录制文件以接口名称和调用参数的哈希命名,重放时调用参数必须与录制时一致,没有录制的调用抛出ReplayMissError.
+fetch.pro_api() fetch.pro_bar() tsswindustry和chinabond都经过本模块,限流器仍然生效,重放时的吞吐量与真实配额可比.
+"""
+import os
+import json
+import time
+import pickle
+import random
+import hashlib
+from typing import Any, Callable
+from path import DATASOURCE_MODE, DATASOURCE_PATH, DATASOURCE_LATENCY, DATASOURCE_ERROR_RATE
+
+MODES = ('live', 'record', 'replay')
+
+_settings = {
+    'mode': DATASOURCE_MODE,
+    'root': DATASOURCE_PATH,
+    'latency': DATASOURCE_LATENCY,
+    'error_rate': DATASOURCE_ERROR_RATE,
+}
+
+class ReplayMissError(KeyError):
+    """
+    重放模式下没有对应的录制数据
+    """
+
+class RateLimitError(Exception):
+    """
+    重放模式下模拟的接口限流错误,与Tushare超过每分钟调用次数时的异常对应
+    """
+
+def configure(mode: str = None, root: str = None, latency: float = None, error_rate: float = None) -> None:
+    """
+    修改数据源设置,参数为None时保持不变
+    :param mode: 'live', 'record' or 'replay'
+    :param root: 录制数据目录
+    :param latency: 重放时每次调用的模拟延迟秒数
+    :param error_rate: 重放时每次调用抛出RateLimitError的概率
+    :return: None
+    """
+    if mode is not None and mode not in MODES:
+        raise ValueError(f'数据源模式应为{MODES}之一,实际为{mode}')
+    for key, value in (('mode', mode), ('root', root), ('latency', latency), ('error_rate', error_rate)):
+        if value is not None:
+            _settings[key] = value
+
+def get_mode() -> str:
+    """
+    当前数据源模式
+    :return: 'live', 'record' or 'replay'
+    """
+    return _settings['mode']
+
+def record_file(api: str, args: tuple, kwargs: dict) -> str:
+    """
+    录制文件路径
+    :param api: 接口名称, 例如: 'pro.daily_basic'
+    :param args: 位置参数
+    :param kwargs: 关键字参数
+    :return: 文件路径
+    """
+    key = json.dumps([list(args), kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(_settings['root'], api, f"{digest}.pkl")
+
+def call(api: str, func: Callable, *args, **kwargs) -> Any:
+    """
+    按当前模式调用接口
+    :param api: 接口名称,决定录制文件所在的子目录
+    :param func: 真实接口函数,重放模式下不调用
+    :param args: 位置参数
+    :param kwargs: 关键字参数
+    :return: 接口返回值
+    """
+    mode = _settings['mode']
+    if mode == 'live':
+        return func(*args, **kwargs)
+    file_path = record_file(api, args, kwargs)
+    if mode == 'record':
+        result = func(*args, **kwargs)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path + '.tmp', 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(file_path + '.tmp', file_path)
+        return result
+    if _settings['latency'] > 0:
+        time.sleep(_settings['latency'])
+    if random.random() < _settings['error_rate']:
+        raise RateLimitError(f'{api}: 模拟限流,每分钟访问该接口次数超过上限')
+    if not os.path.exists(file_path):
+        raise ReplayMissError(f'{api}{args}{kwargs}没有录制数据')
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+class _SourceProApi:
+    """
+    ts.pro_api()的代理,每次接口调用经过call()
+    """
+    def __init__(self, pro):
+        self._pro = pro
+
+    def __getattr__(self, name):
+        func = getattr(self._pro, name) if self._pro is not None else None
+        if func is not None and not callable(func):
+            return func
+        def method(*args, **kwargs):
+            return call(f'pro.{name}', func, *args, **kwargs)
+        return method
+
+def pro_api():
+    """
+    获取当前模式下的Tushare pro接口,重放模式不需要Tushare token
+    :return: 与ts.pro_api()用法相同的接口对象
+    """
+    if _settings['mode'] == 'replay':
+        return _SourceProApi(None)
+    import tushare as ts
+    pro = ts.pro_api()
+    return pro if _settings['mode'] == 'live' else _SourceProApi(pro)
+
+def pro_bar(**kwargs):
+    """
+    当前模式下的ts.pro_bar
+    :param kwargs: ts.pro_bar参数
+    :return: ts.pro_bar的返回值
+    """
+    if _settings['mode'] == 'replay':
+        return call('pro_bar', None, **kwargs)
+    import tushare as ts
+    return call('pro_bar', ts.pro_bar, **kwargs)
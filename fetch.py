@@ -0,0 +1,183 @@
+"""
+Tushare接口限流抓取管道
+全部Tushare调用经过同一个令牌桶限流器,令牌速率为TUSHARE_CALLS_PER_MINUTE(与积分档位对应的每分钟调用次数),
+fetch_all以有界并发执行任务,失败的任务按指数退避重试,结果按完成顺序逐个返回给调用方写入存储.
+用法:
+    pro = fetch.pro_api()  # 每次接口调用消耗一个令牌
+    for code, result, error in fetch.fetch_all(data.update_trade_record_csv, codes):
+        ...
+NOTE:
+接口经过datasource数据源层,可以切换为录制或重放模式.
+每次接口调用和重试计入telemetry计数器,工作线程的计数在返回结果时计入调用方线程.
+令牌按实际接口调用计数,而不是按任务计数.一个任务内部调用几次接口就消耗几个令牌,
+并发线程数只需保证令牌不被闲置,全市场更新可以持续运行在配额上限.
+"""
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterable, Iterator, Tuple
+import datasource
+import telemetry
+from path import TUSHARE_CALLS_PER_MINUTE, FETCH_WORKERS, FETCH_RETRIES
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器
+    :param rate_per_minute: 每分钟补充的令牌数
+    :param capacity: 桶容量,即允许的瞬时突发调用数,默认为5秒的令牌量
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate * 5)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        取得tokens个令牌,令牌不足时阻塞等待
+        :param tokens: 令牌数
+        :return: 等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+_END = object()  # 任务参数迭代结束标记
+
+# 进程内共享的限流器,所有任务共同受Tushare配额约束
+LIMITER = TokenBucket(TUSHARE_CALLS_PER_MINUTE)
+
+class _LimitedProApi:
+    """
+    datasource.pro_api()的代理,每次接口调用前从LIMITER取得一个令牌,调用后计入telemetry
+    """
+    def __init__(self, pro, limiter: TokenBucket):
+        self._pro = pro
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self._pro, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            self._limiter.acquire()
+            result = attr(*args, **kwargs)
+            telemetry.count_response(result)
+            return result
+        return call
+
+def pro_api(limiter: TokenBucket = LIMITER):
+    """
+    获取受限流器约束的Tushare pro接口
+    :param limiter: 限流器,默认为进程内共享的LIMITER
+    :return: 与ts.pro_api()用法相同的接口对象
+    """
+    return _LimitedProApi(datasource.pro_api(), limiter)
+
+def pro_bar(limiter: TokenBucket = LIMITER, **kwargs):
+    """
+    受限流器约束的ts.pro_bar,复权行情内部调用daily和adj_factor两个接口,消耗两个令牌
+    :param limiter: 限流器
+    :param kwargs: ts.pro_bar参数
+    :return: ts.pro_bar的返回值
+    """
+    limiter.acquire(2 if kwargs.get('adj') else 1)
+    result = datasource.pro_bar(**kwargs)
+    telemetry.count_response(result)
+    return result
+
+def call_with_retry(
+    func: Callable, item: Any, retries: int = FETCH_RETRIES, backoff: float = 2.0
+) -> Any:
+    """
+    调用func(item),失败后按指数退避重试
+    :param func: 任务函数
+    :param item: 任务参数
+    :param retries: 最多重试次数
+    :param backoff: 首次重试前等待的秒数,此后每次加倍并附加随机抖动
+    :return: func的返回值,重试用尽后抛出最后一次的异常
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(item)
+        except Exception:
+            if attempt == retries:
+                raise
+            telemetry.count('retries')
+            time.sleep(backoff * 2**attempt * (1 + random.random() / 2))
+
+def _call_collected(func: Callable, item: Any, retries: int, backoff: float) -> Tuple[Any, Exception, dict]:
+    """
+    在工作线程中执行call_with_retry并收集telemetry计数
+    :return: (返回值, 异常, 计数器)
+    """
+    with telemetry.collect() as counters:
+        try:
+            return call_with_retry(func, item, retries, backoff), None, counters
+        except Exception as error:
+            return None, error, counters
+
+def fetch_all(
+    func: Callable,
+    items: Iterable,
+    max_workers: int = FETCH_WORKERS,
+    retries: int = FETCH_RETRIES,
+    backoff: float = 2.0
+) -> Iterator[Tuple[Any, Any, Exception]]:
+    """
+    以有界并发执行func(item),按完成顺序返回结果
+    :param func: 任务函数,内部使用pro_api()和pro_bar()调用接口
+    :param items: 任务参数,例如股票代码列表
+    :param max_workers: 最大并发线程数
+    :param retries: 每个任务最多重试次数
+    :param backoff: 首次重试前等待的秒数
+    :return: 生成器,每项为(item, 返回值, 异常),成功时异常为None,重试用尽时返回值为None
+    NOTE:
+    同时在途的任务不超过max_workers的两倍,调用方处理结果的速度决定提交新任务的速度.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        def submit(count):
+            while len(pending) < count:
+                item = next(items, _END)
+                if item is _END:
+                    break
+                pending[executor.submit(_call_collected, func, item, retries, backoff)] = item
+        submit(max_workers * 2)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                result, error, counters = future.result()
+                telemetry.add(counters)
+                yield item, result, error
+            submit(max_workers * 2)
+
+def run_fetch(func: Callable, items: Iterable, title: str = '', **kwargs) -> list:
+    """
+    执行fetch_all并打印进度
+    :param func: 任务函数
+    :param items: 任务参数
+    :param title: 进度提示
+    :param kwargs: fetch_all的其它参数
+    :return: 重试用尽仍然失败的任务参数列表
+    """
+    items = list(items)
+    failed = []
+    for count, (item, result, error) in enumerate(fetch_all(func, items, **kwargs), start=1):
+        if error is not None:
+            failed.append(item)
+        print(f'{title}{count}/{len(items)}, 失败{len(failed)}.' + ' '*20 + '\r', end='', flush=True)
+    return failed
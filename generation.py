@@ -0,0 +1,191 @@
+"""
+数据集版本(generation)快照.
+交易记录文件目录和curve index-value indicator-roe-from-1991三个数据库由写入方在原位置更新,
+更新完成后publish()生成新的版本并原子替换GENERATIONS_PATH/CURRENT指针:
+交易记录文件以硬链接加入新版本,数据库以sqlite备份接口复制,生成一个版本只需要几秒.
+读取方以pin()固定一个版本,期间path_of()把数据集路径映射到该版本,整个测试条件读取同一天的数据,
+写入方同时更新也不会读到写了一半的文件或不同日期混合的数据.
+用法:
+    with generation.pin():
+        csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), industry, f'{code}.csv')
+NOTE:
+硬链接与原文件共享内容,交易记录文件必须以replace_csv写入临时文件再替换,不能原位覆盖.
+pin()在版本目录的pins子目录中按进程和线程建立标记文件,gc()只删除没有存活标记的旧版本.
+还没有发布过任何版本时,path_of()返回原路径.
+版本是只读的快照:固定版本时读取方不能创建缺失的文件(写入的是原位置,不在版本中),数据库以只读方式打开.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import telemetry
+from path import (ensure_dirs, GENERATIONS_PATH, GENERATIONS_KEEP, TRADE_RECORD_PATH, CURVE_SQLITE3, INDEX_VALUE,
+                  INDICATOR_ROE_FROM_1991)
+
+CURRENT_FILE = os.path.join(GENERATIONS_PATH, "CURRENT")
+DATASET_DIRS = {TRADE_RECORD_PATH: "trade-record"}  # 以硬链接快照的目录
+DATASET_FILES = {path: os.path.basename(path) for path in (CURVE_SQLITE3, INDEX_VALUE, INDICATOR_ROE_FROM_1991)}
+
+_local = threading.local()  # 当前线程固定的版本
+
+def current() -> str:
+    """
+    当前发布的版本
+    :return: 版本名称, 例如: '20240603183512123456',没有发布过时为None
+    """
+    try:
+        with open(CURRENT_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def replace_csv(df: pd.DataFrame, csv_file: str, **kwargs) -> None:
+    """
+    写入临时文件后原子替换csv文件,已发布版本中的硬链接仍指向旧内容
+    :param df: 数据
+    :param csv_file: 文件路径
+    :param kwargs: DataFrame.to_csv的其它参数,默认index=False
+    """
+    kwargs.setdefault('index', False)
+    df.to_csv(csv_file + '.tmp', **kwargs)
+    os.replace(csv_file + '.tmp', csv_file)
+    telemetry.count('rows_written', len(df))
+
+def publish() -> str:
+    """
+    以数据集的当前内容生成新版本并设为当前版本,然后清理旧版本
+    :return: 新版本名称
+    """
+    ensure_dirs()
+    name = time.strftime('%Y%m%d%H%M%S') + f"{time.time() % 1:.6f}"[2:]
+    staging = os.path.join(GENERATIONS_PATH, name + '.tmp')
+    os.makedirs(staging)
+    for src_dir, dest_name in DATASET_DIRS.items():
+        for root, _, files in os.walk(src_dir):
+            dest_dir = os.path.join(staging, dest_name, os.path.relpath(root, src_dir))
+            os.makedirs(dest_dir, exist_ok=True)
+            for file in files:
+                if not file.endswith('.tmp'):
+                    os.link(os.path.join(root, file), os.path.join(dest_dir, file))
+    for src_file, dest_name in DATASET_FILES.items():
+        if not os.path.exists(src_file):
+            continue
+        src, dest = sqlite3.connect(src_file), sqlite3.connect(os.path.join(staging, dest_name))
+        with dest:
+            src.backup(dest)  # 写入方同时更新时也得到一致的副本
+        src.close()
+        dest.close()
+    os.rename(staging, os.path.join(GENERATIONS_PATH, name))
+    with open(CURRENT_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(CURRENT_FILE + '.tmp', CURRENT_FILE)
+    gc()
+    return name
+
+@contextmanager
+def pin():
+    """
+    在当前线程固定当前版本,嵌套调用时沿用外层的版本
+    :return: 上下文管理器,值为固定的版本名称,没有发布过时为None
+    """
+    pinned = getattr(_local, 'generation', None)
+    if pinned is not None:
+        yield pinned
+        return
+    while True:
+        name = current()
+        if name is None:
+            yield None
+            return
+        pins = os.path.join(GENERATIONS_PATH, name, 'pins')
+        marker = os.path.join(pins, f'{os.getpid()}-{threading.get_ident()}')
+        try:
+            if not os.path.isdir(pins):
+                os.mkdir(pins)
+            open(marker, 'w').close()
+            break
+        except FileExistsError:
+            open(marker, 'w').close()
+            break
+        except FileNotFoundError:  # 读取指针后该版本已被清理,重新读取
+            continue
+    _local.generation = name
+    try:
+        yield name
+    finally:
+        _local.generation = None
+        os.remove(marker)
+
+def pinned() -> str:
+    """
+    当前线程固定的版本
+    :return: 版本名称,没有固定版本(或还没有发布过版本)时为None
+    """
+    return getattr(_local, 'generation', None)
+
+def path_of(path: str) -> str:
+    """
+    把数据集路径映射到当前线程固定的版本
+    :param path: TRADE_RECORD_PATH CURVE_SQLITE3 INDEX_VALUE INDICATOR_ROE_FROM_1991或交易记录目录下的路径
+    :return: 版本中的对应路径,没有固定版本或不属于数据集时返回原路径
+    """
+    name = pinned()
+    if name is None:
+        return path
+    if path in DATASET_FILES:
+        return os.path.join(GENERATIONS_PATH, name, DATASET_FILES[path])
+    for src_dir, dest_name in DATASET_DIRS.items():
+        if path == src_dir or path.startswith(src_dir + os.sep):
+            return os.path.join(GENERATIONS_PATH, name, dest_name) + path[len(src_dir):]
+    return path
+
+def _pinned(generation_dir: str) -> bool:
+    """
+    版本是否被存活的进程固定
+    :param generation_dir: 版本目录
+    :return: 是否被固定
+    """
+    pins = os.path.join(generation_dir, 'pins')
+    if not os.path.isdir(pins):
+        return False
+    for marker in os.listdir(pins):
+        pid = int(marker.split('-')[0])
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            os.remove(os.path.join(pins, marker))  # 进程已退出,遗留的标记
+        except PermissionError:
+            return True
+    return False
+
+def gc(keep: int = GENERATIONS_KEEP) -> list:
+    """
+    删除旧版本,保留当前版本和此前最近keep-1个版本,被固定的版本不删除
+    :param keep: 保留的版本数
+    :return: 删除的版本名称列表
+    NOTE:
+    中断的publish留下的.tmp目录超过一天后删除.
+    """
+    name = current()
+    removed = []
+    finished = []
+    for entry in sorted(os.listdir(GENERATIONS_PATH)):
+        generation_dir = os.path.join(GENERATIONS_PATH, entry)
+        if not os.path.isdir(generation_dir) or entry == name:
+            continue
+        if entry.endswith('.tmp'):
+            if time.time() - os.path.getmtime(generation_dir) > 86400:
+                shutil.rmtree(generation_dir, ignore_errors=True)
+                removed.append(entry)
+        elif name is None or entry < name:
+            finished.append(entry)
+    for entry in finished[:max(len(finished) - (keep - 1), 0)]:
+        generation_dir = os.path.join(GENERATIONS_PATH, entry)
+        if not _pinned(generation_dir):
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            removed.append(entry)
+    return removed
@@ -0,0 +1,279 @@
+"""
+数据集深度完整性检查.
+1. 代码完整性: 以申万行业全部股票为基准,用集合比较交易记录文件和ROE表中的股票代码.
+2. 文件内容: 以进程池逐个校验交易记录文件:
+   gaps: 首尾日期之间交易日历中有而文件中缺失的交易日数,以及最长连续缺失天数
+   duplicates: 重复的交易日数
+   unordered: 交易日未按降序排列
+   off_calendar: 不在交易日历中的日期数
+   pb_streak: PB为空值或0的最长连续天数
+   lag: 最新日期落后于最近交易日的交易日数
+3. 输出INTEGRITY_REPORT报告(JSON),包含每个文件的检查结果 修复队列和耗时摘要.
+用法:
+    python integrity.py  # 扫描并写入报告
+    python integrity.py --repair  # 扫描后执行修复队列
+NOTE:
+工作进程只导入pandas和numpy,交易日历以initializer传入一次,tsswindustry只在主进程中导入.
+"""
+import os
+import json
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from path import (TRADE_RECORD_PATH, INDICATOR_ROE_FROM_1991, ROE_STOCK_TABLE, INTEGRITY_REPORT,
+                  INTEGRITY_WORKERS, INTEGRITY_MAX_GAP, INTEGRITY_PB_STREAK, INTEGRITY_MAX_LAG, ensure_dirs)
+
+_trade_days = np.empty(0, dtype=np.int64)  # 工作进程内升序排列的交易日
+
+def _init_worker(trade_days: List[int]) -> None:
+    """
+    工作进程初始化,保存交易日数组
+    :param trade_days: 升序排列的交易日, 例如: [19901219, ...]
+    """
+    global _trade_days
+    _trade_days = np.asarray(trade_days, dtype=np.int64)
+
+def calendar_positions(dates: np.ndarray) -> np.ndarray:
+    """
+    日期在交易日数组中的下标
+    :param dates: 日期数组, 例如: [20240603, ...]
+    :return: 下标数组,不是交易日的日期为-1
+    """
+    positions = np.searchsorted(_trade_days, dates)
+    found = positions < len(_trade_days)
+    found[found] = _trade_days[positions[found]] == dates[found]
+    return np.where(found, positions, -1)
+
+def longest_run(mask: np.ndarray) -> int:
+    """
+    布尔数组中最长的连续True长度
+    :param mask: 布尔数组
+    :return: 最长连续长度
+    """
+    if not mask.any():
+        return 0
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return int((edges[1::2] - edges[0::2]).max())
+
+def validate_trade_record(task: Tuple[str, str, int]) -> Dict:
+    """
+    校验一个交易记录文件
+    :param task: (股票代码, 文件路径, 最近交易日), 例如: ('600000', '.../银行/600000.csv', 20240603)
+    :return: 检查结果, 'issues'为发现的问题列表
+    """
+    code, csv_file, latest = task
+    start = time.perf_counter()
+    result = {'code': code, 'file': csv_file, 'issues': []}
+    try:
+        df = pd.read_csv(csv_file, usecols=['trade_date', 'pb'])
+    except Exception as error:
+        result['issues'].append('unreadable')
+        result['error'] = f'{type(error).__name__}: {error}'
+        result['seconds'] = time.perf_counter() - start
+        return result
+    dates = df['trade_date'].to_numpy(dtype=np.int64)
+    result['rows'] = int(len(dates))
+    if len(dates) == 0:
+        result['issues'].append('empty')
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    result['duplicates'] = int(len(dates) - len(np.unique(dates)))
+    result['unordered'] = bool((np.diff(dates) > 0).any())  # 应按日期降序
+    positions = calendar_positions(np.unique(dates))
+    result['off_calendar'] = int((positions < 0).sum())
+    positions = positions[positions >= 0]  # 升序
+    if len(positions):
+        steps = np.diff(positions) - 1
+        result['gaps'] = int(steps.sum())
+        result['max_gap'] = int(steps.max()) if len(steps) else 0
+    else:
+        result['gaps'] = result['max_gap'] = 0
+    pb = df['pb'].to_numpy(dtype=float)
+    result['pb_streak'] = longest_run(np.isnan(pb) | (pb == 0))
+    result['last_date'] = int(dates.max())
+    last_index, latest_index = calendar_positions(np.array([result['last_date'], latest], dtype=np.int64))
+    result['lag'] = int(latest_index - last_index) if last_index >= 0 and latest_index >= 0 else None
+
+    if result['duplicates']:
+        result['issues'].append('duplicates')
+    if result['unordered']:
+        result['issues'].append('unordered')
+    if result['off_calendar']:
+        result['issues'].append('off_calendar')
+    if result['max_gap'] > INTEGRITY_MAX_GAP:
+        result['issues'].append('gaps')
+    if result['pb_streak'] > INTEGRITY_PB_STREAK:
+        result['issues'].append('pb_streak')
+    if result['lag'] is not None and result['lag'] > INTEGRITY_MAX_LAG:
+        result['issues'].append('stale')
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def repair_action(result: Dict) -> str:
+    """
+    根据检查结果决定修复方式
+    :param result: validate_trade_record的返回值
+    :return: 'create': 重新创建整个文件, None: 不需要或无法自动修复
+    NOTE:
+    gaps pb_streak和off_calendar多为停牌或数据源本身的问题,只记录在报告中,不进入修复队列.
+    重组等原因停牌超过INTEGRITY_MAX_GAP个交易日的股票,重新下载得到的仍是同样的缺口.
+    stale同样只记录在报告中:最新日期落后的多为停牌或退市的股票,增量更新也取不到新数据,
+    仍在交易的股票由每日的update_trade_record_csv_by_date补齐.
+    """
+    issues = set(result['issues'])
+    if issues & {'unreadable', 'empty', 'duplicates', 'unordered'}:
+        return 'create'
+    return None
+
+def scan(trade_record_path: str = TRADE_RECORD_PATH, workers: int = INTEGRITY_WORKERS) -> Dict:
+    """
+    扫描全部数据集并生成报告
+    :param trade_record_path: 交易记录文件目录
+    :param workers: 进程数
+    :return: 报告, 键为generated summary missing_trade_records missing_roe extra_roe files repair_queue
+    """
+    import roestore
+    import tradecal
+    import tsswindustry as sw  # 只在主进程中导入
+    timing = {}
+    begin = time.perf_counter()
+
+    # 代码完整性,集合比较
+    stocks = sw.get_all_stocks()
+    sw_codes = [item[0][0:6] for item in stocks]
+    files = {}  # {代码: 文件路径}
+    for stock_class in sw.get_stock_classes():
+        dest_dir = os.path.join(trade_record_path, stock_class)
+        if os.path.isdir(dest_dir):
+            for entry in os.scandir(dest_dir):
+                if entry.name.endswith('.csv'):
+                    files[entry.name[0:6]] = entry.path
+    con = roestore.connect(INDICATOR_ROE_FROM_1991)
+    with con:
+        roe_codes = {row[0][0:6] for row in con.execute(f"SELECT stockcode FROM '{ROE_STOCK_TABLE}'")}
+    con.close()
+    sw_set = set(sw_codes)
+    report = {
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'missing_trade_records': [code for code in sw_codes if code not in files],
+        'missing_roe': [code for code in sw_codes if code not in roe_codes],
+        'extra_roe': sorted(code for code in roe_codes if code not in sw_set),
+    }
+    timing['codes'] = time.perf_counter() - begin
+
+    # 文件内容,进程池校验
+    start = time.perf_counter()
+    today = datetime.date.today().strftime('%Y%m%d')
+    calendar = tradecal.get_calendar()
+    trade_days = [int(datetime.date.fromordinal(day).strftime('%Y%m%d')) for day in calendar.days]
+    latest = int(tradecal.prev_trade_day(today))
+    tasks = [(code, files[code], latest) for code in sw_codes if code in files]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(trade_days,)) as pool:
+        results = list(pool.map(validate_trade_record, tasks, chunksize=32))
+    report['files'] = {result['code']: result for result in results}
+    timing['files'] = time.perf_counter() - start
+
+    # 修复队列
+    queue = [{'code': code, 'action': 'create_trade_record', 'reason': 'missing'}
+             for code in report['missing_trade_records']]
+    for result in results:
+        action = repair_action(result)
+        if action is not None:
+            queue.append({'code': result['code'], 'action': f'{action}_trade_record', 'reason': ','.join(result['issues'])})
+    queue += [{'code': code, 'action': 'create_roe', 'reason': 'missing'} for code in report['missing_roe']]
+    queue += [{'code': code, 'action': 'remove_roe', 'reason': 'not in sw index'} for code in report['extra_roe']]
+    report['repair_queue'] = queue
+
+    timing['total'] = time.perf_counter() - begin
+    seconds = [result['seconds'] for result in results]
+    report['summary'] = {
+        'stocks': len(sw_codes),
+        'files_checked': len(results),
+        'files_with_issues': sum(1 for result in results if result['issues']),
+        'repairs': len(queue),
+        'workers': workers,
+        'seconds': {key: round(value, 3) for key, value in timing.items()},
+        'file_seconds_p50': round(float(np.percentile(seconds, 50)), 4) if seconds else 0.0,
+        'file_seconds_max': round(max(seconds), 4) if seconds else 0.0,
+    }
+    return report
+
+def write_report(report: Dict, report_file: str = INTEGRITY_REPORT) -> None:
+    """
+    写入JSON报告,先写临时文件再替换
+    :param report: scan的返回值
+    :param report_file: 报告文件
+    """
+    ensure_dirs()
+    with open(report_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(report_file + '.tmp', report_file)
+
+def repair(queue: List[Dict], resume: bool = False) -> List[str]:
+    """
+    执行修复队列
+    :param queue: scan返回的repair_queue
+    :param resume: 是否继续上一次未完成的修复作业
+    :return: 修复失败的股票代码列表
+    """
+    import data
+    import journal
+    import roestore
+    codes = {}
+    for item in queue:
+        codes.setdefault(item['action'], []).append(item['code'])
+    failed = []
+    if codes.get('create_trade_record'):
+        failed += journal.run_journaled(
+            'repair-trade-csv', data.create_trade_record_csv_table, codes['create_trade_record'], resume=resume
+        )
+    if codes.get('create_roe'):
+        failed += journal.run_journaled(
+            'repair-roe-table', data.create_ROE_indicators_table_from_1991, codes['create_roe'], resume=resume
+        )
+    if codes.get('remove_roe'):
+        con = roestore.connect()
+        with con:
+            stockcodes = [code + '.SH' if code.startswith('6') else code + '.SZ' for code in codes['remove_roe']]
+            roestore.delete_stocks(con, stockcodes)
+            roestore.refresh_wide_table(con, stockcodes)
+        con.close()
+    return failed
+
+def print_summary(report: Dict) -> None:
+    """
+    打印报告摘要
+    :param report: scan的返回值
+    """
+    summary = report['summary']
+    print(
+        f"检查{summary['files_checked']}/{summary['stocks']}个交易记录文件, {summary['files_with_issues']}个存在问题, "
+        f"修复队列{summary['repairs']}项, 耗时{summary['seconds']['total']:.1f}秒({summary['workers']}个进程)." + ' '*20
+    )
+    issues = {}
+    for result in report['files'].values():
+        for issue in result['issues']:
+            issues[issue] = issues.get(issue, 0) + 1
+    for issue, count in sorted(issues.items()):
+        print(f"    {issue}: {count}")
+    print(f"缺失交易记录文件{len(report['missing_trade_records'])}个, ROE表缺失{len(report['missing_roe'])}只, "
+          f"多余{len(report['extra_roe'])}只. 报告: {INTEGRITY_REPORT}")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='数据集深度完整性检查')
+    parser.add_argument('--repair', action='store_true', help='扫描后执行修复队列')
+    parser.add_argument('--resume', action='store_true', help='继续上一次未完成的修复作业')
+    parser.add_argument('--workers', type=int, default=INTEGRITY_WORKERS, help='进程数')
+    args = parser.parse_args()
+    report = scan(workers=args.workers)
+    write_report(report)
+    print_summary(report)
+    if args.repair and report['repair_queue']:
+        failed = repair(report['repair_queue'], resume=args.resume)
+        print(f"修复完成, 失败{len(failed)}项: {failed}" + ' '*20)
@@ -0,0 +1,286 @@
+"""
+批量数据作业日志.
+每次批量创建或更新作为一个作业记录在JOURNAL_SQLITE3数据库中,作业中的每个单元(股票代码 交易日 报告期等)
+记录状态 错误信息和耗时:
+JOURNAL_JOB_TABLE: (job_id, name, status, started, resumed, finished)
+JOURNAL_UNIT_TABLE: (job_id, unit, status, error, duration, updated),主键(job_id, unit)
+用法:
+    job_id = journal.start_job('create-curve', resume=True)  # 继续上一次未完成的同名作业
+    for date, value, error in journal.fetch_journaled(job_id, func, dates):
+        ...  # 已完成的单元被跳过,失败的单元重新执行
+    journal.finish_job(job_id)
+NOTE:
+单元日志由调用fetch_journaled的线程写入,工作线程不访问数据库.
+每个单元的接口调用次数 写入行数等指标同时写入telemetry的指标表.
+"""
+import time
+import sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Any
+import fetch
+import telemetry
+from path import ensure_dirs, JOURNAL_SQLITE3, JOURNAL_JOB_TABLE, JOURNAL_UNIT_TABLE, TELEMETRY_TABLE
+
+def connect(sqlite_file: str = JOURNAL_SQLITE3) -> sqlite3.Connection:
+    """
+    打开作业日志数据库,不存在时创建表格
+    :param sqlite_file: 数据库文件
+    :return: sqlite3.Connection
+    """
+    ensure_dirs()
+    con = sqlite3.connect(sqlite_file)
+    with con:
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS '{JOURNAL_JOB_TABLE}' (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL NOT NULL,
+                resumed REAL NOT NULL,
+                finished REAL
+            )""")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS '{JOURNAL_UNIT_TABLE}' (
+                job_id INTEGER NOT NULL,
+                unit TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                duration REAL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY(job_id, unit)
+            ) WITHOUT ROWID""")
+        telemetry.ensure_table(con)
+    return con
+
+def start_job(name: str, resume: bool = False) -> int:
+    """
+    开始一个作业
+    :param name: 作业名称, 例如: 'create-curve'
+    :param resume: 是否继续最近一次未完成的同名作业,没有未完成的作业时新建
+    :return: job_id
+    """
+    now = time.time()
+    con = connect()
+    with con:
+        row = None
+        if resume:
+            sql = f"""
+                SELECT job_id FROM '{JOURNAL_JOB_TABLE}'
+                WHERE name=? AND status!='done' ORDER BY job_id DESC LIMIT 1
+            """
+            row = con.execute(sql, (name,)).fetchone()
+        if row is not None:
+            job_id = row[0]
+            con.execute(
+                f"UPDATE '{JOURNAL_JOB_TABLE}' SET status='running', resumed=?, finished=NULL WHERE job_id=?",
+                (now, job_id)
+            )
+        else:
+            cursor = con.execute(
+                f"INSERT INTO '{JOURNAL_JOB_TABLE}' (name, status, started, resumed) VALUES (?, 'running', ?, ?)",
+                (name, now, now)
+            )
+            job_id = cursor.lastrowid
+    con.close()
+    return job_id
+
+def done_units(job_id: int) -> set:
+    """
+    获取作业中已完成的单元
+    :param job_id: 作业编号
+    :return: 单元名称集合
+    """
+    con = connect()
+    with con:
+        sql = f"SELECT unit FROM '{JOURNAL_UNIT_TABLE}' WHERE job_id=? AND status='done'"
+        units = {row[0] for row in con.execute(sql, (job_id,))}
+    con.close()
+    return units
+
+def record_unit(
+    job_id: int, unit: Any, error: Exception = None, duration: float = 0.0, con: sqlite3.Connection = None,
+    counters: Dict[str, int] = None
+) -> None:
+    """
+    记录单元状态和指标,error为None时记为完成,否则记为失败
+    :param job_id: 作业编号
+    :param unit: 单元,以str(unit)保存
+    :param error: 异常
+    :param duration: 耗时秒数
+    :param con: sqlite3.Connection,默认为connect()
+    :param counters: telemetry.collect收集的计数器
+    :return: None
+    """
+    own = con is None
+    con = con if con is not None else connect()
+    with con:
+        sql = f"""
+            INSERT OR REPLACE INTO '{JOURNAL_UNIT_TABLE}' (job_id, unit, status, error, duration, updated)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        status, message = ('done', None) if error is None else ('failed', f'{type(error).__name__}: {error}')
+        con.execute(sql, (job_id, str(unit), status, message, duration, time.time()))
+        telemetry.record(con, job_id, str(unit), duration, counters)
+    if own:
+        con.close()
+
+def fetch_journaled(job_id: int, func: Callable, items: Iterable, **kwargs) -> Iterator[Tuple[Any, Any, Exception]]:
+    """
+    跳过已完成的单元,以fetch.fetch_all执行其余单元并记录每个单元的状态和耗时
+    :param job_id: 作业编号
+    :param func: 任务函数
+    :param items: 任务参数
+    :param kwargs: fetch.fetch_all的其它参数
+    :return: 生成器,每项为(item, 返回值, 异常),与fetch.fetch_all相同
+    NOTE:
+    耗时为各次尝试执行func的时间之和,不含重试前的等待.
+    单元在调用方处理完该项结果并请求下一项时才记录,调用方应在循环体内完成写入.
+    单元指标包括各次尝试中的计数和调用方处理该项结果时的计数,重试次数为尝试次数减一.
+    """
+    done = done_units(job_id)
+    items = [item for item in items if str(item) not in done]
+    durations = {}
+    attempts = {}
+    unit_counters = {}
+    def timed(item):
+        start = time.monotonic()
+        with telemetry.collect() as counters:
+            try:
+                return func(item)
+            finally:
+                durations[item] = durations.get(item, 0.0) + time.monotonic() - start
+                attempts[item] = attempts.get(item, 0) + 1
+                total = unit_counters.setdefault(item, dict.fromkeys(telemetry.METRICS, 0))
+                for name, value in counters.items():
+                    total[name] += value
+    con = connect()
+    try:
+        for item, result, error in fetch.fetch_all(timed, items, **kwargs):
+            with telemetry.collect() as written:
+                yield item, result, error
+            # 调用方处理完结果后才记录,处理过程中断的单元在resume时重新执行
+            counters = unit_counters.pop(item, dict.fromkeys(telemetry.METRICS, 0))
+            for name, value in written.items():
+                counters[name] += value
+            counters['retries'] = max(attempts.pop(item, 1) - 1, 0)
+            record_unit(job_id, item, error, durations.pop(item, 0.0), con, counters)
+    finally:
+        con.close()
+
+def finish_job(job_id: int) -> Dict:
+    """
+    结束作业,存在失败单元时作业记为失败,可以resume继续
+    :param job_id: 作业编号
+    :return: 作业摘要,见summarize_job
+    """
+    con = connect()
+    with con:
+        sql = f"SELECT COUNT(*) FROM '{JOURNAL_UNIT_TABLE}' WHERE job_id=? AND status='failed'"
+        failed = con.execute(sql, (job_id,)).fetchone()[0]
+        con.execute(
+            f"UPDATE '{JOURNAL_JOB_TABLE}' SET status=?, finished=? WHERE job_id=?",
+            ('failed' if failed else 'done', time.time(), job_id)
+        )
+    con.close()
+    summary = summarize_job(job_id)
+    print(
+        f"作业{summary['name']}#{job_id}: 完成{summary['done']}, 失败{summary['failed']}, "
+        f"本次{summary['run_units']}个单元耗时{summary['run_seconds']:.1f}秒, 每分钟{summary['per_minute']:.1f}个, "
+        f"接口调用{summary['api_calls']}次, 重试{summary['retries']}次, 写入{summary['rows_written']}行." + ' '*20
+    )
+    return summary
+
+def summarize_job(job_id: int) -> Dict:
+    """
+    作业摘要
+    :param job_id: 作业编号
+    :return: {'name', 'status', 'done', 'failed', 'run_units': 本次运行处理的单元数,
+              'run_seconds': 本次运行耗时, 'per_minute': 本次运行每分钟处理的单元数, 'unit_seconds': 单元平均耗时,
+              以及本次运行的telemetry.METRICS各项指标合计}
+    """
+    con = connect()
+    with con:
+        name, status, resumed, finished = con.execute(
+            f"SELECT name, status, resumed, finished FROM '{JOURNAL_JOB_TABLE}' WHERE job_id=?", (job_id,)
+        ).fetchone()
+        sql = f"""
+            SELECT SUM(status='done'), SUM(status='failed'), SUM(updated>=?), AVG(duration)
+            FROM '{JOURNAL_UNIT_TABLE}' WHERE job_id=?
+        """
+        done, failed, run_units, unit_seconds = con.execute(sql, (resumed, job_id)).fetchone()
+        sql = f"""
+            SELECT {', '.join(f'SUM({name})' for name in telemetry.METRICS)}
+            FROM '{TELEMETRY_TABLE}' WHERE job_id=? AND finished>=?
+        """
+        metrics = con.execute(sql, (job_id, resumed)).fetchone()
+    con.close()
+    run_seconds = (finished if finished is not None else time.time()) - resumed
+    run_units = run_units or 0
+    return {
+        'name': name, 'status': status, 'done': done or 0, 'failed': failed or 0,
+        'run_units': run_units, 'run_seconds': run_seconds,
+        'per_minute': run_units / run_seconds * 60 if run_seconds > 0 else 0.0,
+        'unit_seconds': unit_seconds or 0.0,
+        **{name: value or 0 for name, value in zip(telemetry.METRICS, metrics)},
+    }
+
+def last_done_job(name: str) -> Tuple[int, float]:
+    """
+    最近一次成功完成的同名作业
+    :param name: 作业名称
+    :return: (job_id, 开始运行的时间戳),不存在时为(None, None)
+    """
+    con = connect()
+    with con:
+        sql = f"""
+            SELECT job_id, resumed FROM '{JOURNAL_JOB_TABLE}'
+            WHERE name=? AND status='done' ORDER BY job_id DESC LIMIT 1
+        """
+        row = con.execute(sql, (name,)).fetchone()
+    con.close()
+    return row if row is not None else (None, None)
+
+def failed_units(job_id: int) -> List[Tuple[str, str]]:
+    """
+    获取作业中失败的单元
+    :param job_id: 作业编号
+    :return: [(单元, 错误信息), ...]
+    """
+    con = connect()
+    with con:
+        sql = f"SELECT unit, error FROM '{JOURNAL_UNIT_TABLE}' WHERE job_id=? AND status='failed' ORDER BY unit"
+        rows = con.execute(sql, (job_id,)).fetchall()
+    con.close()
+    return rows
+
+def run_journaled(name: str, func: Callable, items: Iterable, title: str = '', resume: bool = False, **kwargs) -> list:
+    """
+    以作业日志执行fetch_all并打印进度,与fetch.run_fetch用法相同
+    :param name: 作业名称
+    :param func: 任务函数
+    :param items: 任务参数
+    :param title: 进度提示
+    :param resume: 是否继续最近一次未完成的同名作业
+    :param kwargs: fetch.fetch_all的其它参数
+    :return: 本次运行中重试用尽仍然失败的任务参数列表
+    """
+    job_id = start_job(name, resume)
+    items = list(items)
+    failed = []
+    for count, (item, result, error) in enumerate(fetch_journaled(job_id, func, items, **kwargs), start=1):
+        if error is not None:
+            failed.append(item)
+        print(f'{title}{count}/{len(items)}, 失败{len(failed)}.' + ' '*20 + '\r', end='', flush=True)
+    finish_job(job_id)
+    return failed
+
+if __name__ == '__main__':
+    con = connect()
+    with con:
+        jobs = con.execute(f"SELECT job_id FROM '{JOURNAL_JOB_TABLE}' ORDER BY job_id DESC LIMIT 20").fetchall()
+    con.close()
+    for (job_id,) in jobs:
+        summary = summarize_job(job_id)
+        print(
+            f"#{job_id} {summary['name']:<20} {summary['status']:<8} 完成{summary['done']:>6} 失败{summary['failed']:>4} "
+            f"每分钟{summary['per_minute']:>8.1f}个 单元平均{summary['unit_seconds']:.2f}秒"
+        )
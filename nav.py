@@ -0,0 +1,137 @@
+"""
+测试条件的日度净值引擎.
+以日期×股票的日收益率矩阵和由时间组生成的权重表,通过矩阵运算一次计算多个测试条件的日度净值曲线、
+回撤曲线和相对指数的超额曲线.
+NOTE:
+持有时间和交易月份相同的测试条件时间组完全相同,按(holding_time, trade_month)分组后,
+每个持股期间只需一次矩阵乘法即可得到该组全部测试条件的净值.
+持股期间内采用等资金权重买入持有(与calculate_portfolio_rising_value一致),
+有效时间组(5-25只股票)以外的期间持有现金,净值不变.
+持股期间按[起点, 终点)计算,相邻期间的交界日只计算一次.
+"""
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Literal, Tuple
+import tsswindustry as sw
+import generation
+from timegroup import TimeGroup
+from selection import GroupSelection
+from path import TRADE_RECORD_PATH, INDEX_VALUE
+
+def load_return_matrix(code_list: List[str], start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    读取股票日收益率矩阵
+    :param code_list: 股票代码列表, 例如: ['600000', '000001']
+    :param start_date: 开始日期, 例如: '20060301'
+    :param end_date: 结束日期, 例如: '20240601'
+    :return: 行为交易日(yyyymmdd升序),列为股票代码的日收益率矩阵,停牌或缺失记为0
+    """
+    series = {}
+    for code in code_list:
+        swindustry = sw.get_name_and_class_by_code(code)[1]
+        csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), swindustry, f"{code}.csv")
+        if not os.path.exists(csv_file):
+            continue
+        df = pd.read_csv(csv_file, dtype={'trade_date': str}, usecols=['trade_date', 'pct_chg'])
+        df = df[(df['trade_date'] >= start_date) & (df['trade_date'] <= end_date)]
+        df = df.drop_duplicates(subset=['trade_date']).set_index('trade_date')
+        series[code] = df['pct_chg'] / 100
+    matrix = pd.DataFrame(series, columns=code_list).sort_index()
+    return matrix.fillna(0.0)
+
+def load_index_returns(
+    index: Literal["000300", "399006", "000905"],
+    start_date: str,
+    end_date: str
+) -> pd.Series:
+    """
+    读取指数日收益率
+    :param index: 指数代码
+    :param start_date: 开始日期, 例如: '20060301'
+    :param end_date: 结束日期, 例如: '20240601'
+    :return: 以交易日(yyyymmdd)为索引的日收益率
+    """
+    full_code = f'{index}.SH' if index.startswith('000') else f'{index}.SZ'
+    con = sqlite3.connect(generation.path_of(INDEX_VALUE))
+    with con:
+        sql = f"""
+            SELECT trade_date, pct_chg FROM '{full_code}' WHERE
+            trade_date>=? AND trade_date<=?
+        """
+        df = pd.read_sql(sql, con, params=(start_date, end_date))
+    df = df.drop_duplicates(subset=['trade_date']).set_index('trade_date').sort_index()
+    return df['pct_chg'] / 100
+
+def build_weight_schedule(
+    results: List[Dict[TimeGroup, GroupSelection]],
+    min_numbers: int = 5,
+    max_numbers: int = 25
+) -> Dict[Tuple[str, str], Dict[int, List[str]]]:
+    """
+    由时间组生成权重表
+    :param results: 各测试条件的回测结果,策略类方法的返回值
+    :param min_numbers: 有效时间组最少股票数
+    :param max_numbers: 有效时间组最多股票数
+    :return: {(起点yyyymmdd, 终点yyyymmdd): {测试条件序号: 等权持有的股票代码}}
+    NOTE:
+    无效时间组不出现在权重表中,即该期间持有现金.
+    """
+    schedule = {}
+    for position, result in enumerate(results):
+        for group, stocks in result.items():
+            if not min_numbers <= len(stocks) <= max_numbers:
+                continue
+            period = (group.start_date.replace('-', ''), group.end_date.replace('-', ''))
+            schedule.setdefault(period, {})[position] = stocks.codes()
+    return schedule
+
+def calculate_daily_nav(
+    results: List[Dict[TimeGroup, GroupSelection]],
+    index: Literal["000300", "399006", "000905"] = "000300"
+) -> Dict[str, pd.DataFrame]:
+    """
+    一次计算多个测试条件的日度净值
+    :param results: 各测试条件的回测结果,策略类方法的返回值
+    :param index: 基准指数代码
+    :return: 字典,键为'nav'(净值) 'drawdown'(回撤) 'relative'(相对基准的净值比)和'index'(基准净值),
+    前三者均为行为交易日,列为results序号的DataFrame
+    """
+    schedule = build_weight_schedule(results)
+    columns = list(range(len(results)))
+    if not schedule:
+        empty = pd.DataFrame(columns=columns, dtype=float)
+        return {'nav': empty, 'drawdown': empty, 'relative': empty, 'index': pd.Series(dtype=float)}
+    start_date = min(period[0] for period in schedule)
+    end_date = max(period[1] for period in schedule)
+    code_list = sorted({code for holdings in schedule.values() for codes in holdings.values() for code in codes})
+    returns = load_return_matrix(code_list, start_date, end_date)
+    dates = returns.index.to_numpy()
+    position_of = {code: n for n, code in enumerate(returns.columns)}
+    # 全期间累计增长矩阵,期间增长 = prices[t] / prices[起点前一日]
+    prices = np.vstack([np.ones(len(code_list)), np.cumprod(1 + returns.to_numpy(), axis=0)])
+
+    # 每日相对前一日的净值增长,先按期间计算期间内累计增长,再转换为日增长以便串联
+    daily_growth = np.ones((len(dates), len(results)))
+    for (period_start, period_end), holdings in sorted(schedule.items()):
+        first = np.searchsorted(dates, period_start, side='left')
+        last = np.searchsorted(dates, period_end, side='left')  # 不含终点
+        if last <= first:
+            continue
+        members = sorted(holdings)
+        weights = np.zeros((len(members), len(code_list)))
+        for row, position in enumerate(members):
+            codes = holdings[position]
+            weights[row, [position_of[code] for code in codes]] = 1 / len(codes)
+        growth = prices[first+1:last+1] / prices[first]  # (期间交易日, 股票)
+        period_nav = growth @ weights.T  # (期间交易日, 测试条件)
+        period_nav = np.vstack([np.ones(len(members)), period_nav])
+        daily_growth[first:last, members] = period_nav[1:] / period_nav[:-1]
+
+    nav = pd.DataFrame(np.cumprod(daily_growth, axis=0), index=dates, columns=columns)
+    drawdown = nav / nav.cummax() - 1
+    index_returns = load_index_returns(index, start_date, end_date).reindex(dates).fillna(0.0)
+    index_nav = (1 + index_returns).cumprod()
+    relative = nav.div(index_nav, axis=0)
+    return {'nav': nav, 'drawdown': drawdown, 'relative': relative, 'index': index_nav}
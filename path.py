@@ -1,9 +1,8 @@
 import os
-import time
 # import pandas as pd
 
 # 内置目录
-ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.environ.get("QUANT_ROOT_PATH") or os.path.dirname(os.path.abspath(__file__))  # 可指向其它数据根目录,见benchmark模块
 TRADE_RECORD_PATH = os.path.join(ROOT_PATH, "trade-record")  # 股票历史交易记录文件保存目录
 DATA_PACKAGE_PATH = os.path.join(ROOT_PATH, "data-package")  # 数据包保存目录
 SQL_PATH = os.path.join(ROOT_PATH, "sql")  # SQL文件保存目录
@@ -12,23 +11,28 @@ STOCK_MOS_IMG = os.path.join(ROOT_PATH, "stock-mos-img")  # 股票MOS图保存
 INDEX_MOS_IMG = os.path.join(ROOT_PATH, "index-mos-img")  # 指数MOS图保存目录
 INDEX_UP_DOWN_IMG = os.path.join(ROOT_PATH, "index-up-down-img")  # 指数MOS图保存目录
 STOCK_UP_DOWN_IMG = os.path.join(ROOT_PATH, "stock-up-down-img")  # 股票MOS图保存目录
+GENERATIONS_PATH = os.path.join(ROOT_PATH, "generations")  # 数据集版本目录,须与TRADE_RECORD_PATH在同一文件系统
 
-if not os.path.exists(DATA_PACKAGE_PATH):
-    os.mkdir(DATA_PACKAGE_PATH)
-if not os.path.exists(SQL_PATH):
-    os.mkdir(SQL_PATH)
-if not os.path.exists(TRADE_RECORD_PATH):
-    os.mkdir(TRADE_RECORD_PATH)
-if not os.path.exists(TEST_CONDITION_PATH):
-    os.mkdir(TEST_CONDITION_PATH)
-if not os.path.exists(STOCK_MOS_IMG):
-    os.mkdir(STOCK_MOS_IMG)
-if not os.path.exists(INDEX_MOS_IMG):
-    os.mkdir(INDEX_MOS_IMG)
-if not os.path.exists(INDEX_UP_DOWN_IMG):
-    os.mkdir(INDEX_UP_DOWN_IMG)
-if not os.path.exists(STOCK_UP_DOWN_IMG):
-    os.mkdir(STOCK_UP_DOWN_IMG)
+DIRECTORIES = [
+    DATA_PACKAGE_PATH, GENERATIONS_PATH, SQL_PATH, TRADE_RECORD_PATH, TEST_CONDITION_PATH,
+    STOCK_MOS_IMG, INDEX_MOS_IMG, INDEX_UP_DOWN_IMG, STOCK_UP_DOWN_IMG,
+]
+
+_dirs_ready = False
+
+def ensure_dirs() -> None:
+    """
+    创建内置目录,已存在时不做任何操作
+    NOTE:
+    导入本模块没有文件系统副作用,由写入数据的入口(各sqlite3连接函数 数据更新和定时任务入口)调用.
+    每个进程只检查一次,目录在进程运行期间被删除时不会重建.
+    """
+    global _dirs_ready
+    if _dirs_ready:
+        return
+    for directory in DIRECTORIES:
+        os.makedirs(directory, exist_ok=True)
+    _dirs_ready = True
 
 # 内置文件
 # SW_INDUSTRY_PATH = os.path.join(ROOT_PATH, "stock-list")
@@ -37,19 +41,30 @@ INDICATOR_ROE_FROM_1991 = os.path.join(ROOT_PATH, "data-package", "indicator-roe
 CURVE_SQLITE3 = os.path.join(ROOT_PATH, "data-package", "curve.sqlite3")  # 国债收益率曲线数据文件
 TEST_CONDITION_SQLITE3 = os.path.join(ROOT_PATH, "test-condition", "test-condition.sqlite3")  # 测试条件数据文件
 INDEX_VALUE = os.path.join(ROOT_PATH, "data-package", "index-value.sqlite3")  # 指数数据文件
+TRADE_CAL_SQLITE3 = os.path.join(ROOT_PATH, "data-package", "trade-cal.sqlite3")  # 交易日历数据文件
+JOURNAL_SQLITE3 = os.path.join(ROOT_PATH, "data-package", "journal.sqlite3")  # 批量数据作业日志文件
+DATASOURCE_PATH = os.path.join(ROOT_PATH, "data-package", "datasource-records")  # 接口录制数据目录
+INTEGRITY_REPORT = os.path.join(ROOT_PATH, "data-package", "integrity-report.json")  # 完整性检查报告文件
+CHINABOND_CACHE_PATH = os.path.join(ROOT_PATH, "data-package", "chinabond-cache")  # 中债收益率原始响应缓存目录
 
 # if not os.path.exists(SW_INDUSTRY_XLS):
 #     raise FileNotFoundError(f"未在{SW_INDUSTRY_PATH}发现申万行业分类清单文件,请检查.")
 # SW_INDUSTRY_DF = pd.read_excel(SW_INDUSTRY_XLS, usecols=['股票代码', '公司简称', '新版一级行业'])
 
 # 数据库表名
-ROE_TABLE = "indicators"  # indicator-roe-from-1991.sqlite3中的表
+ROE_TABLE = "indicators"  # indicator-roe-from-1991.sqlite3中由长表生成的宽表
+ROE_LONG_TABLE = "roe"  # indicator-roe-from-1991.sqlite3中的年度ROE长表
+ROE_STOCK_TABLE = "stocks"  # indicator-roe-from-1991.sqlite3中的股票清单
+ROE_STAGING_TABLE = "roe_staging"  # indicator-roe-from-1991.sqlite3中按报告期批量创建时的暂存长表
 CURVE_TABLE = "curve"  # curve.sqlite3中的表
+TRADE_CAL_TABLE = "trade_cal"  # trade-cal.sqlite3中的表
+JOURNAL_JOB_TABLE = "jobs"  # journal.sqlite3中的作业表
+JOURNAL_UNIT_TABLE = "units"  # journal.sqlite3中的作业单元表
+TELEMETRY_TABLE = "metrics"  # journal.sqlite3中的单元指标表
 NEW_TABLE_MONTH = 5  # 新年度表格生成月份
 
-# iMac和MACBOOK仓库路径
-MACBOOK_REPOSITORY_PATH = os.environ["MACBOOK_REPOSITORY_PATH"]
-IMAC_REPOSITORY_PATH = os.environ["IMAC_REPOSITORY_PATH"]
+# iMac和MACBOOK仓库路径,在使用时才读取环境变量,见模块末尾的__getattr__
+REPOSITORY_PATHS = ("MACBOOK_REPOSITORY_PATH", "IMAC_REPOSITORY_PATH")
 
 # 策略参数
 STRATEGIES = ['ROE-DIVIDEND', 'ROE-MOS', 'ROE-MOS-DIVIDEND', 'ROE-MOS-MULTI-YIELD', 'ROE']  # 策略名称
@@ -62,7 +77,54 @@ MOS_RANGE = [-1, 1]  # MOS范围
 DV_LIST = [0, 10]  # 股息率范围
 COVER_YEARS = 1  # 重新测试时向前覆盖年数
 
+# Tushare抓取参数
+TUSHARE_CALLS_PER_MINUTE = 500  # 积分档位对应的每分钟接口调用次数
+FETCH_WORKERS = 8  # 抓取管道最大并发线程数
+FETCH_RETRIES = 3  # 接口调用失败后的最多重试次数
+TRADE_UPDATE_MAX_DAYS = 20  # 按交易日批量更新时最多回溯的交易日数,更落后的股票不再拉长获取区间
+TRADE_UPDATE_CHUNK_DAYS = 5  # 按交易日批量更新时每段获取和写入的交易日数
+
+# 中债信息网抓取参数
+CHINABOND_WORKERS = 4  # 最大并发请求数,同时也是每个线程连接池的大小
+CHINABOND_RETRIES = 3  # 请求失败或服务端错误后的最多重试次数
+
+# 完整性检查参数,见integrity模块
+INTEGRITY_WORKERS = os.cpu_count() or 4  # 校验交易记录文件的进程数
+INTEGRITY_MAX_GAP = 60  # 允许的最长连续缺失交易日数,超过时在报告中标记gaps,不自动修复
+INTEGRITY_PB_STREAK = 20  # 允许的PB为空值或0的最长连续交易日数
+INTEGRITY_MAX_LAG = 1  # 最新日期允许落后于最近交易日的交易日数,超过时在报告中标记stale,不自动修复
+
+# 夜间刷新参数,见pipeline模块
+PIPELINE_JOB = "nightly"  # journal中的作业名称
+PIPELINE_START = "18:30"  # 每个交易日开始刷新的时间
+PIPELINE_DEADLINE = "23:30"  # 等待当日数据发布的最迟时间
+PIPELINE_POLL_SECONDS = 300  # 轮询当日数据是否发布的间隔秒数
+PIPELINE_WORKERS = 4  # 最大并行阶段数
+
+# 数据集版本参数,见generation模块
+GENERATIONS_KEEP = 2  # 保留的版本数,含当前版本
+
+# 作业指标参数,见telemetry模块
+TELEMETRY_DAYS = 30  # 指标报告默认覆盖的天数
+
+# 数据源参数,见datasource模块
+DATASOURCE_MODE = os.environ.get("QUANT_DATASOURCE", "live")  # live record or replay
+DATASOURCE_LATENCY = float(os.environ.get("QUANT_DATASOURCE_LATENCY", "0"))  # 重放时每次调用的模拟延迟秒数
+DATASOURCE_ERROR_RATE = float(os.environ.get("QUANT_DATASOURCE_ERROR_RATE", "0"))  # 重放时模拟限流错误的概率
+
+# 热点函数剖析开关,见profiling模块
+PROFILE_ENABLED = os.environ.get("QUANT_PROFILE", "0") not in ("", "0")  # 是否记录被剖析函数的调用次数和耗时
+
+def __getattr__(name: str) -> str:
+    # 仓库路径只用于同步测试条件数据库,没有设置环境变量时不影响导入和回测
+    if name in REPOSITORY_PATHS:
+        value = os.environ.get(name)
+        if not value:
+            raise RuntimeError(f"未设置环境变量{name},请设置本地仓库路径.")
+        return value
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
 if __name__ == "__main__":
     print(f"ROOT_PATH: {ROOT_PATH}")
-    print(f"MACBOOK_REPOSITORY_PATH: {MACBOOK_REPOSITORY_PATH}")
-    print(f"IMAC_REPOSITORY_PATH: {IMAC_REPOSITORY_PATH}")
\ No newline at end of file
+    for name in REPOSITORY_PATHS:
+        print(f"{name}: {os.environ.get(name)}")
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+夜间数据刷新的依赖图调度.
+各阶段声明所依赖的阶段,没有依赖关系的阶段并行执行,一个阶段在其全部依赖成功完成后立即开始,
+整个刷新的耗时等于依赖图的关键路径.任一阶段失败时,依赖它的阶段被跳过,其它分支继续执行.
+每次运行作为journal中名为PIPELINE_JOB的作业,每个阶段作为一个单元记录状态 错误信息 耗时和telemetry指标,
+python telemetry.py报告各阶段耗时的p50/p95.
+阶段依赖:
+    calendar ─┬─ curve ─────────┬─ index-mos
+              ├─ index-value ───┼─ publish
+              └─ trade-records ─┴─ integrity
+publish在三个数据集都更新后发布新的数据集版本,auto_test从下一个测试条件开始读取新版本.
+NOTE:
+Tushare的当日数据发布时间不固定,index-value和trade-records阶段先轮询当日数据是否已发布,
+发布后再更新,最迟等到PIPELINE_DEADLINE,不再依赖固定的启动时间.
+catch_up=True时,如果最近一次成功运行之后还有未刷新的交易日,立即运行一次;各更新函数都是增量更新,
+一次运行即可补齐全部错过的交易日.
+启动时的补齐与定时的夜间刷新可能同时触发,已有一次刷新在运行时后触发的一次直接跳过.
+"""
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import journal
+import telemetry
+import tradecal
+from path import PIPELINE_JOB, PIPELINE_START, PIPELINE_WORKERS, PIPELINE_POLL_SECONDS, PIPELINE_DEADLINE
+
+INDEXES = ["000300", "000905", "399006"]  # 需要更新的指数
+
+_running = threading.Lock()  # 同一进程内只允许一次夜间刷新运行
+
+class Stage(NamedTuple):
+    """
+    依赖图中的一个阶段
+    name: 阶段名称, 例如: 'curve'
+    func: 无参数的阶段函数
+    deps: 依赖的阶段名称
+    """
+    name: str
+    func: Callable
+    deps: Tuple[str, ...] = ()
+
+def check_stages(stages: List[Stage]) -> None:
+    """
+    检查阶段名称唯一,依赖存在且没有环
+    :param stages: 阶段列表
+    :return: None
+    """
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f'阶段名称重复: {names}')
+    deps = {stage.name: set(stage.deps) for stage in stages}
+    for name, items in deps.items():
+        if not items <= deps.keys():
+            raise ValueError(f'{name}依赖不存在的阶段: {sorted(items - deps.keys())}')
+    done = set()
+    while len(done) < len(deps):
+        ready = [name for name, items in deps.items() if name not in done and items <= done]
+        if not ready:
+            raise ValueError(f'阶段依赖存在环: {sorted(deps.keys() - done)}')
+        done.update(ready)
+
+def run_stages(stages: List[Stage], job_id: int = None, max_workers: int = PIPELINE_WORKERS) -> Dict[str, str]:
+    """
+    按依赖关系执行阶段
+    :param stages: 阶段列表
+    :param job_id: journal作业编号,为None时不记录
+    :param max_workers: 最大并行阶段数
+    :return: {阶段名称: 'done' or 'failed' or 'skipped'}
+    """
+    check_stages(stages)
+    status = {}
+    durations = {}
+    counters = {}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    def timed(stage: Stage) -> float:
+        start = time.monotonic()
+        with telemetry.collect() as counters[stage.name]:
+            try:
+                stage.func()
+            finally:
+                durations[stage.name] = time.monotonic() - start
+        return durations[stage.name]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(status.get(dep) in ('failed', 'skipped') for dep in stage.deps):
+                    status[name] = 'skipped'
+                    del pending[name]
+                    print(f'[{name}] 依赖阶段未完成,跳过.' + ' '*20, flush=True)
+                elif all(status.get(dep) == 'done' for dep in stage.deps):
+                    running[executor.submit(timed, stage)] = name
+                    del pending[name]
+                    print(f'[{name}] 开始.' + ' '*20, flush=True)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                status[name] = 'done' if error is None else 'failed'
+                if job_id is not None:
+                    journal.record_unit(job_id, name, error, durations.get(name, 0.0), counters=counters.get(name))
+                message = '完成' if error is None else f'失败: {type(error).__name__}: {error}'
+                print(f'[{name}] {message}, 耗时{durations.get(name, 0.0):.1f}秒.' + ' '*20, flush=True)
+    return status
+
+def wait_for_data(check: Callable[[], bool], title: str, poll: float = PIPELINE_POLL_SECONDS,
+                  deadline: str = PIPELINE_DEADLINE) -> None:
+    """
+    轮询直到当日数据已发布
+    :param check: 返回当日数据是否已发布的函数
+    :param title: 数据名称
+    :param poll: 轮询间隔秒数
+    :param deadline: 最迟等待时间, 例如: '23:30',超过后抛出TimeoutError
+    :return: None
+    """
+    hour, minute = map(int, deadline.split(':'))
+    stop = datetime.datetime.combine(datetime.date.today(), datetime.time(hour, minute))
+    while not check():
+        if datetime.datetime.now() >= stop:
+            raise TimeoutError(f'{title}在{deadline}前没有发布当日数据')
+        time.sleep(poll)
+
+def target_trade_day(now: datetime.datetime = None) -> str:
+    """
+    本次刷新应覆盖的最近交易日,当日只在PIPELINE_START之后计入,避免在数据发布前等待
+    :param now: 当前时间,默认为datetime.datetime.now()
+    :return: 交易日, 例如: '20240603'
+    """
+    now = now if now is not None else datetime.datetime.now()
+    hour, minute = map(int, PIPELINE_START.split(':'))
+    end = now.date() if now.time() >= datetime.time(hour, minute) else now.date() - datetime.timedelta(days=1)
+    return tradecal.prev_trade_day(end.strftime('%Y%m%d'))
+
+def published(api: str, **kwargs) -> bool:
+    """
+    target_trade_day()的数据是否已在Tushare发布
+    :param api: 接口名称, 例如: 'daily_basic'
+    :param kwargs: 接口参数
+    :return: 是否已发布
+    """
+    import fetch
+    df = getattr(fetch.pro_api(), api)(trade_date=target_trade_day(), **kwargs)
+    return df is not None and not df.empty
+
+def sync_calendar() -> None:
+    """阶段calendar: 补充本地交易日历并载入内存"""
+    tradecal.get_calendar()
+
+def update_curve() -> None:
+    """阶段curve: 更新国债收益率表"""
+    import data
+    data.update_curve_value_table()
+
+def update_index_values() -> None:
+    """阶段index-value: 当日指数估值发布后更新指数估值数据库"""
+    import data
+    wait_for_data(lambda: published('index_dailybasic', ts_code='000300.SH', fields='trade_date'), '指数估值')
+    for index in INDEXES:
+        data.update_index_indicator_table(index)
+
+def update_trade_records() -> None:
+    """阶段trade-records: 当日全市场每日指标发布后按交易日更新交易记录文件"""
+    import data
+    wait_for_data(lambda: published('daily_basic', ts_code='000001.SZ', fields='trade_date'), '每日指标')
+    data.update_trade_record_csv_by_date()
+
+def report_index_mos() -> None:
+    """阶段index-mos: 以最新指数估值和国债收益率计算并打印各指数的MOS"""
+    import utils
+    day = target_trade_day()
+    day = f'{day[0:4]}-{day[4:6]}-{day[6:8]}'
+    values = [f'{index}: {utils.calculate_index_MOS_from_2006(index, day):.4f}' for index in INDEXES]
+    print(f'{day}指数MOS ' + ', '.join(values) + ' '*20, flush=True)
+
+def publish_generation() -> None:
+    """阶段publish: 发布新的数据集版本"""
+    import generation
+    print(f'数据集版本{generation.publish()}已发布.' + ' '*20, flush=True)
+
+def check_integrity() -> None:
+    """阶段integrity: 深度完整性检查并写入报告"""
+    import integrity
+    report = integrity.scan()
+    integrity.write_report(report)
+    integrity.print_summary(report)
+
+def nightly_stages() -> List[Stage]:
+    """
+    夜间刷新的阶段列表
+    :return: 阶段列表
+    """
+    return [
+        Stage('calendar', sync_calendar),
+        Stage('curve', update_curve, ('calendar',)),
+        Stage('index-value', update_index_values, ('calendar',)),
+        Stage('trade-records', update_trade_records, ('calendar',)),
+        Stage('index-mos', report_index_mos, ('curve', 'index-value')),
+        Stage('publish', publish_generation, ('curve', 'index-value', 'trade-records')),
+        Stage('integrity', check_integrity, ('trade-records',)),
+    ]
+
+def missed_trade_days() -> List[str]:
+    """
+    最近一次成功运行之后尚未刷新的交易日
+    :return: 升序排列的交易日列表,从未成功运行时只包含最近交易日
+    """
+    target = target_trade_day()
+    _, started = journal.last_done_job(PIPELINE_JOB)
+    if started is None:
+        return [target] if target else []
+    covered = target_trade_day(datetime.datetime.fromtimestamp(started))  # 上次运行覆盖到的交易日
+    return [day for day in tradecal.get_trade_days(covered, target) if day > covered]
+
+def run_nightly(catch_up: bool = False, resume: bool = False) -> Dict[str, str]:
+    """
+    执行一次夜间刷新
+    :param catch_up: True时只在有错过的交易日时运行,用于启动时补齐;False时只在交易日运行
+    :param resume: 是否继续当日未完成的刷新,已完成的阶段不再执行
+    :return: {阶段名称: 状态},没有运行时为空字典
+    NOTE:
+    已有一次刷新在运行时不再运行,两次刷新会以同一作业名称写入journal并重复更新同样的数据.
+    """
+    if not _running.acquire(blocking=False):
+        print('夜间刷新正在运行, 跳过本次触发.' + ' '*20, flush=True)
+        return {}
+    try:
+        return _run_nightly(catch_up, resume)
+    finally:
+        _running.release()
+
+def _run_nightly(catch_up: bool, resume: bool) -> Dict[str, str]:
+    """
+    执行一次夜间刷新,参数和返回值同run_nightly,调用方持有_running
+    """
+    if catch_up:
+        missed = missed_trade_days()
+        if not missed:
+            return {}
+        print(f'补齐{missed[0]}至{missed[-1]}共{len(missed)}个交易日的数据.' + ' '*20, flush=True)
+    elif not tradecal.is_trade_day():
+        return {}
+    job_id = journal.start_job(PIPELINE_JOB, resume)
+    done = journal.done_units(job_id)
+    # 已完成的阶段以空函数代替,保留依赖关系
+    stages = [stage._replace(func=lambda: None) if stage.name in done else stage for stage in nightly_stages()]
+    start = time.monotonic()
+    status = run_stages(stages, job_id)
+    journal.finish_job(job_id)
+    print(f'夜间刷新结束, 总耗时{time.monotonic()-start:.1f}秒: {status}' + ' '*20, flush=True)
+    return status
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='执行一次夜间数据刷新')
+    parser.add_argument('--catch-up', action='store_true', help='只在有错过的交易日时运行')
+    parser.add_argument('--resume', action='store_true', help='继续上一次未完成的刷新,跳过已完成的阶段')
+    args = parser.parse_args()
+    run_nightly(catch_up=args.catch_up, resume=args.resume)
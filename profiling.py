@@ -0,0 +1,148 @@
+"""
+回测热点函数剖析.
+环境变量QUANT_PROFILE=1时启用,以profiled装饰的函数记录调用次数 累计耗时和最大耗时,
+以及函数执行期间读取CSV文件的次数 字节数和sqlite查询次数.
+用法:
+    QUANT_PROFILE=1 python strategy.py  # test_strategy_random_condition结束时打印报告
+    kill -USR1 <pid>  # 运行中随时打印报告
+NOTE:
+未启用时profiled直接返回原函数,没有任何额外开销;是否启用在导入时决定,须在启动进程前设置环境变量.
+启用后替换pandas.read_csv和sqlite3.connect以计数,连接通过set_trace_callback统计每条执行的SQL语句.
+CSV读取和sqlite查询计入当前线程调用栈中的全部被剖析函数,与累计耗时一样是包含子调用的.
+字节数为CSV文件大小,指定usecols或nrows时实际解析的数据更少.
+每个进程各自统计,多进程测试时各工作进程分别报告.
+"""
+import os
+import time
+import signal
+import sqlite3
+import threading
+import functools
+from typing import Callable, Dict
+from path import PROFILE_ENABLED
+
+ENABLED = PROFILE_ENABLED
+FIELDS = ('calls', 'seconds', 'max_seconds', 'csv_reads', 'csv_bytes', 'sqlite_queries')
+UNPROFILED = '<unprofiled>'  # 不在任何被剖析函数内的读取
+
+_stats = {}  # {函数名称: {FIELDS中的字段: 值}}
+_lock = threading.RLock()  # SIGUSR1报告在主线程中执行,可能打断持有锁的代码
+_local = threading.local()  # 每个线程当前的被剖析函数调用栈
+
+def _stack() -> list:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _entry(name: str) -> Dict:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = dict.fromkeys(FIELDS, 0)
+    return entry
+
+def profiled(func: Callable) -> Callable:
+    """
+    装饰器,启用时记录函数的调用次数 累计耗时和最大耗时
+    :param func: 函数或方法
+    :return: 未启用时返回func本身
+    """
+    if not ENABLED:
+        return func
+    name = f'{func.__module__}.{func.__qualname__}'
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with _lock:
+                entry = _entry(name)
+                entry['calls'] += 1
+                entry['seconds'] += elapsed
+                entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+    return wrapper
+
+def count_io(field: str, value: int = 1) -> None:
+    """
+    将一次读取计入当前线程调用栈中的全部被剖析函数
+    :param field: 'csv_reads' 'csv_bytes' or 'sqlite_queries'
+    :param value: 增加的数量
+    """
+    names = set(_stack()) or {UNPROFILED}
+    with _lock:
+        for name in names:
+            _entry(name)[field] += value
+
+def _patch_read_csv() -> None:
+    import pandas as pd
+    read_csv = pd.read_csv
+    @functools.wraps(read_csv)
+    def counted_read_csv(filepath_or_buffer, *args, **kwargs):
+        count_io('csv_reads')
+        if isinstance(filepath_or_buffer, (str, os.PathLike)) and os.path.exists(filepath_or_buffer):
+            count_io('csv_bytes', os.path.getsize(filepath_or_buffer))
+        return read_csv(filepath_or_buffer, *args, **kwargs)
+    pd.read_csv = counted_read_csv
+
+def _patch_sqlite3_connect() -> None:
+    connect = sqlite3.connect
+    @functools.wraps(connect)
+    def traced_connect(*args, **kwargs):
+        con = connect(*args, **kwargs)
+        con.set_trace_callback(lambda statement: count_io('sqlite_queries'))
+        return con
+    sqlite3.connect = traced_connect
+
+def snapshot() -> Dict[str, Dict]:
+    """
+    当前的统计结果
+    :return: {函数名称: {'calls', 'seconds', 'max_seconds', 'csv_reads', 'csv_bytes', 'sqlite_queries'}}
+    """
+    with _lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
+
+def reset() -> None:
+    """
+    清空统计结果
+    """
+    with _lock:
+        _stats.clear()
+
+def report(title: str = '') -> None:
+    """
+    按累计耗时降序打印统计结果,未启用或没有数据时不打印
+    :param title: 报告标题
+    """
+    stats = snapshot()
+    if not ENABLED or not stats:
+        return
+    print('+'*120)
+    print(f'热点函数剖析{title}(进程{os.getpid()}):')
+    print(f"{'函数':<60}{'调用':>10}{'累计秒':>10}{'平均毫秒':>10}{'最大毫秒':>10}{'CSV':>8}{'CSV MB':>10}{'SQL':>8}")
+    for name, entry in sorted(stats.items(), key=lambda item: item[1]['seconds'], reverse=True):
+        mean = entry['seconds'] / entry['calls'] * 1000 if entry['calls'] else 0.0
+        print(
+            f"{name[-60:]:<60}{entry['calls']:>10}{entry['seconds']:>10.2f}{mean:>10.2f}"
+            f"{entry['max_seconds']*1000:>10.2f}{entry['csv_reads']:>8}{entry['csv_bytes']/2**20:>10.1f}"
+            f"{entry['sqlite_queries']:>8}"
+        )
+
+def install() -> None:
+    """
+    替换pandas.read_csv和sqlite3.connect以计数,并注册SIGUSR1打印报告,启用时在导入本模块时调用
+    """
+    _patch_read_csv()
+    _patch_sqlite3_connect()
+    if hasattr(signal, 'SIGUSR1'):  # Windows没有SIGUSR1
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: report('(SIGUSR1)'))
+        except ValueError:  # 只能在主线程注册
+            pass
+
+if ENABLED:
+    install()
@@ -0,0 +1,176 @@
+"""
+测试条件稳健性评估.
+evaluate_portfolio_effect给出的inner_rate basic_ratio down_max都是单点估计,本模块对测试条件表中保存的
+有效时间组收益率序列(rate_list)和超额收益序列(delta_rate)做分块自助法(block bootstrap)重抽样,
+不重新回测即可得到inner_rate和score的置信区间.
+NOTE:
+长度相同的序列共用同一组重抽样下标,全部测试条件按序列长度分组后以NumPy数组一次计算.
+rate_list和delta_rate字段是后新增的,此前保存的测试条件没有序列数据,不参与评估.
+"""
+import os
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import Union
+from path import TEST_CONDITION_SQLITE3, TEST_CONDITION_PATH
+
+# 与Strategy.calculate_score_of_test_condition一致的评分阈值(升序)和对应得分
+INNER_RATE_BINS, INNER_RATE_SCORES = [0.06, 0.1, 0.15, 0.2, 0.25], [0, 60, 70, 80, 90, 100]
+VALID_PERCENT_BINS, VALID_PERCENT_SCORES = [0.3, 0.4, 0.5, 0.6, 0.7], [0, 60, 70, 80, 90, 100]
+BASIC_RATIO_BINS, BASIC_RATIO_SCORES = [0.6, 0.7, 0.75, 0.8, 0.85], [0, 60, 70, 80, 90, 100]
+DOWN_MAX_BINS, DOWN_MAX_SCORES = [-0.3, -0.2, -0.1, 0], [60, 70, 80, 90, 100]
+
+def calculate_score_array(
+    inner_rate: np.ndarray, valid_percent: np.ndarray, basic_ratio: np.ndarray, down_max: np.ndarray
+) -> np.ndarray:
+    """
+    Strategy.calculate_score_of_test_condition的数组版本
+    :param inner_rate: 内在收益率数组
+    :param valid_percent: 有效时间组占比数组
+    :param basic_ratio: 对000300的胜率数组
+    :param down_max: 有效时间组最大回撤数组
+    :return: 综合评分数组
+    """
+    def grade(values, bins, scores):
+        return np.asarray(scores, dtype=float)[np.digitize(values, bins, right=False)]
+    return grade(inner_rate, INNER_RATE_BINS, INNER_RATE_SCORES)*0.5 \
+        + grade(valid_percent, VALID_PERCENT_BINS, VALID_PERCENT_SCORES)*0.05 \
+        + grade(basic_ratio, BASIC_RATIO_BINS, BASIC_RATIO_SCORES)*0.30 \
+        + grade(down_max, DOWN_MAX_BINS, DOWN_MAX_SCORES)*0.15
+
+def block_bootstrap_indices(
+    length: int, resamples: int, block_size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    生成循环分块自助法的重抽样下标
+    :param length: 序列长度
+    :param resamples: 重抽样次数
+    :param block_size: 块长度,保留相邻时间组之间的相关性
+    :param rng: 随机数生成器
+    :return: (resamples, length)的下标数组
+    """
+    block_size = max(1, min(block_size, length))
+    blocks = -(-length // block_size)  # 向上取整
+    starts = rng.integers(0, length, size=(resamples, blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)) % length
+    return indices.reshape(resamples, blocks*block_size)[:, :length]
+
+def bootstrap_series(
+    rate_list: np.ndarray,
+    delta_rate: np.ndarray,
+    holding_time: np.ndarray,
+    valid_percent: np.ndarray,
+    resamples: int = 2000,
+    block_size: int = 3,
+    alpha: float = 0.05,
+    rng: np.random.Generator = None,
+    max_cells: int = 2*10**7
+) -> pd.DataFrame:
+    """
+    对长度相同的一组序列做分块自助法重抽样
+    :param rate_list: (测试条件数, 序列长度)的有效时间组收益率
+    :param delta_rate: (测试条件数, 序列长度)的有效时间组超额收益
+    :param holding_time: 各测试条件的持股时间(月)
+    :param valid_percent: 各测试条件的有效时间组占比
+    :param resamples: 重抽样次数
+    :param block_size: 块长度
+    :param alpha: 置信区间为[alpha/2, 1-alpha/2]分位数
+    :param rng: 随机数生成器
+    :param max_cells: 每批计算的最大数组元素个数,用于控制内存
+    :return: 各测试条件的置信区间
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    count, length = rate_list.shape
+    indices = block_bootstrap_indices(length, resamples, block_size, rng)
+    exponent = 12 / (length * np.asarray(holding_time, dtype=float))
+    quantiles = [alpha/2, 0.5, 1-alpha/2]
+    step = max(1, max_cells // (resamples*length))
+    frames = []
+    for first in range(0, count, step):
+        part = slice(first, first+step)
+        rates = rate_list[part][:, indices]  # (批量, resamples, length)
+        deltas = delta_rate[part][:, indices]
+        inner_rate = np.prod(1 + rates, axis=2) ** exponent[part, None] - 1
+        basic_ratio = (deltas > 0).mean(axis=2)
+        down_max = rates.min(axis=2)
+        score = calculate_score_array(
+            np.round(inner_rate, 4), valid_percent[part, None], np.round(basic_ratio, 4), np.round(down_max, 4)
+        )
+        inner_q = np.quantile(inner_rate, quantiles, axis=1)
+        score_q = np.quantile(score, quantiles, axis=1)
+        frames.append(pd.DataFrame({
+            'inner_rate_low': inner_q[0], 'inner_rate_median': inner_q[1], 'inner_rate_high': inner_q[2],
+            'score_low': score_q[0], 'score_median': score_q[1], 'score_high': score_q[2],
+            'score_pass': (score >= 85).mean(axis=1),  # 重抽样中仍达到保存标准的比例
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def evaluate_conditions_robustness(
+    table_name: str,
+    sqlite_file: str = TEST_CONDITION_SQLITE3,
+    resamples: int = 2000,
+    block_size: int = 3,
+    alpha: float = 0.05,
+    seed: int = None
+) -> Union[pd.DataFrame, None]:
+    """
+    评估测试条件表中全部测试条件的稳健性
+    :param table_name: sqlite3数据库表名
+    :param sqlite_file: sqlite3数据库文件名
+    :param resamples: 重抽样次数
+    :param block_size: 块长度(时间组个数)
+    :param alpha: 置信区间为[alpha/2, 1-alpha/2]分位数
+    :param seed: 随机数种子,便于复现
+    :return: 每个测试条件一行,包括原评估值和inner_rate score的置信区间,按score_low降序排列
+    """
+    if not os.path.exists(sqlite_file):
+        return
+    con = sqlite3.connect(sqlite_file)
+    with con:
+        existed = {row[1] for row in con.execute(f"PRAGMA table_info('{table_name}')")}
+        if 'rate_list' not in existed:
+            return
+        sql = f"""
+            SELECT strategy, test_condition, valid_percent, basic_ratio, inner_rate, down_max,
+            score, rate_list, delta_rate FROM '{table_name}'
+            WHERE rate_list IS NOT NULL AND rate_list != 'null'
+        """
+        df = pd.read_sql_query(sql, con)
+    if df.empty:
+        return
+    rate_lists = [json.loads(item) for item in df['rate_list']]
+    delta_rates = [json.loads(item) for item in df['delta_rate']]
+    df['holding_time'] = [json.loads(item).get('holding_time', 12) for item in df['test_condition']]
+    df['length'] = [len(item) for item in rate_lists]
+    df = df[df['length'] > 0]
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for length, group in df.groupby('length'):
+        positions = group.index.to_numpy()
+        result = bootstrap_series(
+            rate_list=np.array([rate_lists[i] for i in positions], dtype=float),
+            delta_rate=np.array([delta_rates[i] for i in positions], dtype=float),
+            holding_time=group['holding_time'].to_numpy(),
+            valid_percent=group['valid_percent'].to_numpy(dtype=float),
+            resamples=resamples, block_size=block_size, alpha=alpha, rng=rng
+        )
+        result.index = positions
+        frames.append(result)
+    result = df.drop(columns=['rate_list', 'delta_rate', 'length']).join(pd.concat(frames))
+    result = result.sort_values(by=['score_low', 'inner_rate_low'], ascending=False).reset_index(drop=True)
+    return result
+
+if __name__ == '__main__':
+    import time
+    now = time.localtime()
+    table_name = f'condition-{now.tm_year}' if now.tm_mon >= 5 else f'condition-{now.tm_year-1}'
+    start = time.time()
+    df = evaluate_conditions_robustness(table_name=table_name)
+    if df is None:
+        print(f"{table_name}表格中没有可评估的测试条件.")
+    else:
+        file_name = os.path.join(TEST_CONDITION_PATH, "conditions-robustness.xlsx")
+        df.to_excel(file_name, index=False)
+        print(f"共评估{len(df)}个测试条件,耗时{time.time()-start:.2f}秒,结果保存在{file_name}.")
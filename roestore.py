@@ -0,0 +1,231 @@
+"""
+年度ROE数据的长表存储.
+INDICATOR_ROE_FROM_1991数据库中:
+ROE_STOCK_TABLE: 股票清单(stockcode, stockname, stockclass)
+ROE_LONG_TABLE: 年度ROE长表(stockcode, year, roe),主键(stockcode, year),另有(year, stockcode)索引
+ROE_STAGING_TABLE: 与长表结构相同的暂存表,按报告期批量创建时先写入暂存表,全部报告期成功后一次替换长表
+ROE_TABLE: 由长表生成的宽表,字段为stockcode stockname stockclass和按年度降序排列的Y开头字段,
+与原indicators表格结构相同,已有的查询无需修改.
+NOTE:
+宽表只在写入时变化,以普通表格物化,回测读取时不再按长表重新聚合.
+写入长表或股票清单后调用refresh_wide_table:指定股票代码且年度不变时只更新这些股票的行,
+出现新年度时整表重建.
+旧版本的indicators宽表在第一次连接时迁移为长表,上一版本的宽表视图替换为物化的宽表.
+迁移只在原数据库上进行,generation版本中的快照以connect_readonly只读打开.
+"""
+import pathlib
+import sqlite3
+from typing import Iterable, List, Tuple
+import telemetry
+from path import ensure_dirs, INDICATOR_ROE_FROM_1991, ROE_TABLE, ROE_LONG_TABLE, ROE_STOCK_TABLE, ROE_STAGING_TABLE
+
+_ENSURED = set()  # 本进程内已检查过结构的数据库文件
+
+def connect(sqlite_file: str = INDICATOR_ROE_FROM_1991) -> sqlite3.Connection:
+    """
+    打开ROE数据库,每个进程第一次打开时创建长表并迁移旧版宽表
+    :param sqlite_file: 数据库文件
+    :return: sqlite3.Connection
+    """
+    ensure_dirs()
+    con = sqlite3.connect(sqlite_file)
+    if sqlite_file not in _ENSURED:
+        with con:
+            ensure_schema(con)
+        _ENSURED.add(sqlite_file)
+    return con
+
+def connect_readonly(sqlite_file: str) -> sqlite3.Connection:
+    """
+    只读打开ROE数据库,不建表也不迁移,用于generation版本中的快照
+    :param sqlite_file: 数据库文件
+    :return: sqlite3.Connection
+    """
+    return sqlite3.connect(pathlib.Path(sqlite_file).resolve().as_uri() + '?mode=ro', uri=True)
+
+def ensure_schema(con: sqlite3.Connection) -> None:
+    """
+    创建股票清单表和ROE长表,ROE_TABLE为旧版宽表时迁移数据,为视图时替换为物化的宽表
+    :param con: sqlite3.Connection
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS '{ROE_STOCK_TABLE}' (
+            stockcode TEXT PRIMARY KEY,
+            stockname TEXT,
+            stockclass TEXT
+        )""")
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS '{ROE_LONG_TABLE}' (
+            stockcode TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            roe REAL,
+            PRIMARY KEY(stockcode, year)
+        ) WITHOUT ROWID""")
+    con.execute(f"""
+        CREATE INDEX IF NOT EXISTS '{ROE_LONG_TABLE}_year' ON '{ROE_LONG_TABLE}' (year, stockcode)
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS '{ROE_STAGING_TABLE}' (
+            stockcode TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            roe REAL,
+            PRIMARY KEY(stockcode, year)
+        ) WITHOUT ROWID""")
+    row = con.execute("SELECT type FROM sqlite_master WHERE name=?", (ROE_TABLE,)).fetchone()
+    if row is None or row[0] == 'view':
+        refresh_wide_table(con)
+    elif con.execute(f"SELECT 1 FROM '{ROE_LONG_TABLE}' LIMIT 1").fetchone() is None:
+        migrate_wide_table(con)  # 长表为空而宽表存在,为旧版本的数据库
+
+def migrate_wide_table(con: sqlite3.Connection) -> None:
+    """
+    将旧版ROE_TABLE宽表迁移为长表,并由长表重建宽表
+    :param con: sqlite3.Connection
+    """
+    columns = [row[1] for row in con.execute(f"PRAGMA table_info('{ROE_TABLE}')")]
+    fields = [column for column in columns[3:] if column.startswith('Y')]
+    rows = con.execute(f"SELECT * FROM '{ROE_TABLE}'").fetchall()
+    upsert_stocks(con, [row[0:3] for row in rows])
+    position = {column: index for index, column in enumerate(columns)}
+    upsert_roe(con, [
+        (row[0], int(field[1:5]), row[position[field]])
+        for row in rows for field in fields if row[position[field]] is not None
+    ])
+    con.execute(f"DROP TABLE '{ROE_TABLE}'")
+    refresh_wide_table(con)
+
+def _pivot_sql(years: List[int], where: str = '') -> str:
+    """
+    由股票清单和长表生成宽表行的查询语句
+    :param years: 降序排列的年度
+    :param where: 附加的WHERE子句
+    :return: SELECT语句,字段为stockcode stockname stockclass和Y开头的年度字段
+    """
+    fields = ''.join(f",\n            MAX(CASE WHEN r.year={year} THEN r.roe END) AS Y{year}" for year in years)
+    return f"""
+        SELECT s.stockcode AS stockcode, s.stockname AS stockname, s.stockclass AS stockclass{fields}
+        FROM '{ROE_STOCK_TABLE}' s LEFT JOIN '{ROE_LONG_TABLE}' r ON r.stockcode = s.stockcode
+        {where}
+        GROUP BY s.stockcode
+        ORDER BY s.rowid
+    """
+
+def refresh_wide_table(con: sqlite3.Connection, stockcodes: Iterable[str] = None) -> None:
+    """
+    由长表刷新ROE_TABLE宽表,字段按年度降序排列
+    :param con: sqlite3.Connection
+    :param stockcodes: 写入过的带后缀股票代码,为None时整表重建
+    NOTE:
+    长表年度与宽表字段不一致时(出现新年度)总是整表重建.
+    只刷新部分股票时原有的行原地更新,保持宽表的行顺序与股票清单一致.
+    """
+    years = get_years(con)
+    fields = [f'Y{year}' for year in years]
+    kind = con.execute("SELECT type FROM sqlite_master WHERE name=?", (ROE_TABLE,)).fetchone()
+    columns = [row[1] for row in con.execute(f"PRAGMA table_info('{ROE_TABLE}')")]
+    if stockcodes is None or kind != ('table',) or columns[3:] != fields:
+        if kind is not None:
+            con.execute(f"DROP {kind[0].upper()} '{ROE_TABLE}'")
+        con.execute(f"CREATE TABLE '{ROE_TABLE}' AS {_pivot_sql(years)}")
+        con.execute(f"CREATE UNIQUE INDEX '{ROE_TABLE}_stockcode' ON '{ROE_TABLE}' (stockcode)")
+        return
+    codes = set(stockcodes)
+    con.executemany(f"""
+        DELETE FROM '{ROE_TABLE}' WHERE stockcode=?
+        AND stockcode NOT IN (SELECT stockcode FROM '{ROE_STOCK_TABLE}')
+    """, [(code,) for code in codes])
+    targets = ', '.join(['stockname', 'stockclass', *fields])
+    con.executemany(f"""
+        UPDATE '{ROE_TABLE}' SET ({targets}) = (
+            SELECT {targets} FROM ({_pivot_sql(years, "WHERE s.stockcode=?")})
+        ) WHERE stockcode=?
+    """, [(code, code) for code in codes])
+    con.executemany(f"""
+        INSERT OR IGNORE INTO '{ROE_TABLE}' {_pivot_sql(years, "WHERE s.stockcode=?")}
+    """, [(code,) for code in codes])
+
+def upsert_stocks(con: sqlite3.Connection, rows: Iterable[Tuple[str, str, str]]) -> None:
+    """
+    批量写入股票清单
+    :param con: sqlite3.Connection
+    :param rows: (stockcode, stockname, stockclass)序列, 例如: [('600000.SH', '浦发银行', '银行')]
+    """
+    sql = f"""
+        INSERT INTO '{ROE_STOCK_TABLE}' (stockcode, stockname, stockclass) VALUES (?, ?, ?)
+        ON CONFLICT(stockcode) DO UPDATE SET stockname=excluded.stockname, stockclass=excluded.stockclass
+    """
+    con.executemany(sql, rows)
+
+def upsert_roe(con: sqlite3.Connection, rows: Iterable[Tuple[str, int, float]], table: str = ROE_LONG_TABLE) -> None:
+    """
+    批量写入年度ROE
+    :param con: sqlite3.Connection
+    :param rows: (stockcode, year, roe)序列, 例如: [('600000.SH', 2023, 8.5)]
+    :param table: ROE_LONG_TABLE or ROE_STAGING_TABLE
+    """
+    sql = f"""
+        INSERT INTO '{table}' (stockcode, year, roe) VALUES (?, ?, ?)
+        ON CONFLICT(stockcode, year) DO UPDATE SET roe=excluded.roe
+    """
+    telemetry.count('rows_written', con.executemany(sql, rows).rowcount)
+
+def clear_staging(con: sqlite3.Connection) -> None:
+    """
+    清空暂存表
+    :param con: sqlite3.Connection
+    """
+    con.execute(f"DELETE FROM '{ROE_STAGING_TABLE}'")
+
+def replace_from_staging(con: sqlite3.Connection, stocks: Iterable[Tuple[str, str, str]]) -> None:
+    """
+    以暂存表的数据替换长表和股票清单,清空暂存表并整表重建宽表
+    :param con: sqlite3.Connection
+    :param stocks: (stockcode, stockname, stockclass)序列
+    NOTE:
+    调用方在一个事务中执行,失败时长表 股票清单和宽表保持原样.
+    """
+    con.execute(f"DELETE FROM '{ROE_LONG_TABLE}'")
+    con.execute(f"DELETE FROM '{ROE_STOCK_TABLE}'")
+    upsert_stocks(con, stocks)
+    cursor = con.execute(f"""
+        INSERT INTO '{ROE_LONG_TABLE}' (stockcode, year, roe)
+        SELECT stockcode, year, roe FROM '{ROE_STAGING_TABLE}'
+        WHERE stockcode IN (SELECT stockcode FROM '{ROE_STOCK_TABLE}')
+    """)
+    telemetry.count('rows_written', cursor.rowcount)
+    clear_staging(con)
+    refresh_wide_table(con)
+
+def delete_stocks(con: sqlite3.Connection, stockcodes: List[str]) -> None:
+    """
+    删除股票及其全部年度ROE
+    :param con: sqlite3.Connection
+    :param stockcodes: 带后缀的股票代码列表, 例如: ['600000.SH']
+    """
+    params = [(code,) for code in stockcodes]
+    con.executemany(f"DELETE FROM '{ROE_LONG_TABLE}' WHERE stockcode=?", params)
+    con.executemany(f"DELETE FROM '{ROE_STOCK_TABLE}' WHERE stockcode=?", params)
+
+def get_years(con: sqlite3.Connection) -> List[int]:
+    """
+    获取长表中已有的年度
+    :param con: sqlite3.Connection
+    :return: 降序排列的年度列表
+    """
+    return [row[0] for row in con.execute(f"SELECT DISTINCT year FROM '{ROE_LONG_TABLE}' ORDER BY year DESC")]
+
+def get_roe_range(con: sqlite3.Connection, stockcode: str, end_year: int, years: int = 7) -> List[float]:
+    """
+    获取截至end_year的连续years个年度ROE,使用主键索引范围查询
+    :param con: sqlite3.Connection
+    :param stockcode: 带后缀的股票代码, 例如: '600000.SH'
+    :param end_year: 截止年度, 例如: 2023
+    :param years: 年度数
+    :return: 按年度降序排列的ROE列表,缺失年度为None
+    """
+    sql = f"""
+        SELECT year, roe FROM '{ROE_LONG_TABLE}'
+        WHERE stockcode=? AND year BETWEEN ? AND ?
+    """
+    values = dict(con.execute(sql, (stockcode, end_year-years+1, end_year)).fetchall())
+    return [values.get(year) for year in range(end_year, end_year-years, -1)]
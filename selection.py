@@ -0,0 +1,115 @@
+"""
+回测选股结果的紧凑表示.
+每个时间组只保存选中股票在股票池中的整数id数组,以及各筛选阶段附加的指标列(NumPy数组),
+股票代码 简称 行业和年度ROE值由全部时间组共享的StockUniverse保存一份.
+只有在显示结果时才通过to_tuples()生成原先的元组形式.
+"""
+import numpy as np
+from typing import Dict, List, Tuple, Sequence
+
+class StockUniverse:
+    """
+    股票池: 整数id到股票代码 简称 行业及年度ROE值的映射,对应ROE_TABLE的一次查询结果.
+    codes: 带后缀的股票代码, 例如: '600000.SH'
+    roe: 二维数组,行为股票id,列为ROE_TABLE中Y开头的年度字段(年份降序),缺失值为NaN
+    """
+    __slots__ = ('codes', 'names', 'classes', 'short_codes', 'roe')
+
+    def __init__(
+        self,
+        codes: Sequence[str],
+        names: Sequence[str],
+        classes: Sequence[str],
+        roe: np.ndarray
+    ):
+        self.codes = list(codes)
+        self.names = list(names)
+        self.classes = list(classes)
+        self.short_codes = [code[0:6] for code in self.codes]
+        self.roe = roe
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+class GroupSelection:
+    """
+    单个时间组的选股结果.
+    ids: 选中股票在universe中的id, int32数组
+    roe_slice: 该时间组使用的ROE年度列范围(start, stop)
+    columns: 各筛选阶段附加的指标列, 例如: {'mos_7': array, 'dv_ttm': array}, 与ids一一对应
+    NOTE:
+    对象创建后不再修改,with_column和filter均返回新对象,多个时间组可以安全地共享同一个对象.
+    """
+    __slots__ = ('universe', 'ids', 'roe_slice', 'columns')
+
+    def __init__(
+        self,
+        universe: StockUniverse,
+        ids: np.ndarray,
+        roe_slice: Tuple[int, int],
+        columns: Dict[str, np.ndarray] = None
+    ):
+        self.universe = universe
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.roe_slice = roe_slice
+        self.columns = columns if columns is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self) -> str:
+        return f"GroupSelection({self.codes()}, columns={list(self.columns)})"
+
+    def codes(self) -> List[str]:
+        """
+        选中股票的代码(不含后缀)
+        :return: 例如: ['600000', '000001']
+        """
+        short_codes = self.universe.short_codes
+        return [short_codes[i] for i in self.ids]
+
+    def roe_values(self) -> np.ndarray:
+        """
+        选中股票在该时间组ROE期间的年度ROE值
+        :return: 二维数组,行与ids对应
+        """
+        start, stop = self.roe_slice
+        return self.universe.roe[self.ids, start:stop]
+
+    def with_column(self, name: str, values: Sequence[float]) -> 'GroupSelection':
+        """
+        附加一列指标
+        :param name: 指标名称, 例如: 'mos_7'
+        :param values: 指标值,长度等于len(self)
+        :return: 新的GroupSelection
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) != len(self.ids):
+            raise ValueError(f'指标{name}的长度应为{len(self.ids)}')
+        columns = dict(self.columns)
+        columns[name] = values
+        return GroupSelection(self.universe, self.ids, self.roe_slice, columns)
+
+    def filter(self, mask: np.ndarray) -> 'GroupSelection':
+        """
+        按布尔数组筛选股票
+        :param mask: 布尔数组,长度等于len(self)
+        :return: 新的GroupSelection
+        """
+        mask = np.asarray(mask, dtype=bool)
+        columns = {name: values[mask] for name, values in self.columns.items()}
+        return GroupSelection(self.universe, self.ids[mask], self.roe_slice, columns)
+
+    def to_tuples(self) -> List[Tuple]:
+        """
+        生成原先的元组形式,仅用于显示.
+        :return: [(股票代码, 股票名称, 申万行业, ROE..., 指标...), ...]
+        """
+        universe = self.universe
+        roe = self.roe_values().tolist()
+        metrics = list(zip(*[values.tolist() for values in self.columns.values()])) \
+            if self.columns else [()] * len(self.ids)
+        return [
+            (universe.codes[i], universe.names[i], universe.classes[i], *roe[n], *metrics[n])
+            for n, i in enumerate(self.ids.tolist())
+        ]
@@ -0,0 +1,253 @@
+"""
+测试条件参数邻域敏感性评估.
+comprehensive_sorting_test_condition_sqlite3排名靠前的测试条件可能只是参数空间中的孤立尖峰,本模块对测试条件的
+ROE(±1) MOS上下限(±0.05) 股息率(±0.5) 国债利率倍数(±0.1)生成参数邻域,一次批量评估全部邻居,
+给出得分曲面和稳定性统计.
+NOTE:
+同一邻域中ROE阶段只有roe_list不同,按(roe_list, period, holding_time, trade_month)只回测一次;
+mos_7 股息率 10年国债利率 个股和指数区间涨幅按(股票代码, 日期)缓存,全部邻居共享,
+每个邻居只是在共享的选股结果上做一次掩码过滤和一次均值计算.
+"""
+import os
+import json
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Literal, Tuple, Union
+import utils
+from strategy import Strategy
+from timegroup import TimeGroup
+from selection import GroupSelection
+from path import TEST_CONDITION_SQLITE3, TEST_CONDITION_PATH, MAX_NUMBERS
+
+# 各参数的邻域步长
+NEIGHBOUR_STEPS = {'roe': 1, 'mos_low': 0.05, 'mos_high': 0.05, 'dividend': 0.5, 'multi_value': 0.1}
+PASS_SCORE = 85  # 与save_strategy_to_sqlite3的保存标准一致
+
+def generate_neighbourhood(condition: Dict, steps: Dict = None, width: int = 1) -> List[Dict]:
+    """
+    生成测试条件的参数邻域
+    :param condition: 测试条件:{'strategy': 'ROE-MOS', 'test_condition': {...}}
+    :param steps: 各参数的步长,默认为NEIGHBOUR_STEPS
+    :param width: 每个参数向两侧扩展的步数
+    :return: 邻居列表,每项为{'offset': {参数: 偏移量}, 'condition': 测试条件},第一项为原测试条件
+    NOTE:
+    holding_time和trade_month决定时间组划分,不参与扰动.mos下限大于上限 ROE小于等于0的组合被剔除,
+    股息率和倍数小于0的组合被剔除.
+    """
+    steps = {**NEIGHBOUR_STEPS, **(steps or {})}
+    test_condition = condition['test_condition']
+    dimensions = ['roe']
+    if 'mos_range' in test_condition:
+        dimensions += ['mos_low', 'mos_high']
+    if 'dividend' in test_condition:
+        dimensions.append('dividend')
+    if 'multi_value' in test_condition:
+        dimensions.append('multi_value')
+
+    multiples = sorted(range(-width, width+1), key=abs)  # 0排在最前,第一项即原测试条件
+    neighbours = []
+    for combination in itertools.product(multiples, repeat=len(dimensions)):
+        offset = {name: round(n*steps[name], 4) for name, n in zip(dimensions, combination)}
+        tmp = dict(test_condition)
+        tmp['roe_list'] = [value + offset['roe'] for value in test_condition['roe_list']]
+        if test_condition.get('roe_value') is not None:
+            tmp['roe_value'] = test_condition['roe_value'] + offset['roe']
+        if min(tmp['roe_list']) <= 0:
+            continue
+        if 'mos_range' in test_condition:
+            low, high = test_condition['mos_range']
+            tmp['mos_range'] = [round(low + offset['mos_low'], 4), round(high + offset['mos_high'], 4)]
+            if tmp['mos_range'][0] > tmp['mos_range'][1]:
+                continue
+        for name in ('dividend', 'multi_value'):
+            if name in test_condition and offset[name]:
+                tmp[name] = round(test_condition[name] + offset[name], 4)
+        if any(tmp.get(name, 0) < 0 for name in ('dividend', 'multi_value')):
+            continue
+        neighbours.append({'offset': offset, 'condition': {'strategy': condition['strategy'], 'test_condition': tmp}})
+    return neighbours
+
+def filter_roe_stage(
+    strategy: str, test_condition: Dict, roe_stage: Dict[TimeGroup, GroupSelection], cache: Dict
+) -> Dict[TimeGroup, GroupSelection]:
+    """
+    在共享的ROE阶段选股结果上执行MOS 股息率 国债利率倍数过滤,过滤顺序和各策略类方法一致
+    :param strategy: 策略名称
+    :param test_condition: 测试条件中的'test_condition'部分
+    :param roe_stage: ROE_only_strategy_backtest_from_1991的返回值
+    :param cache: 查询缓存,全部邻居共享
+    :return: 策略类方法的返回值
+    """
+    result = {}
+    for group, stocks in roe_stage.items():
+        date = group.start_date
+        if 'MOS' in strategy:
+            if group.last_year < 1999:
+                continue
+            stocks = Strategy.attach_mos_column(stocks, date, cache)
+            mos_7 = stocks.columns['mos_7']
+            low, high = test_condition['mos_range']
+            stocks = stocks.filter((mos_7 >= low) & (mos_7 <= high))
+        if strategy in ('ROE-DIVIDEND', 'ROE-MOS-DIVIDEND'):
+            stocks = Strategy.attach_dividend_columns(stocks, date, cache)
+            stocks = stocks.filter(stocks.columns['dv_ratio'] >= max(test_condition['dividend'], 0))
+        elif strategy == 'ROE-MOS-MULTI-YIELD':
+            key = ('yield_10', date)
+            if key not in cache:
+                cache[key] = utils.find_closest_row_in_curve_table(date)["value1"].values[0]
+            multi_yield = cache[key] * test_condition['multi_value']
+            stocks = Strategy.attach_dividend_columns(stocks, date, cache)
+            stocks = stocks.with_column('m_yield', np.full(len(stocks), multi_yield))
+            stocks = stocks.filter(stocks.columns['dv_ratio'] >= multi_yield)
+        result[group] = stocks
+    return result
+
+def portfolio_test_result(
+    result: Dict[TimeGroup, GroupSelection],
+    cache: Dict,
+    index: Literal['000300', '399006', '000905'] = '000300',
+    max_numbers: int = MAX_NUMBERS
+) -> Dict:
+    """
+    Strategy.test_strategy_portfolio的缓存版本,个股和指数的区间涨幅在全部邻居间共享
+    :param result: 策略类方法的返回值
+    :param cache: 查询缓存
+    :param index: 指数代码
+    :param max_numbers: 时间组最大平均选股数量
+    :return: 与test_strategy_portfolio相同
+    """
+    if sum([len(item) for item in result.values()])/len(result) > max_numbers:
+        return {date: [0, 0] for date in result.keys()}
+    test_result = {}
+    for date, stocks in sorted(result.items()):
+        start_date, end_date = date.start_date, date.end_date
+        rates = []
+        for code in stocks.codes():
+            key = ('rise', code, start_date, end_date)
+            if key not in cache:
+                cache[key] = utils.calculate_stock_rising_value(code, start_date, end_date)
+            rates.append(cache[key])
+        key = ('index', index, start_date, end_date)
+        if key not in cache:
+            cache[key] = utils.calculate_index_rising_value(index, start_date, end_date)
+        test_result[date] = [float(np.mean(rates)) if rates else 0.00, cache[key]]
+    return test_result
+
+def evaluate_neighbourhood(
+    neighbours: List[Dict],
+    index: Literal['000300', '399006', '000905'] = '000300',
+    cache: Dict = None
+) -> pd.DataFrame:
+    """
+    批量评估参数邻域
+    :param neighbours: generate_neighbourhood的返回值
+    :param index: 指数代码
+    :param cache: 查询缓存,评估多个邻域时可以传入同一个字典
+    :return: 得分曲面,每个邻居一行,包括各参数偏移量 distance(偏移的参数个数)和评估结果
+    """
+    strategy = Strategy()
+    cache = cache if cache is not None else {}
+    roe_stages = {}
+    rows = []
+    for item in neighbours:
+        condition = item['condition']
+        test_condition = condition['test_condition']
+        stage_key = (
+            tuple(test_condition['roe_list']), test_condition.get('period', len(test_condition['roe_list'])),
+            test_condition.get('holding_time', 12), test_condition.get('trade_month', 6)
+        )
+        if stage_key not in roe_stages:
+            roe_stages[stage_key] = strategy.ROE_only_strategy_backtest_from_1991(
+                roe_list=list(stage_key[0]), period=stage_key[1], holding_time=stage_key[2], trade_month=stage_key[3]
+            )
+        result = filter_roe_stage(condition['strategy'], test_condition, roe_stages[stage_key], cache)
+        row = dict(item['offset'])
+        row['distance'] = sum(1 for value in item['offset'].values() if value != 0)
+        row['test_condition'] = json.dumps(test_condition)
+        if result:
+            evaluate_result = strategy.evaluate_portfolio_effect(
+                condition, result, portfolio_test_result(result, cache, index)
+            )
+            for name in ('valid_groups', 'valid_percent', 'basic_ratio', 'inner_rate', 'down_max', 'score'):
+                row[name] = evaluate_result[name]
+        else:
+            row.update(valid_groups=0, valid_percent=0, basic_ratio=0, inner_rate=0, down_max=0, score=0)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def summarize_surface(surface: pd.DataFrame) -> Dict:
+    """
+    计算得分曲面的稳定性统计
+    :param surface: evaluate_neighbourhood的返回值
+    :return: 字典,center_score为原测试条件得分,pass_ratio为邻居中达到保存标准的比例,
+    stability为邻居得分中位数与原得分之比,越接近1越稳健,明显小于1说明原测试条件是孤立尖峰
+    """
+    center = surface.loc[surface['distance'] == 0, 'score']
+    center_score = float(center.iloc[0]) if not center.empty else 0.0
+    scores = surface.loc[surface['distance'] > 0, 'score'].to_numpy(dtype=float)
+    if scores.size == 0:
+        scores = np.array([center_score])
+    nearest = surface.loc[surface['distance'] == 1, 'score'].to_numpy(dtype=float)
+    return {
+        'center_score': center_score,
+        'neighbours': int(scores.size),
+        'neighbour_median': round(float(np.median(scores)), 2),
+        'neighbour_min': round(float(scores.min()), 2),
+        'neighbour_std': round(float(scores.std()), 2),
+        'nearest_min': round(float(nearest.min()), 2) if nearest.size else center_score,
+        'pass_ratio': round(float((scores >= PASS_SCORE).mean()), 4),
+        'stability': round(float(np.median(scores)) / center_score, 4) if center_score else 0.0,
+    }
+
+def evaluate_condition_sensitivity(
+    condition: Dict,
+    steps: Dict = None,
+    width: int = 1,
+    index: Literal['000300', '399006', '000905'] = '000300'
+) -> Tuple[pd.DataFrame, Dict]:
+    """
+    生成并评估测试条件的参数邻域
+    :param condition: 测试条件:{'strategy': 'ROE-MOS', 'test_condition': {...}}
+    :param steps: 各参数的步长,默认为NEIGHBOUR_STEPS
+    :param width: 每个参数向两侧扩展的步数
+    :param index: 指数代码
+    :return: (得分曲面, 稳定性统计)
+    """
+    surface = evaluate_neighbourhood(generate_neighbourhood(condition, steps, width), index)
+    return surface, summarize_surface(surface)
+
+def load_ranked_condition(
+    table_name: str, rank: int = 0, sqlite_file: str = TEST_CONDITION_SQLITE3, riskmode: int = 0
+) -> Union[Dict, None]:
+    """
+    读取comprehensive_sorting_test_condition_sqlite3排名第rank位的测试条件
+    :param table_name: sqlite3数据库表名
+    :param rank: 排名,从0开始
+    :param sqlite_file: sqlite3数据库文件名
+    :param riskmode: 同comprehensive_sorting_test_condition_sqlite3
+    :return: 测试条件:{'strategy': 'ROE-MOS', 'test_condition': {...}},不存在时返回None
+    """
+    df = Strategy.comprehensive_sorting_test_condition_sqlite3(table_name, sqlite_file, riskmode)
+    if df is None or rank >= len(df):
+        return
+    row = df.iloc[rank]
+    return {'strategy': row['strategy'], 'test_condition': json.loads(row['test_condition'])}
+
+if __name__ == '__main__':
+    import sys
+    import time
+    now = time.localtime()
+    table_name = f'condition-{now.tm_year}' if now.tm_mon >= 5 else f'condition-{now.tm_year-1}'
+    rank = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    condition = load_ranked_condition(table_name, rank)
+    if condition is None:
+        print(f"{table_name}表格中没有排名第{rank}位的测试条件.")
+        sys.exit(0)
+    start = time.time()
+    surface, summary = evaluate_condition_sensitivity(condition)
+    file_name = os.path.join(TEST_CONDITION_PATH, f"sensitivity-{table_name}-{rank}.xlsx")
+    surface.to_excel(file_name, index=False)
+    print(condition)
+    print(summary)
+    print(f"共评估{len(surface)}个邻居,耗时{time.time()-start:.2f}秒,结果保存在{file_name}.")
@@ -4,16 +4,25 @@ import time
 import random
 import datetime
 import json
+import hashlib
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.axes import Axes
-from typing import List, Dict, Union, Literal
+from typing import List, Dict, Set, Union, Literal, Callable, TYPE_CHECKING
 import utils
+import nav
+import generation
+import profiling
 import tsswindustry as sw
+from timegroup import TimeGroup
+from selection import StockUniverse, GroupSelection
+from writer import (ConditionWriter, connect, ensure_condition_table, 
+                insert_condition_sql, evaluate_result_to_row)
 from path import (INDICATOR_ROE_FROM_1991, ROE_TABLE, TEST_CONDITION_SQLITE3, STRATEGIES, 
                 MOS_STEP, HOLDING_TIME, MAX_NUMBERS, ROE_LIST, MOS_RANGE, DV_LIST, TRADE_MONTH)
 
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+
 pd.set_option('display.colheader_justify', 'left')
 pd.set_option('display.max_colwidth', 20)
 
@@ -138,21 +147,11 @@ class Strategy:
         condition = strategy['test_condition']
         print(f"正在执行{name}选股策略,请稍等......")
         print('++'*50)
-        if name.upper() == 'ROE':
-            res = self.ROE_only_strategy_backtest_from_1991(**condition)
-        elif name.upper() == 'ROE-MOS':
-            res = self.ROE_MOS_strategy_backtest_from_1991(**condition)
-        elif name.upper() == 'ROE-DIVIDEND':
-            res = self.ROE_DIVIDEND_strategy_backtest_from_1991(**condition)
-        elif name.upper() == 'ROE-MOS-DIVIDEND':
-            res = self.ROE_MOS_DIVIDEND_strategy_backtest_from_1991(**condition)
-        elif name.upper() == 'ROE-MOS-MULTI-YIELD':
-            res = self.ROE_MOS_MULTI_YIELD_strategy_backtest_from_1991(**condition)
-        for key, value in sorted(res.items(), key=lambda x: x[0]):
+        res = self.run_strategy_backtest({'strategy': name.upper(), 'test_condition': condition})
+        for key, value in sorted(res.items()):
             print(key, '投资组合', f'共{len(value)}', '只股票')
-            start_end = key.split(':')[0]  # 选股时间段
-            start_year = int(start_end.split('-')[0][1:5])  # 选股起始年份
-            end_year = int(start_end.split('-')[1][1:5])  # 选股结束年份
+            start_year = key.first_year  # 选股起始年份
+            end_year = key.last_year  # 选股结束年份
             columns = list(range(start_year, end_year-1, -1))
             columns = [f"Y{item}" for item in columns]
             columns = ["股票代码", "股票名称", "申万行业"] + columns
@@ -172,19 +171,20 @@ class Strategy:
                 columns.append("M_Yield")
             else:
                 pass
-            df = pd.DataFrame(value, columns=columns)
+            df = pd.DataFrame(value.to_tuples(), columns=columns)
             if not df.empty:
                 print(df)
             stock_codes = df['股票代码'].tolist()
             stock_codes = [item[0:6] for item in stock_codes]
-            start_date = key.split(":")[1]
-            end_date = key.split(":")[2]
+            start_date = key.start_date
+            end_date = key.end_date
             res = utils.calculate_portfolio_rising_value(stock_codes, start_date, end_date)
             print('该组合在{}到{}期间的收益为{:.2f}%'.format(start_date, end_date, res*100))
             res = utils.calculate_index_rising_value('000300', start_date, end_date)
             print('沪深300在{}到{}期间的收益为{:.2f}%'.format(start_date, end_date, res*100))
             print('--'*50)
 
+    @profiling.profiled
     def test_strategy_portfolio(
         self, 
         strategy: str, 
@@ -210,16 +210,17 @@ class Strategy:
             # print('测试结果股票数量过多,为减轻计算压力,返回定制的结果')
             return {date: [0, 0] for date in result.keys()}
         
-        for date, stocks in sorted(result.items(), key=lambda x: x[0]):  # 对每个时间组的选股结果进行回测
-            code_list = [item[0][0:6] for item in stocks]  # 不含后缀
-            start_date = date.split(":")[1]
-            end_date = date.split(":")[2]
+        for date, stocks in sorted(result.items()):  # 对每个时间组的选股结果进行回测
+            code_list = stocks.codes()  # 不含后缀
+            start_date = date.start_date
+            end_date = date.end_date
             daily_return = utils.calculate_portfolio_rising_value(code_list, start_date, end_date)  # 获取组合的收益率
             test_result[date].append(daily_return)
             index_return = utils.calculate_index_rising_value(index, start_date, end_date)
             test_result[date].append(index_return)
         return test_result
 
+    @profiling.profiled
     def evaluate_portfolio_effect(
         self, 
         test_condition: Dict, 
@@ -249,18 +250,18 @@ class Strategy:
 
         # 获取有效时间组
         valid_groups = {date: stocks for date, stocks in test_result.items() if 5 <= len(stocks) <= 25}
-        valid_groups = dict(sorted(valid_groups.items(), key=lambda x: x[0]))
+        valid_groups = dict(sorted(valid_groups.items()))
         evaluate_result['valid_groups'] = len(valid_groups)
         evaluate_result['valid_percent'] = round(len(valid_groups) / total_groups, 4)
 
-        # 获取有效时间组的键名
-        valid_groups_keys = list(valid_groups.keys())
+        # 获取有效时间组的键名,转换为字符串格式保存
+        valid_groups_keys = [group.key for group in valid_groups.keys()]
         evaluate_result['valid_groups_keys'] = valid_groups_keys
 
         # 计算basic_ratio和组合收益差
         win_count = 0
         delta_rate = []
-        for date, stocks in sorted(valid_groups.items(), key=lambda x: x[0]):
+        for date, stocks in valid_groups.items():
             if portfolio_test_result[date][0] > portfolio_test_result[date][1]:
                 win_count += 1
             tmp = round(portfolio_test_result[date][0] - portfolio_test_result[date][1], 4)
@@ -304,75 +305,34 @@ class Strategy:
         evaluate_result: Dict,
         table_name,
         sqlite_file: str = TEST_CONDITION_SQLITE3,
+        writer: ConditionWriter = None,
     ) -> None:
         """
         如某个结果综合得分超过85分且valid_percent大于35%,则储存该组合的测试条件和相关评估信息到数据库.
         数据库内容:strategy、test_condition、total_groups(总时间组数目)、valid_groups(有效时间组数目)、
         valid_percent(有效时间组占比)、valid_groups_keys(有效时间组清单)、basci_ratio(对000300的胜率)
-        和inner_rate(内在收益率)、down_max(最大回撤)、score(综合得分)、date(保存日期).
+        和inner_rate(内在收益率)、down_max(最大回撤)、score(综合得分)、date(保存日期)、
+        rate_list(有效时间组收益率序列)、delta_rate(有效时间组超额收益序列).
         :param evaluate_result: 测试结果和指数收益对比的评估结果的返回值. 
         :param table_name: 目标数据库表名,默认为CONDITION_TABLE.
         :param sqlite_file: 目标数据库文件路径,默认为TEST_CONDITION_SQLITE3.
+        :param writer: 批量写入器,提供时由写入器异步批量提交,忽略sqlite_file参数.
         :return: None
         NOTE:
         综合得分低于85分或者valid_percent小于0.35,不保存返回.
         """
         if evaluate_result['score'] < 85 or evaluate_result['valid_percent'] < 0.35:
             return
-        conn = sqlite3.connect(sqlite_file)
-        with conn:
-            sql = f"""
-                CREATE TABLE IF NOT EXISTS '{table_name}'
-                (
-                    strategy TEXT, 
-                    test_condition TEXT, 
-                    total_groups INTEGER, 
-                    valid_groups INTEGER, 
-                    valid_percent REAL, 
-                    valid_groups_keys TEXT, 
-                    basic_ratio REAL, 
-                    inner_rate REAL,
-                    down_max REAL, 
-                    score REAL, 
-                    date TEXT,
-                    PRIMARY KEY(strategy, test_condition)
-                )
-            """
-            conn.execute(sql)  # 创建表格
-
-            sql = f"""
-                INSERT OR REPLACE INTO '{table_name}'
-                (
-                    strategy,
-                    test_condition,
-                    total_groups,
-                    valid_groups,
-                    valid_percent,
-                    valid_groups_keys,
-                    basic_ratio,
-                    inner_rate,
-                    down_max,
-                    score,
-                    date
-                )
-                VALUES
-                (
-                    '{evaluate_result['strategy']}',
-                    '{json.dumps(evaluate_result['test_condition'])}',
-                    {evaluate_result['total_groups']},
-                    {evaluate_result['valid_groups']},
-                    {evaluate_result['valid_percent']},
-                    '{json.dumps(evaluate_result['valid_groups_keys'])}',
-                    {evaluate_result['basic_ratio']},
-                    {evaluate_result['inner_rate']},
-                    {evaluate_result['down_max']},
-                    {evaluate_result['score']},
-                    '{evaluate_result['date']}'
-                )
-            """
-            conn.execute(sql)
-            conn.commit()
+        if writer is not None:
+            writer.write(table_name, evaluate_result)
             print('已保存测试条件到数据库!')
+            return
+        conn = connect(sqlite_file)
+        with conn:
+            ensure_condition_table(conn, table_name)  # 创建表格
+            conn.execute(insert_condition_sql(table_name), evaluate_result_to_row(evaluate_result))
+        conn.close()
+        print('已保存测试条件到数据库!')
 
     @staticmethod
     def calculate_score_of_test_condition(
@@ -450,12 +410,14 @@ class Strategy:
         score = inner_rate_score*0.5 + valid_percent_score*0.05 + basic_ratio_score*0.30 + down_max_score*0.15
         return score
 
+    @profiling.profiled
     def test_strategy_specific_condition(
         self, 
         condition: Dict, 
         table_name,
         sqlite_file: str = TEST_CONDITION_SQLITE3,
         display: bool = False,
+        writer: ConditionWriter = None,
     ):
         """
         测试回测类的闭环效果,测试对象为特定的测试条件,测试结果将保存到数据库
@@ -463,47 +425,43 @@ class Strategy:
         :param table_name: 保存测试结果的sqlite3数据库中的表名
         :param sqlite_file: 保存测试结果的sqlite3数据库文件
         :param display: 是否显示中间结果
+        :param writer: 批量写入器,为None时直接写入sqlite_file
         :return: None
+        NOTE:
+        回测期间固定数据集版本,数据更新同时进行也不会读到写了一半或不同日期混合的数据.
         """
-        strategy = condition['strategy']
-        if strategy == 'ROE':
-            result = self.ROE_only_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS':
-            result = self.ROE_MOS_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-DIVIDEND':
-            result = self.ROE_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS-DIVIDEND':
-            result = self.ROE_MOS_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS-MULTI-YIELD':
-            result = self.ROE_MOS_MULTI_YIELD_strategy_backtest_from_1991(**condition['test_condition'])
-        if display:
-            print('+'*120)
-            print(result)
+        with generation.pin():  # 整个测试条件读取同一个数据集版本
+            strategy = condition['strategy']
+            result = self.run_strategy_backtest(condition)
+            if display:
+                print('+'*120)
+                print(result)
         
-        # 测试该测试结果和指数的收益对比
-        portfolio_test_result = self.test_strategy_portfolio(
-            strategy=strategy, result=result
-        )
-        if display:
-            print('+'*120)
-            print(portfolio_test_result)
+            # 测试该测试结果和指数的收益对比
+            portfolio_test_result = self.test_strategy_portfolio(
+                strategy=strategy, result=result
+            )
+            if display:
+                print('+'*120)
+                print(portfolio_test_result)
         
-        # 测试该测试结果的评估
-        evaluate_result = self.evaluate_portfolio_effect(
-            test_condition=condition, 
-            test_result=result, 
-            portfolio_test_result=portfolio_test_result
-        )
-        if display:
-            print('+'*120)
-            print(evaluate_result)
+            # 测试该测试结果的评估
+            evaluate_result = self.evaluate_portfolio_effect(
+                test_condition=condition, 
+                test_result=result, 
+                portfolio_test_result=portfolio_test_result
+            )
+            if display:
+                print('+'*120)
+                print(evaluate_result)
         
-        # 将该测试结果保存到数据库
-        self.save_strategy_to_sqlite3(
-            evaluate_result=evaluate_result, 
-            sqlite_file=sqlite_file, 
-            table_name=table_name
-        )
+            # 将该测试结果保存到数据库
+            self.save_strategy_to_sqlite3(
+                evaluate_result=evaluate_result, 
+                sqlite_file=sqlite_file, 
+                table_name=table_name,
+                writer=writer
+            )
 
     def test_strategy_random_condition(
         self, 
@@ -522,25 +480,27 @@ class Strategy:
         """
         start = time.time()
         number = 0
-        for i in range(times):
-            print(f'第{i+1}轮测试......'.ljust(120, ' '))
-            strategy = random.choice(STRATEGIES)
-            items = random.randint(1, 5)
-            number += items
-            condition_list = self.generate_ROE_test_conditions(strategy=strategy, items=items)
-            if display:
-                print('+'*120)
-                print(condition_list)
-            for condition in condition_list:  # 测试
-                print(f'测试条件(From quant-stock):{condition}'.ljust(120, ' '))
-                self.test_strategy_specific_condition(
-                    condition=condition, display=display, 
-                    sqlite_file=sqlite_file, table_name=table_name
-                )
+        with ConditionWriter(sqlite_file) as writer:
+            for i in range(times):
+                print(f'第{i+1}轮测试......'.ljust(120, ' '))
+                strategy = random.choice(STRATEGIES)
+                items = random.randint(1, 5)
+                number += items
+                condition_list = self.generate_ROE_test_conditions(strategy=strategy, items=items)
+                if display:
+                    print('+'*120)
+                    print(condition_list)
+                for condition in condition_list:  # 测试
+                    print(f'测试条件(From quant-stock):{condition}'.ljust(120, ' '))
+                    self.test_strategy_specific_condition(
+                        condition=condition, display=display, 
+                        sqlite_file=sqlite_file, table_name=table_name, writer=writer
+                    )
         end = time.time()
         print('+'*120)
         print(f'共测试{number}次，耗时{round(end-start, 4)}秒')
         print(f'平均每次测试耗时{round((end-start)/number, 4)}秒')
+        profiling.report()  # 设置QUANT_PROFILE=1时打印热点函数剖析结果
 
     def calculate_condition_total_retrun(
         self, 
@@ -554,24 +514,14 @@ class Strategy:
         :param index: 指数代码,默认为'000300'
         :param draw_return_figure: 是否绘制收益率图
         """
-        strategy = condition['strategy']
-        if strategy == 'ROE':
-            result = self.ROE_only_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS':
-            result = self.ROE_MOS_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-DIVIDEND':
-            result = self.ROE_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS-DIVIDEND':
-            result = self.ROE_MOS_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
-        elif strategy == 'ROE-MOS-MULTI-YIELD':
-            result = self.ROE_MOS_MULTI_YIELD_strategy_backtest_from_1991(**condition['test_condition'])
+        result = self.run_strategy_backtest(condition)
         # 计算该测试条件的总收益率
         return_list = []
         index_return_list = []
         for date, stocks in result.items():
-            code_list = [item[0][0:6] for item in stocks]
-            start_date = date.split(":")[1]
-            end_date = date.split(":")[2]
+            code_list = stocks.codes()
+            start_date = date.start_date
+            end_date = date.end_date
             if 25 >= len(stocks) >= 5:  # 有效时间组
                 tmp = utils.calculate_portfolio_rising_value(
                     code_list=code_list, start_date=start_date, end_date=end_date
@@ -583,7 +533,9 @@ class Strategy:
                 index=index, start_date=start_date, end_date=end_date
             )
             index_return_list.append(round(tmp, 4))
-        df = pd.DataFrame(return_list, columns=['portfolio_return'], index=result.keys())
+        df = pd.DataFrame(
+            return_list, columns=['portfolio_return'], index=[group.key for group in result.keys()]
+        )
         df['index_return'] = index_return_list
         df = df.reset_index()
         df = df.rename(columns={'index': 'date'})
@@ -596,6 +548,7 @@ class Strategy:
         df['test_condition'] = f"{condition['test_condition']}"
         # 绘制收益率图
         if draw_return_figure:
+            import matplotlib.pyplot as plt  # 只在绘图时导入,回测工作进程不加载matplotlib
             ax: Axes
             fig, ax = plt.subplots(figsize=(12, 6))
             plt.rcParams['font.sans-serif'] = ['Songti SC']
@@ -631,6 +584,66 @@ class Strategy:
             plt.show()
         return df
 
+    def run_strategy_backtest(self, condition: Dict) -> Dict:
+        """
+        按测试条件中的策略名称执行对应的回测方法
+        :param condition: 测试条件:{'strategy': 'ROE', 'test_condition': {...}}
+        :return: 策略类方法的返回值
+        """
+        strategy = condition['strategy']
+        if strategy == 'ROE':
+            result = self.ROE_only_strategy_backtest_from_1991(**condition['test_condition'])
+        elif strategy == 'ROE-MOS':
+            result = self.ROE_MOS_strategy_backtest_from_1991(**condition['test_condition'])
+        elif strategy == 'ROE-DIVIDEND':
+            result = self.ROE_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
+        elif strategy == 'ROE-MOS-DIVIDEND':
+            result = self.ROE_MOS_DIVIDEND_strategy_backtest_from_1991(**condition['test_condition'])
+        elif strategy == 'ROE-MOS-MULTI-YIELD':
+            result = self.ROE_MOS_MULTI_YIELD_strategy_backtest_from_1991(**condition['test_condition'])
+        else:
+            raise ValueError(f'请检查策略名称是否在列表中({STRATEGIES})')
+        return result
+
+    def calculate_conditions_daily_nav(
+        self,
+        conditions: List[Dict],
+        index: Literal["000300", "399006", "000905"] = "000300",
+        draw_nav_figure: bool = False
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        计算多个测试条件的日度净值 回撤和相对指数的净值比
+        :param conditions: 测试条件列表:[{'strategy': 'ROE', 'test_condition': {...}}, ...]
+        :param index: 指数代码,默认为'000300'
+        :param draw_nav_figure: 是否绘制净值和回撤图
+        :return: nav.calculate_daily_nav的返回值,列序号和conditions的序号一致
+        """
+        results = [self.run_strategy_backtest(condition) for condition in conditions]
+        daily = nav.calculate_daily_nav(results, index=index)
+        if draw_nav_figure and not daily['nav'].empty:
+            import matplotlib.pyplot as plt
+            ax1: Axes
+            ax2: Axes
+            fig, (ax1, ax2) = plt.subplots(
+                2, 1, figsize=(12, 8), sharex=True, gridspec_kw={'height_ratios': [3, 1]}
+            )
+            plt.rcParams['font.sans-serif'] = ['Songti SC']
+            dates = pd.to_datetime(daily['nav'].index, format='%Y%m%d')
+            for position, condition in enumerate(conditions):
+                label = f"{position}:{condition['strategy'].lower()}"
+                ax1.plot(dates, daily['nav'][position], label=label)
+                ax2.plot(dates, daily['drawdown'][position])
+            ax1.plot(dates, daily['index'], label=f'{index}指数', color='black', linestyle='--')
+            ax1.set_title(f'策略组合VS{index}日度净值对比')
+            ax1.set_ylabel('净值')
+            ax1.legend()
+            ax1.grid(True)
+            ax2.set_ylabel('回撤')
+            ax2.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{round(x*100, 2):}%"))
+            ax2.grid(True)
+            plt.show()
+        return daily
+
     def get_conditions_from_sqlite3(self, src_sqlite3: str, src_table: str) -> List[Dict]:
         """
         从指定的sqlite3数据库中获取测试条件集.
@@ -654,14 +667,60 @@ class Strategy:
                 conditions.append(tmp)
         return conditions
 
+    @staticmethod
+    def get_condition_key(condition: Dict) -> str:
+        """
+        生成测试条件的规范化哈希键,用于集合比较.
+        :param condition: 测试条件,结构为{'strategy': 'ROE', 'test_condition': {...}}
+        :return: 40位sha1十六进制字符串
+        NOTE:
+        test_condition中的键按字母排序,整数值的浮点数(如20.0)按整数处理,
+        与原先字典比较(20 == 20.0)的结果保持一致.
+        """
+        def normalize(value):
+            if isinstance(value, dict):
+                return {key: normalize(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [normalize(item) for item in value]
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return value
+        text = json.dumps(
+            [condition['strategy'], normalize(condition['test_condition'])],
+            sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_condition_keys_from_sqlite3(self, src_sqlite3: str, src_table: str) -> Set[str]:
+        """
+        获取指定数据表中全部测试条件的规范化哈希键集合.
+        :param src_sqlite3: 指定的sqlite3数据库文件
+        :param src_table: 指定的sqlite3数据库中的表名
+        :return: 哈希键集合,表格不存在时返回空集合
+        """
+        con = sqlite3.connect(src_sqlite3)
+        with con:
+            sql = """ SELECT name FROM sqlite_master WHERE type='table' AND name=? """
+            if con.execute(sql, (src_table, )).fetchone() is None:
+                return set()
+            sql = f""" SELECT strategy, test_condition FROM '{src_table}' """
+            rows = con.execute(sql).fetchall()
+        return {
+            self.get_condition_key({'strategy': strategy, 'test_condition': json.loads(condition)})
+            for strategy, condition in rows
+        }
+
     def retest_conditions_from_sqlite3(
         self,
         src_sqlite3: str,
         src_table: str,
         dest_sqlite3: str,
         dest_table: str,
-        from_pos: int = 0
-    ):
+        from_pos: int = 0,
+        batch_size: int = 20,
+        checkpoint: Callable[[int], None] = None,
+        writer: ConditionWriter = None
+    ) -> int:
         """
         从指定的sqlite3数据库中获取测试条件集,重新测试后保存至指定的数据库.
         :param src_sqlite3: 指定的sqlite3数据库文件
@@ -669,21 +728,49 @@ class Strategy:
         :param dest_sqlite3: 保存测试结果的sqlite3数据库文件
         :param dest_table: 保存测试结果的sqlite3数据库中的表名
         :param from_pos: 从指定的位置开始获取测试条件
-        :return: None
+        :param batch_size: 每处理batch_size个测试条件调用一次checkpoint
+        :param checkpoint: 进度回调函数,参数为已处理的位置(下一次的from_pos)
+        :param writer: 批量写入器,为None时在本方法内创建并关闭
+        :return: 本次实际重新测试的条件数目
+        NOTE:
+        目标表中已有的测试条件只读取一次,以哈希键集合判断是否需要重新测试.
+        进程中断后以checkpoint记录的位置作为from_pos重新调用即可,期间已保存到
+        目标表中的测试条件会被集合过滤,不会重复测试.
+        每次调用checkpoint之前先flush写入器,保证记录的进度不会超前于已提交的结果.
         """
+        if writer is None:
+            with ConditionWriter(dest_sqlite3) as writer:
+                return self.retest_conditions_from_sqlite3(
+                    src_sqlite3=src_sqlite3, src_table=src_table,
+                    dest_sqlite3=dest_sqlite3, dest_table=dest_table,
+                    from_pos=from_pos, batch_size=batch_size,
+                    checkpoint=checkpoint, writer=writer
+                )
         conditions = self.get_conditions_from_sqlite3(
             src_sqlite3=src_sqlite3, src_table=src_table
         )
-        for condition in conditions[from_pos:]:  # 重新测试
-            tmp_conditons = self.get_conditions_from_sqlite3(
-                src_sqlite3=dest_sqlite3, src_table=dest_table
-            )
-            if condition not in tmp_conditons:
+        tested_keys = self.get_condition_keys_from_sqlite3(
+            src_sqlite3=dest_sqlite3, src_table=dest_table
+        )
+        retested = 0
+        position = from_pos
+        for position, condition in enumerate(conditions[from_pos:], start=from_pos+1):  # 重新测试
+            key = self.get_condition_key(condition)
+            if key not in tested_keys:
                 print(f'正在重新测试条件(From quant-stock): {condition}'.ljust(120, ' '))
                 self.test_strategy_specific_condition(
-                    condition=condition, display=False, 
-                    sqlite_file=dest_sqlite3, table_name=dest_table
+                    condition=condition, display=False,
+                    sqlite_file=dest_sqlite3, table_name=dest_table, writer=writer
                 )
+                tested_keys.add(key)
+                retested += 1
+            if checkpoint is not None and (position - from_pos) % batch_size == 0:
+                writer.flush()
+                checkpoint(position)
+        writer.flush()
+        if checkpoint is not None:
+            checkpoint(max(position, len(conditions)))
+        return retested
     ###################################################################################################
     # 用生产线比喻quant-stock系统的测试过程。以ROE-MOS-DIVIDEND测试流程为例。
     # 流水线传送带上一只空箱子缓慢移动,到了目标点停下,等待合适的产品(投资组合)装进来。
@@ -708,6 +795,7 @@ class Strategy:
     # 依次循环,直到原材料(数据库)时间轴走到尽头即可终止。
     ###################################################################################################
     @staticmethod
+    @profiling.profiled
     def ROE_only_strategy_backtest_from_1991(
         roe_list:List=[20]*5, roe_value=None, period:int=5, holding_time:int=12, trade_month:int=6
     ) -> Dict:
@@ -719,8 +807,9 @@ class Strategy:
         :param period: 筛选条件中roe数据包含的年份数. 
         :param holding_time: 持有时间,默认为12个月.
         :return:返回值为字典格式,键为时间组,标明ROE起止期间和持股, 值标明选出股票代码集合及期间内年度ROE值.
-        比如'Y2023-Y2014:2024-06-01:2024-10-01': [...], 表示该时间组是以2014年-2023年ROE值为数据源,该组合的持股时间为
-        2024-06-01:2024-10-01,列表内元素为选股结果,每个元素内容包括股票代码,股票名称,股票行业,以及每年的ROE值.
+        比如TimeGroup(2023, 2014, ...)即'Y2023-Y2014:2024-06-01:2024-10-01': [...], 表示该时间组是以2014年-2023年
+        ROE值为数据源,该组合的持股时间为2024-06-01:2024-10-01,值为GroupSelection选股结果,保存股票id数组,
+        to_tuples()可转换为股票代码,股票名称,股票行业,以及每年的ROE值组成的元组列表.
         """
         if roe_list and len(roe_list) != period:
             raise ValueError('roe_list列表长度应等于period')
@@ -734,44 +823,88 @@ class Strategy:
             raise ValueError(f"持有时间参数应为{HOLDING_TIME}中的一个")
 
         result = {}  # 定义返回值
-        con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
+        con = sqlite3.connect(generation.path_of(INDICATOR_ROE_FROM_1991))
         with con:
             sql = f"""select * from '{ROE_TABLE}' """
             df = pd.read_sql_query(sql, con)
             columns = df.columns.tolist()
+            universe = StockUniverse(
+                df['stockcode'], df['stockname'], df['stockclass'],
+                df[columns[3:]].to_numpy(dtype=float)
+            )
+            roe_target = np.asarray(roe_list, dtype=float)
             for index, item in enumerate(columns):
                 if index >= 3 and index+period <= len(columns):  # 动态构建查询范围
-                    year_list = columns[index: index+period]
                     # 查询index: index+period年度均大于roe_list的股票
-                    df_tmp = df[(df[year_list] >= roe_list).all(axis=1)]
-                    col_tmp = columns[:3] + year_list
-                    res = [tuple(x) for x in df_tmp[col_tmp].values.tolist()]
+                    roe_slice = (index-3, index-3+period)
+                    ids = np.flatnonzero(
+                        (universe.roe[:, roe_slice[0]:roe_slice[1]] >= roe_target).all(axis=1)
+                    )
                     # 检查res股票清单是否在sw行业指数中
                     if trade_month >=10:
                         time_tail = "-" + str(trade_month) + "-" + "01"  # -11-01
                     else:
                         time_tail = "-" + "0" + str(trade_month) + "-" + "01"  # -09-01
                     first_trade_date = str(int(columns[index][1:5])+1) + time_tail
-                    res = [item for item in res if sw.in_index_or_not(item[0][:6], first_trade_date)]
+                    ids = [i for i in ids if sw.in_index_or_not(universe.short_codes[i], first_trade_date)]
+                    res = GroupSelection(universe, ids, roe_slice)
                     # 根据持有时间切分“箱子”, 将res赋值给每个“格子”
                     parts = 12 / holding_time
-                    first_key = f"""{columns[index]}-{columns[index+period-1]}:"""  # 时间组键名第一部分
+                    first_year = int(columns[index][1:5])  # 时间组ROE期间
+                    last_year = int(columns[index+period-1][1:5])
                     end_trade_date = str(int(columns[index][1:5])+2) + time_tail
-                    date_range = pd.date_range(
+                    date_range = [date.toordinal() for date in pd.date_range(
                         first_trade_date, end_trade_date, freq=f'{holding_time}MS'
-                    ).strftime('%Y-%m-%d').tolist()
-                    today = datetime.datetime.now().strftime('%Y-%m-%d')
+                    ).date]
+                    today = datetime.date.today().toordinal()
                     for item in range(int(parts)):
                         if date_range[item] > today:  # 持股起点还未到，取消该时间组
                             break
-                        elif date_range[item+1] > today:  # 持股终点还未到，以今天为终点
-                            second_key = f"{date_range[item]}:{today}"
-                        else:
-                            second_key = f"{date_range[item]}:{date_range[item+1]}"
-                        time_key = first_key + second_key
-                        result[time_key] = res
+                        # 持股终点还未到，以今天为终点
+                        end = min(date_range[item+1], today)
+                        result[TimeGroup(first_year, last_year, date_range[item], end)] = res
         return result
 
+    @staticmethod
+    @profiling.profiled
+    def attach_mos_column(stocks: GroupSelection, date: str, cache: Dict = None) -> GroupSelection:
+        """
+        为选股结果附加mos_7列
+        :param stocks: 时间组选股结果
+        :param date: 持股期间的起点, 例如: '2024-06-01'
+        :param cache: 可选的查询缓存,键为('mos_7', 股票代码, 日期),批量评估多个测试条件时共享
+        :return: 附加mos_7列后的选股结果
+        """
+        cache = cache if cache is not None else {}
+        mos_7 = []
+        for code in stocks.codes():
+            key = ('mos_7', code, date)
+            if key not in cache:
+                cache[key] = utils.calculate_MOS_7_from_2006(code=code, date=date)
+            mos_7.append(cache[key])
+        return stocks.with_column('mos_7', mos_7)
+
+    @staticmethod
+    @profiling.profiled
+    def attach_dividend_columns(stocks: GroupSelection, date: str, cache: Dict = None) -> GroupSelection:
+        """
+        为选股结果附加dv_ttm和dv_ratio列
+        :param stocks: 时间组选股结果
+        :param date: 持股期间的起点, 例如: '2024-06-01'
+        :param cache: 可选的查询缓存,键为('dividend', 股票代码, 日期),批量评估多个测试条件时共享
+        :return: 附加dv_ttm和dv_ratio列后的选股结果
+        """
+        cache = cache if cache is not None else {}
+        values = []
+        for code in stocks.codes():
+            key = ('dividend', code, date)
+            if key not in cache:
+                cache[key] = utils.get_indicators_in_trade_record(code, date, ['dv_ttm', 'dv_ratio'])
+            values.append(cache[key])
+        values = np.asarray(values, dtype=float).reshape(len(stocks), 2)
+        return stocks.with_column('dv_ttm', values[:, 0]).with_column('dv_ratio', values[:, 1])
+
+    @profiling.profiled
     def ROE_DIVIDEND_strategy_backtest_from_1991(
         self, 
         roe_list: List, 
@@ -787,6 +920,8 @@ class Strategy:
         :param dividend: 股息率筛选值,在筛选出的股票中再次筛选,筛选条件为股息率大于等于dividend.
         :param holding_time: 持有时间,默认为12个月.
         :return: 返回值为字典格式。字典键为时间组,标明ROE起止期间及持股期间, 值标明选出股票代码集合及期间内年度ROE值.
+        NOTE:
+        选股结果附加dv_ttm和dv_ratio两列.
         """
         if roe_list and len(roe_list) != period:
             raise Exception('roe_list列表长度和period不相等')
@@ -802,17 +937,12 @@ class Strategy:
             roe_list=roe_list, period=period, holding_time=holding_time, trade_month=trade_month
         )
         for date, stocks in tmp_result.items():  # 股息率筛选
-            tmp_date = date.split(':')[1]  # 持股期间的起点
-            tmp_stocks = []  # 保存筛选结果
-            for stock in stocks: 
-                dv_ttm = utils.get_indicator_in_trade_record(stock[0][0:6], tmp_date, 'dv_ttm')
-                dv_ratio = utils.get_indicator_in_trade_record(stock[0][0:6], tmp_date, 'dv_ratio')
-                if dv_ratio >= dividend:
-                    stock = stock + (dv_ttm, dv_ratio)
-                    tmp_stocks.append(stock)
-            result[date] = tmp_stocks
+            tmp_date = date.start_date  # 持股期间的起点
+            stocks = self.attach_dividend_columns(stocks, tmp_date)
+            result[date] = stocks.filter(stocks.columns['dv_ratio'] >= dividend)
         return result
 
+    @profiling.profiled
     def ROE_MOS_strategy_backtest_from_1991(
         self, roe_list: List, mos_range: List, holding_time: int = 12, trade_month: int = 6
     ) -> Dict:
@@ -836,18 +966,15 @@ class Strategy:
         tmp_result = self.ROE_only_strategy_backtest_from_1991(
             roe_list=roe_list, period=7, holding_time=holding_time, trade_month=trade_month
         )
-        result = {date: item for date, item in tmp_result.items() if int(date[7:11]) >= 1999}  # 定义返回值
+        result = {date: item for date, item in tmp_result.items() if date.last_year >= 1999}  # 定义返回值
         for date, stocks in result.items():
-            tmp_date = date.split(':')[1]  # 持股期间的起点
-            tmp_stocks = []
-            for stock in stocks:
-                mos_7 = utils.calculate_MOS_7_from_2006(code=stock[0][0:6], date=tmp_date)
-                if mos_range[1] >= mos_7 >= mos_range[0]:
-                    stock = stock + (mos_7,)
-                    tmp_stocks.append(stock)
-            result[date] = tmp_stocks
+            tmp_date = date.start_date  # 持股期间的起点
+            stocks = self.attach_mos_column(stocks, tmp_date)
+            mos_7 = stocks.columns['mos_7']
+            result[date] = stocks.filter((mos_7 >= mos_range[0]) & (mos_7 <= mos_range[1]))
         return result
 
+    @profiling.profiled
     def ROE_MOS_DIVIDEND_strategy_backtest_from_1991(
         self, 
         roe_list: List, 
@@ -874,17 +1001,12 @@ class Strategy:
             roe_list=roe_list, mos_range=mos_range, holding_time=holding_time, trade_month=trade_month
         )
         for date, stocks in tmp_result.items():  # 股息率筛选
-            tmp_date = date.split(':')[1]  # 持股期间的起点
-            tmp_stocks = []
-            for stock in stocks:
-                dv_ttm = utils.get_indicator_in_trade_record(stock[0][0:6], tmp_date, 'dv_ttm')
-                dv_ratio = utils.get_indicator_in_trade_record(stock[0][0:6], tmp_date, 'dv_ratio')
-                if dv_ratio >= dividend:
-                    stock = stock + (dv_ttm, dv_ratio)
-                    tmp_stocks.append(stock)
-            result[date] = tmp_stocks
+            tmp_date = date.start_date  # 持股期间的起点
+            stocks = self.attach_dividend_columns(stocks, tmp_date)
+            result[date] = stocks.filter(stocks.columns['dv_ratio'] >= dividend)
         return result
 
+    @profiling.profiled
     def ROE_MOS_MULTI_YIELD_strategy_backtest_from_1991(
         self,
         roe_list: List,
@@ -909,18 +1031,13 @@ class Strategy:
             roe_list=roe_list, mos_range=mos_range, holding_time=holding_time, trade_month=trade_month
         )
         for date, stocks in tmp_result.items():  # 股息率筛选
-            trade_date = date.split(':')[1]  # 持股期间的起点
+            trade_date = date.start_date  # 持股期间的起点
             row = utils.find_closest_row_in_curve_table(trade_date)
             yield_10 = row["value1"].values[0]
             multi_yield = yield_10 * multi_value  # 当期10年国债利率的倍数
-            tmp_stocks = []
-            for stock in stocks:
-                dv_ttm = utils.get_indicator_in_trade_record(stock[0][0:6], trade_date, 'dv_ttm')
-                dv_ratio = utils.get_indicator_in_trade_record(stock[0][0:6], trade_date, 'dv_ratio')
-                if dv_ratio >= multi_yield:
-                    stock = stock + (dv_ttm, dv_ratio, multi_yield)
-                    tmp_stocks.append(stock)
-            result[date] = tmp_stocks
+            stocks = self.attach_dividend_columns(stocks, trade_date)
+            stocks = stocks.with_column('m_yield', np.full(len(stocks), multi_yield))
+            result[date] = stocks.filter(stocks.columns['dv_ratio'] >= multi_yield)
         return result
     
     @staticmethod
@@ -1379,11 +1496,10 @@ if __name__ == "__main__":
             continue
 
         # 显示细节
-        for key, value in sorted(tmp_res.items(), key=lambda x: x[0]):
+        for key, value in sorted(tmp_res.items()):
             print(key, '投资组合', f'共{len(value)}', '只股票')
-            start_end = key.split(':')[0]  # 选股时间段
-            start_year = int(start_end.split('-')[0][1:5])  # 选股起始年份
-            end_year = int(start_end.split('-')[1][1:5])  # 选股结束年份
+            start_year = key.first_year  # 选股起始年份
+            end_year = key.last_year  # 选股结束年份
             columns = list(range(start_year, end_year-1, -1))
             columns = [f"Y{item}" for item in columns]
             columns = ["股票代码", "股票名称", "申万行业"] + columns
@@ -1403,13 +1519,13 @@ if __name__ == "__main__":
                 columns.append("M_Yield")
             else:
                 pass
-            df = pd.DataFrame(value, columns=columns)
+            df = pd.DataFrame(value.to_tuples(), columns=columns)
             if not df.empty:
                 print(df)
             stock_codes = df['股票代码'].tolist()
             stock_codes = [item[0:6] for item in stock_codes]
-            start_date = key.split(':')[1]
-            end_date = key.split(':')[2]
+            start_date = key.start_date
+            end_date = key.end_date
             res = utils.calculate_portfolio_rising_value(stock_codes, start_date, end_date)
             print('该组合在{}到{}期间的收益为{:.2f}%'.format(start_date, end_date, res*100))
             res1 = utils.calculate_index_rising_value('000300', start_date, end_date)
@@ -1,91 +1,53 @@
 """
 使用python自动化类执行每日数据更新和自动测试任务
-更新的对象是curve.sqlite3和trade-record目录下的csv文件
+更新的对象是curve.sqlite3 index-value.sqlite3和trade-record目录下的csv文件
 indicator-roe-from-1991.sqlite3每年5月份以后更新或者新建一次即可
 NOTE:
-每日下午6点30分更新trade record csv和curve.sqlite3,
+每个交易日下午6点30分执行pipeline夜间刷新,各阶段按依赖关系并行,见pipeline模块.
+auto_test每个测试条件固定一个数据集版本,刷新期间不暂停,刷新结束发布新版本后从下一个测试条件开始使用.
+启动时先补齐错过的交易日.
 在imac机器上将TEST_CONDITION_SQLITE3拷贝到本地仓库.
-auto_test全时段运行,使用threading.Semaphore和threading.Lock处理线程同步.
 """
 import os
 import time
 import shutil
-import sqlite3
-import tushare as ts
-from concurrent.futures import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
-import tsswindustry as sw
 import data
+import generation
+import journal
+import pipeline
+import test
 from test import auto_test
-from path import TEST_CONDITION_SQLITE3, IMAC_REPOSITORY_PATH, INDICATOR_ROE_FROM_1991, ROE_TABLE
+from path import TEST_CONDITION_SQLITE3, PIPELINE_START, ensure_dirs
 import threading
 import platform
 
-semaphore = threading.Semaphore(5)
 scheduler = BackgroundScheduler()
 thread = threading.Thread(target=auto_test)
-# codes = [item[0][0:6] for item in sw.get_all_stocks()]
 
-def is_trade_day(func):
+def run_nightly(catch_up: bool = False):
     """
-    装饰器,判断是否为交易日,如果是则执行数据更新函数.
-    :param func: 待执行的函数
-    :return: wrapper函数
+    执行夜间刷新
+    :param catch_up: 是否只补齐错过的交易日
     """
-    def wrapper(*args, **kwargs):
-        today = time.strftime('%Y%m%d', time.localtime())
-        pro = ts.pro_api()
-        df = pro.trade_cal(
-            **{"exchange": "", "cal_date": today},
-            fields=["is_open"]
-        )
-        res = df["is_open"][0]
-        if res:
-            return func(*args, **kwargs)
-        else:
-            pass
-    return wrapper
+    pipeline.run_nightly(catch_up=catch_up)
 
-# 每日下午8点0分开始更新一次trade record csv文件
-@scheduler.scheduled_job('cron', hour=20, minute=0, misfire_grace_time=3600)
-@is_trade_day
-def update_trade_record_csv():
-    with semaphore:
-        print('开始更新trade record csv文件\r', end='', flush=True)
-        codes = [item[0][0:6] for item in sw.get_all_stocks()]
-        for index in range(0, len(codes), 20):
-            stocks = codes[index:index+20]
-            with ThreadPoolExecutor() as executor:
-                executor.map(data.update_trade_record_csv, stocks)
-            time.sleep(1.5)
-        print('更新trade record csv文件完成.' + ' '*20, flush=True)
-
-# 每日下午6点30分开始更新一次curve.sqlite3
-@scheduler.scheduled_job('cron', hour=18, minute=30, misfire_grace_time=600)
-@is_trade_day
-def update_curve_sqlite3():
-    with semaphore:
-        print('开始更新curve.sqlite3\r', end='', flush=True)
-        data.update_curve_value_table()
-        print('更新curve.sqlite3完成.' + ' '*20, flush=True)
-
-# 每日下午6点30分开始更新一次index_value.sqlite3
-@scheduler.scheduled_job('cron', hour=18, minute=30, misfire_grace_time=600)
-@is_trade_day
-def update_index_value_sqlite3():
-    with semaphore:
-        print('开始更新index_value.sqlite3\r', end='', flush=True)
-        for index in ["000300", "000905", "399006"]:
-            data.update_index_indicator_table(index)
-        print('更新index_value.sqlite3完成.' + ' '*20, flush=True)
+# 每个交易日下午6点30分开始夜间刷新,非交易日由pipeline跳过
+@scheduler.scheduled_job(
+    'cron', hour=int(PIPELINE_START.split(':')[0]), minute=int(PIPELINE_START.split(':')[1]),
+    misfire_grace_time=3600, max_instances=1
+)
+def nightly_refresh():
+    run_nightly()
 
 # 每天下午6点35分将TEST_CONDITION_SQLITE3拷贝到本地仓库,更名为test-condition-quant.sqlite3
 # 然后推送到gitee main分支. 本地仓库路径IMAC_REPOSITORY_PATH
 @scheduler.scheduled_job('cron',  hour=18, minute=35, misfire_grace_time=600)
 def copy_test_condition_sqlite3():
     from path import ROOT_PATH
-    with semaphore:
+    with test.lock:  # auto_test写入TEST_CONDITION_SQLITE3期间不拷贝
         if "iMac" in platform.uname().node:  # 如果是在imac机器上
+            from path import IMAC_REPOSITORY_PATH  # 只有iMac需要设置仓库路径
             shutil.copyfile(TEST_CONDITION_SQLITE3, os.path.join(IMAC_REPOSITORY_PATH, "test-condition-quant.sqlite3"))
             print('拷贝TEST_CONDITION_SQLITE3完成.')
             os.chdir(IMAC_REPOSITORY_PATH)
@@ -98,18 +60,19 @@ def copy_test_condition_sqlite3():
 # 每年5月1日上午0点0分1秒更新indicator-roe-from-1991.sqlite3
 @scheduler.scheduled_job('cron', month=5, day=1, hour=0, minute=0, second=1, misfire_grace_time=600)
 def update_indicator_roe_from_1991():
-    with semaphore:
-        print('开始更新indicator-roe-from-1991.sqlite3\r', end='', flush=True)
-        codes = [item[0][0:6] for item in sw.get_all_stocks()]
-        for index in range(0, len(codes), 20):
-            stocks = codes[index:index+20]
-            with ThreadPoolExecutor(max_workers=8) as executor:
-                executor.map(data.update_ROE_indicators_table_from_1991, codes)
-            time.sleep(1)
-        print('更新indicator-roe-from-1991.sqlite3完成.' + ' '*20, flush=True)
+    # 与夜间刷新相同,各阶段的耗时和指标记录在journal中
+    job_id = journal.start_job('yearly-roe')
+    pipeline.run_stages([
+        pipeline.Stage('roe', data.update_ROE_indicators_table_by_period),
+        pipeline.Stage('publish', generation.publish, ('roe',)),
+    ], job_id)
+    journal.finish_job(job_id)
 
 def run():
+    ensure_dirs()
     scheduler.start()
+    # 立即补齐错过的交易日,与定时的nightly_refresh重叠时由pipeline.run_nightly跳过后触发的一次
+    scheduler.add_job(run_nightly, kwargs={'catch_up': True}, id='nightly-catch-up', max_instances=1)
     thread.start()
     while True:
         time.sleep(1)
@@ -0,0 +1,208 @@
+"""
+批量数据作业的采集指标.
+每个作业单元记录开始结束时间 接口调用次数 重试次数 获取行数 写入行数和获取的字节数,
+与作业日志保存在同一个JOURNAL_SQLITE3数据库中:
+TELEMETRY_TABLE: (job_id, unit, started, finished, duration, api_calls, retries, rows_fetched, rows_written, bytes),
+主键(job_id, unit)
+计数方式:
+    with telemetry.collect() as counters:  # 收集当前线程内的计数
+        ...  # fetch的接口代理调用count_response,写入函数调用count('rows_written', n)
+    counters['api_calls']
+用法:
+    python telemetry.py --days 30  # 打印作业趋势 各阶段耗时p50/p95和最慢的单元
+NOTE:
+计数器是线程局部的,嵌套的collect结束时计入外层.fetch.fetch_all把工作线程的计数计入调用方线程,
+journal.fetch_journaled按单元记录,pipeline按阶段记录.
+"""
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+import pandas as pd
+from path import JOURNAL_JOB_TABLE, TELEMETRY_TABLE, TELEMETRY_DAYS, TUSHARE_CALLS_PER_MINUTE, PIPELINE_JOB
+
+METRICS = ('api_calls', 'retries', 'rows_fetched', 'rows_written', 'bytes')
+
+_local = threading.local()  # 每个线程当前的计数器
+
+def count(name: str, value: int = 1) -> None:
+    """
+    计数,当前线程没有收集中的计数器时忽略
+    :param name: 指标名称,见METRICS
+    :param value: 增加的数量
+    """
+    counters = getattr(_local, 'counters', None)
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
+
+def add(counters: Dict[str, int]) -> None:
+    """
+    将另一个线程收集的计数计入当前线程
+    :param counters: collect返回的计数器
+    """
+    for name, value in counters.items():
+        count(name, value)
+
+def count_response(result: Any) -> None:
+    """
+    记录一次接口调用及返回的行数和字节数
+    :param result: 接口返回值,DataFrame按行数和内存占用计,str按一行和UTF-8编码长度计
+    """
+    count('api_calls')
+    if isinstance(result, pd.DataFrame):
+        count('rows_fetched', len(result))
+        count('bytes', int(result.memory_usage(index=False, deep=True).sum()))
+    elif isinstance(result, str):
+        count('rows_fetched')
+        count('bytes', len(result.encode('utf-8')))
+
+@contextmanager
+def collect() -> Iterator[Dict[str, int]]:
+    """
+    收集当前线程内的计数,结束时计入外层的计数器
+    :return: 上下文管理器,值为{指标名称: 数量}
+    """
+    outer = getattr(_local, 'counters', None)
+    counters = dict.fromkeys(METRICS, 0)
+    _local.counters = counters
+    try:
+        yield counters
+    finally:
+        _local.counters = outer
+        if outer is not None:
+            for name, value in counters.items():
+                outer[name] = outer.get(name, 0) + value
+
+def ensure_table(con: sqlite3.Connection) -> None:
+    """
+    创建指标表
+    :param con: sqlite3.Connection
+    """
+    columns = ''.join(f"\n            {name} INTEGER DEFAULT 0," for name in METRICS)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS '{TELEMETRY_TABLE}' (
+            job_id INTEGER NOT NULL,
+            unit TEXT NOT NULL,
+            started REAL NOT NULL,
+            finished REAL NOT NULL,
+            duration REAL DEFAULT 0,{columns}
+            PRIMARY KEY(job_id, unit)
+        ) WITHOUT ROWID""")
+
+def record(con: sqlite3.Connection, job_id: int, unit: str, duration: float, counters: Dict[str, int] = None) -> None:
+    """
+    写入一个单元的指标,由journal.record_unit调用
+    :param con: sqlite3.Connection
+    :param job_id: 作业编号
+    :param unit: 单元名称
+    :param duration: 耗时秒数
+    :param counters: collect返回的计数器,为None时各项为0
+    """
+    counters = counters or {}
+    finished = time.time()
+    sql = f"""
+        INSERT OR REPLACE INTO '{TELEMETRY_TABLE}' (job_id, unit, started, finished, duration, {', '.join(METRICS)})
+        VALUES (?, ?, ?, ?, ?{', ?' * len(METRICS)})
+    """
+    con.execute(sql, (job_id, unit, finished - duration, finished, duration, *[counters.get(name, 0) for name in METRICS]))
+
+def load_units(con: sqlite3.Connection, days: int = TELEMETRY_DAYS) -> pd.DataFrame:
+    """
+    读取最近days天内开始的作业的单元指标
+    :param con: sqlite3.Connection
+    :param days: 天数
+    :return: DataFrame,字段为name started_job finished_job和指标表的全部字段
+    """
+    sql = f"""
+        SELECT j.name, j.started AS started_job, j.finished AS finished_job, m.*
+        FROM '{TELEMETRY_TABLE}' m JOIN '{JOURNAL_JOB_TABLE}' j ON j.job_id = m.job_id
+        WHERE j.started >= ?
+    """
+    return pd.read_sql(sql, con, params=(time.time() - days * 86400,))
+
+def summarize_jobs(units: pd.DataFrame) -> pd.DataFrame:
+    """
+    按作业汇总指标
+    :param units: load_units的返回值
+    :return: DataFrame,每个作业一行,含单元数 墙钟耗时 各项指标合计和每分钟接口调用次数
+    """
+    jobs = units.groupby(['job_id', 'name']).agg(
+        started=('started', 'min'), finished=('finished', 'max'), units=('unit', 'count'),
+        **{name: (name, 'sum') for name in METRICS}
+    ).reset_index()
+    jobs['seconds'] = jobs['finished'] - jobs['started']
+    jobs['calls_per_minute'] = (jobs['api_calls'] / jobs['seconds'].clip(lower=1) * 60).round(1)
+    return jobs.sort_values(by='job_id')
+
+def percentiles(units: pd.DataFrame, by: list) -> pd.DataFrame:
+    """
+    按分组计算单元耗时的p50 p95和最大值
+    :param units: load_units的返回值
+    :param by: 分组字段
+    :return: DataFrame,字段为by count p50 p95 max last,last为最近一个单元的耗时
+    """
+    units = units.sort_values(by='finished')
+    grouped = units.groupby(by)['duration']
+    return pd.DataFrame({
+        'count': grouped.count(),
+        'p50': grouped.quantile(0.5),
+        'p95': grouped.quantile(0.95),
+        'max': grouped.max(),
+        'last': grouped.last(),
+    }).round(2).reset_index()
+
+def report(days: int = TELEMETRY_DAYS, name: str = None, top: int = 5, con: sqlite3.Connection = None) -> None:
+    """
+    打印作业趋势 耗时分位数和最慢的单元
+    :param days: 最近的天数
+    :param name: 只报告该名称的作业,默认全部
+    :param top: 每个作业列出的最慢单元数
+    :param con: sqlite3.Connection,默认为journal.connect()
+    NOTE:
+    每分钟接口调用次数与TUSHARE_CALLS_PER_MINUTE之比即配额占用,中债接口不受该配额约束.
+    """
+    import journal  # journal在模块级引用telemetry
+    own = con is None
+    con = con if con is not None else journal.connect()
+    units = load_units(con, days)
+    if own:
+        con.close()
+    if name is not None:
+        units = units[units['name'] == name]
+    if units.empty:
+        print(f'最近{days}天没有作业指标.')
+        return
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 20)
+
+    jobs = summarize_jobs(units)
+    jobs['started'] = pd.to_datetime(jobs['started'], unit='s').dt.strftime('%m-%d %H:%M')
+    jobs['seconds'] = jobs['seconds'].round(1)
+    jobs['MB'] = (jobs['bytes'] / 2**20).round(2)
+    jobs['quota'] = (jobs['calls_per_minute'] / TUSHARE_CALLS_PER_MINUTE).map('{:.0%}'.format)
+    print(f'作业趋势(最近{days}天):')
+    print(jobs.drop(columns=['finished', 'bytes']).to_string(index=False))
+
+    print('\n各作业单元耗时(秒):')
+    print(percentiles(units, ['name']).to_string(index=False))
+
+    stages = units[units['name'] == PIPELINE_JOB]
+    if not stages.empty:
+        print(f'\n{PIPELINE_JOB}各阶段耗时(秒):')
+        print(percentiles(stages, ['unit']).to_string(index=False))
+
+    latest = units[units['job_id'].isin(units.groupby('name')['job_id'].max())]
+    slowest = latest.sort_values(by='duration', ascending=False).groupby('name').head(top)
+    print(f'\n最近一次作业中最慢的{top}个单元:')
+    print(slowest[['name', 'job_id', 'unit', 'duration', 'api_calls', 'retries', 'rows_fetched', 'rows_written']]
+          .sort_values(by=['name', 'duration'], ascending=[True, False]).round(2).to_string(index=False))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='批量数据作业指标报告')
+    parser.add_argument('--days', type=int, default=TELEMETRY_DAYS, help='报告最近的天数')
+    parser.add_argument('--job', default=None, help='只报告该名称的作业')
+    parser.add_argument('--top', type=int, default=5, help='每个作业列出的最慢单元数')
+    args = parser.parse_args()
+    report(args.days, args.job, args.top)
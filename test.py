@@ -1,7 +1,7 @@
 import time
 import pandas as pd
-import sqlite3
 from strategy import Strategy
+from writer import connect, ensure_condition_table
 from path import TEST_CONDITION_SQLITE3, COVER_YEARS, NEW_TABLE_MONTH
 import threading
 import json
@@ -81,27 +81,10 @@ def retest_previous_years_conditions(cover_years: int=COVER_YEARS) -> None:
     now = time.localtime()
     table_name = f'condition-{now.tm_year}' if now.tm_mon >= NEW_TABLE_MONTH else f'condition-{now.tm_year-1}'
     # 第一步 重新检测以前年度的全部测试条件
-    con = sqlite3.connect(TEST_CONDITION_SQLITE3)
+    con = connect(TEST_CONDITION_SQLITE3)
     with con:
         if now.tm_mon >= NEW_TABLE_MONTH:
-            sql = f"""
-                CREATE TABLE IF NOT EXISTS '{table_name}'
-                (
-                    strategy TEXT, 
-                    test_condition TEXT, 
-                    total_groups INTEGER, 
-                    valid_groups INTEGER, 
-                    valid_percent REAL, 
-                    valid_groups_keys TEXT, 
-                    basic_ratio REAL, 
-                    inner_rate REAL,
-                    down_max REAL, 
-                    score REAL, 
-                    date TEXT,
-                    PRIMARY KEY(strategy, test_condition)
-                )
-            """
-            con.execute(sql)
+            ensure_condition_table(con, table_name)
             con.commit()
             # 从以前年度表格中获取测试条件集合,执行retest_conditions_from_sqlite3函数
             create_retested_progress_table(con=con, cover_years=cover_years)
@@ -111,20 +94,24 @@ def retest_previous_years_conditions(cover_years: int=COVER_YEARS) -> None:
                 if progress['retested_rows'] < progress['total_rows'] \
                     and progress['involved_years'] == f"{now.tm_year}":
                     print(f"开始重新测试{table}表格中的测试条件.")
+
+                    def checkpoint(position: int, table: str = table) -> None:
+                        # 分批更新进度表格中的retested_rows字段,中断后从该位置继续
+                        sql = f"""
+                            UPDATE progress SET retested_rows=? WHERE table_name=? AND involved_years=?
+                        """
+                        params = (position, table, f"{now.tm_year}")
+                        con.execute(sql, params)
+                        con.commit()
+
                     case.retest_conditions_from_sqlite3(
-                        src_sqlite3=TEST_CONDITION_SQLITE3, 
-                        src_table=table, 
-                        dest_sqlite3=TEST_CONDITION_SQLITE3, 
+                        src_sqlite3=TEST_CONDITION_SQLITE3,
+                        src_table=table,
+                        dest_sqlite3=TEST_CONDITION_SQLITE3,
                         dest_table=table_name,
-                        from_pos=progress['retested_rows']
+                        from_pos=progress['retested_rows'],
+                        checkpoint=checkpoint
                     )
-                    # 更新进度表格中的retested_rows字段 TODO: 需要实时更新
-                    sql = f"""
-                        UPDATE progress SET retested_rows=? WHERE table_name=?
-                    """
-                    params = (progress['total_rows'], table)
-                    con.execute(sql, params)
-                    con.commit()
             # 获取table_name表格中的测试条件,遍历prev_table_names,对相同的测试条件,
             # 则将table_name表格中的date字段替换为prev_table表格中的date字段
             # 保留全部入选测试条件原始日期
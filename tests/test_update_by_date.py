@@ -0,0 +1,160 @@
+"""
+按交易日批量更新交易记录文件的替身测试.
+以内存中的合成行情代替Tushare接口,检查:
+1. 停牌或退市股票的最新日期不拉长按交易日获取的区间,已复牌的落后股票改为逐只补齐;
+2. 按交易日更新追加的行与逐只更新(update_trade_record_csv)的结果相同,包括期间复权因子变化时的前复权收盘价.
+运行:
+    python -m pytest -q tests
+NOTE:
+path在导入时读取QUANT_ROOT_PATH,本模块在导入项目模块之前把数据根目录设为临时目录.
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import pandas as pd
+
+ROOT = tempfile.mkdtemp(prefix='quant-test-')
+atexit.register(shutil.rmtree, ROOT, ignore_errors=True)
+os.environ['QUANT_ROOT_PATH'] = ROOT
+os.environ['QUANT_DATASOURCE'] = 'replay'  # 任何未替换的接口调用都不会访问网络
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data  # noqa: E402
+import fetch  # noqa: E402
+import backfill  # noqa: E402
+from path import TRADE_RECORD_PATH  # noqa: E402
+
+END_DATE = '20240315'
+INDUSTRY = '银行'
+CURRENT = ['600000', '000001']  # 交易记录截至20240311
+DELISTED = '600001'  # 交易记录截至20210105,此后没有交易数据
+RESUMED = '000002'  # 交易记录截至20231201,20240313复牌
+LAST_DATES = {'600000': '20240311', '000001': '20240311', DELISTED: '20210105', RESUMED: '20231201'}
+
+def full_code(code: str) -> str:
+    return code + '.SH' if code.startswith('6') else code + '.SZ'
+
+def weekdays(start: str, end: str) -> list:
+    days = pd.date_range(start, end, freq='D')
+    return [day.strftime('%Y%m%d') for day in days if day.weekday() < 5]
+
+class FakePro:
+    """
+    Tushare pro接口的替身,行情为按股票和交易日确定的合成数据
+    """
+    def __init__(self):
+        rows = []
+        for code in [*CURRENT, DELISTED, RESUMED]:
+            for i, day in enumerate(weekdays('20201201', END_DATE)):
+                if code == DELISTED and day > LAST_DATES[DELISTED]:
+                    break
+                if code == RESUMED and LAST_DATES[RESUMED] < day < '20240313':
+                    continue  # 停牌
+                rows.append(self._row(code, day, i))
+        self.market = pd.DataFrame(rows)
+        self.trade_date_calls = []  # 按交易日调用daily_basic的日期
+
+    @staticmethod
+    def _row(code: str, day: str, i: int) -> dict:
+        seed = int(code) % 97 + 1
+        row = {field: round(seed + i * 0.01 + k * 0.1, 4) for k, field in enumerate(data.DAILY_BASIC_FIELDS[2:])}
+        row.update({
+            'ts_code': full_code(code), 'trade_date': day, 'close': round(10 + seed / 10 + i * 0.03, 2),
+            'pct_chg': round((i % 7 - 3) * 0.5, 2),
+            # 600000在20240313除权,复权因子变化
+            'adj_factor': 1.2 if code == '600000' and day >= '20240313' else 1.0,
+        })
+        return row
+
+    def _select(self, fields, ts_code=None, trade_date=None, start_date=None, end_date=None) -> pd.DataFrame:
+        df = self.market
+        if ts_code is not None:
+            df = df[df['ts_code'] == ts_code]
+        if trade_date is not None:
+            df = df[df['trade_date'] == trade_date]
+        if start_date is not None:
+            df = df[df['trade_date'] >= start_date]
+        if end_date is not None:
+            df = df[df['trade_date'] <= end_date]
+        fields = fields.replace(' ', '').split(',') if isinstance(fields, str) else fields
+        return df.sort_values(by=['trade_date', 'ts_code'], ascending=[False, True])[fields].reset_index(drop=True)
+
+    def trade_cal(self, exchange='SSE', start_date=None, end_date=None, fields=None, **kwargs) -> pd.DataFrame:
+        days = pd.date_range(start_date, end_date, freq='D')
+        return pd.DataFrame({
+            'cal_date': [day.strftime('%Y%m%d') for day in days],
+            'is_open': [int(day.weekday() < 5) for day in days],
+        })
+
+    def daily_basic(self, fields, **kwargs) -> pd.DataFrame:
+        if 'trade_date' in kwargs:
+            self.trade_date_calls.append(kwargs['trade_date'])
+        return self._select(fields, **kwargs)
+
+    def daily(self, fields, **kwargs) -> pd.DataFrame:
+        return self._select(fields, **kwargs)
+
+    def adj_factor(self, fields, **kwargs) -> pd.DataFrame:
+        return self._select(fields, **kwargs)
+
+    def pro_bar(self, ts_code, adj=None, start_date=None, end_date=None, **kwargs) -> pd.DataFrame:
+        # 与pro_bar(adj='qfq')相同,以区间内最新复权因子前复权
+        df = self._select('ts_code,trade_date,close,adj_factor', ts_code, None, start_date, end_date)
+        df['close'] = (df['close'] * df['adj_factor'] / df['adj_factor'].iloc[0]).round(2)
+        return df.drop(columns='adj_factor')
+
+def write_initial_csv(pro: FakePro, code: str) -> str:
+    """写入截至LAST_DATES[code]的交易记录文件,返回文件路径"""
+    df = pro._select(backfill.SPOOL_COLUMNS, full_code(code), end_date=LAST_DATES[code])
+    df.insert(2, 'company', f'合成{code}')
+    df.insert(3, 'industry', INDUSTRY)
+    os.makedirs(os.path.join(TRADE_RECORD_PATH, INDUSTRY), exist_ok=True)
+    csv_file = os.path.join(TRADE_RECORD_PATH, INDUSTRY, code + '.csv')
+    df[backfill.TRADE_RECORD_COLUMNS].to_csv(csv_file, index=False)
+    return csv_file
+
+def read_csv(csv_file: str) -> pd.DataFrame:
+    return pd.read_csv(csv_file, dtype={'trade_date': str})
+
+def setup_market(monkeypatch) -> FakePro:
+    pro = FakePro()
+    monkeypatch.setattr(data.sw, 'get_name_and_class_by_code', lambda code: [f'合成{code}', INDUSTRY])
+    monkeypatch.setattr(fetch, 'pro_api', lambda *args, **kwargs: pro)
+    monkeypatch.setattr(fetch, 'pro_bar', lambda *args, **kwargs: pro.pro_bar(**kwargs))
+    shutil.rmtree(TRADE_RECORD_PATH, ignore_errors=True)
+    for code in LAST_DATES:
+        write_initial_csv(pro, code)
+    return pro
+
+def test_lagging_codes_do_not_widen_window(monkeypatch):
+    pro = setup_market(monkeypatch)
+    delisted_before = read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, DELISTED + '.csv'))
+    updated = data.update_trade_record_csv_by_date(list(LAST_DATES), end_date=END_DATE, pro=pro)
+
+    # 只获取当前股票缺失的交易日,不回溯到落后股票的最新日期
+    assert sorted(pro.trade_date_calls) == ['20240312', '20240313', '20240314', '20240315']
+    assert updated == 3
+    for code in CURRENT:
+        assert read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, code + '.csv')).loc[0, 'trade_date'] == END_DATE
+    # 退市股票不变,复牌股票逐只补齐至最新交易日
+    pd.testing.assert_frame_equal(read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, DELISTED + '.csv')), delisted_before)
+    resumed = read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, RESUMED + '.csv'))
+    assert resumed['trade_date'].head(4).tolist() == ['20240315', '20240314', '20240313', LAST_DATES[RESUMED]]
+
+def test_rows_match_per_stock_update(monkeypatch):
+    pro = setup_market(monkeypatch)
+    data.update_trade_record_csv_by_date(CURRENT, end_date=END_DATE, pro=pro)
+    by_date = {code: read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, code + '.csv')) for code in CURRENT}
+
+    for code in CURRENT:
+        write_initial_csv(pro, code)
+        data.update_trade_record_csv(code)
+        per_stock = read_csv(os.path.join(TRADE_RECORD_PATH, INDUSTRY, code + '.csv'))
+        pd.testing.assert_frame_equal(by_date[code], per_stock)
+    # 除权后的前复权收盘价以更新区间内最新复权因子计算
+    closes = by_date['600000'].set_index('trade_date')['close']
+    raw = pro.market.set_index(['ts_code', 'trade_date'])['close']
+    assert closes['20240312'] == round(raw[('600000.SH', '20240312')] / 1.2, 2)
+    assert closes['20240313'] == raw[('600000.SH', '20240313')]
@@ -0,0 +1,72 @@
+"""
+时间组类型.回测结果以时间组为键,原先的字符串键'Y2023-Y2017:2024-06-01:2025-06-01'
+在每个消费者中都要重新split解析,这里改为整数字段的NamedTuple,可直接排序和比较,
+只在写入valid_groups_keys或者显示时才转换成原来的字符串格式.
+"""
+import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+@lru_cache(maxsize=4096)
+def ordinal_to_date(ordinal: int) -> str:
+    """
+    把日期序数转换为yyyy-mm-dd格式的日期
+    :param ordinal: datetime.date.toordinal()的返回值
+    :return: 日期, 例如: '2024-06-01'
+    """
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+def date_to_ordinal(date: str) -> int:
+    """
+    把yyyy-mm-dd格式的日期转换为日期序数
+    :param date: 日期, 例如: '2024-06-01'
+    :return: 日期序数
+    """
+    return datetime.date.fromisoformat(date).toordinal()
+
+class TimeGroup(NamedTuple):
+    """
+    时间组: ROE数据源期间和持股期间.
+    first_year: ROE数据源的最近年度, 例如: 2023
+    last_year: ROE数据源的最早年度, 例如: 2017
+    start: 持股起点的日期序数
+    end: 持股终点的日期序数
+    NOTE:
+    字段顺序与字符串键的字典序一致,sorted()的结果和原先按字符串排序的结果相同.
+    """
+    first_year: int
+    last_year: int
+    start: int
+    end: int
+
+    @classmethod
+    def from_key(cls, key: str) -> 'TimeGroup':
+        """
+        从字符串键解析时间组
+        :param key: 例如: 'Y2023-Y2017:2024-06-01:2025-06-01'
+        :return: TimeGroup
+        """
+        years, start_date, end_date = key.split(':')
+        first_year, last_year = years.split('-')
+        return cls(
+            int(first_year[1:5]), int(last_year[1:5]),
+            date_to_ordinal(start_date), date_to_ordinal(end_date)
+        )
+
+    @property
+    def start_date(self) -> str:
+        """持股起点, 例如: '2024-06-01'"""
+        return ordinal_to_date(self.start)
+
+    @property
+    def end_date(self) -> str:
+        """持股终点, 例如: '2025-06-01'"""
+        return ordinal_to_date(self.end)
+
+    @property
+    def key(self) -> str:
+        """原字符串键, 例如: 'Y2023-Y2017:2024-06-01:2025-06-01'"""
+        return f"Y{self.first_year}-Y{self.last_year}:{self.start_date}:{self.end_date}"
+
+    def __str__(self) -> str:
+        return self.key
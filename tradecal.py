@@ -0,0 +1,236 @@
+"""
+本地交易日历.
+上交所交易日历缓存在TRADE_CAL_SQLITE3数据库的TRADE_CAL_TABLE表中(cal_date, is_open),cal_date为主键,
+只在查询区间超出已缓存区间时调用trade_cal接口补充,不再每次判断交易日都请求Tushare.
+进程内第一次查询时把日历载入内存,按日期序数建立下一个/上一个交易日的下标数组,
+is_trade_day next_trade_day prev_trade_day nearest_trade_day均为O(1)查询,供调度 回测和按日期取值共用.
+NOTE:
+get_trade_days等区间函数的日期格式与Tushare一致, 例如: '20240603'.
+单日查询函数同时接受'20240603'和'2024-06-03',返回值与参数格式相同.
+"""
+import bisect
+import sqlite3
+import datetime
+import threading
+from typing import List
+import fetch
+from path import ensure_dirs, TRADE_CAL_SQLITE3, TRADE_CAL_TABLE
+
+CALENDAR_BEGIN = '19901219'  # 上交所第一个交易日
+CALENDAR_AHEAD_DAYS = 366  # 补充日历时向后多取的天数,交易所公布的日历通常覆盖到年底
+
+def connect(sqlite_file: str = TRADE_CAL_SQLITE3) -> sqlite3.Connection:
+    """
+    打开交易日历数据库,不存在时创建表格
+    :param sqlite_file: 数据库文件
+    :return: sqlite3.Connection
+    """
+    ensure_dirs()
+    con = sqlite3.connect(sqlite_file)
+    with con:
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS '{TRADE_CAL_TABLE}' (
+                cal_date TEXT PRIMARY KEY NOT NULL,
+                is_open INTEGER NOT NULL
+            ) WITHOUT ROWID""")
+    return con
+
+def sync_calendar(end_date: str, con: sqlite3.Connection = None, pro=None) -> None:
+    """
+    补充交易日历至end_date之后CALENDAR_AHEAD_DAYS天
+    :param end_date: 需要覆盖的截止日期, 例如: '20240630'
+    :param con: sqlite3.Connection,默认为connect()
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: None
+    """
+    own = con is None
+    con = con if con is not None else connect()
+    try:
+        last_date = con.execute(f"SELECT MAX(cal_date) FROM '{TRADE_CAL_TABLE}'").fetchone()[0]
+        if last_date is not None and last_date >= end_date:
+            return
+        start_date = CALENDAR_BEGIN if last_date is None else _shift(last_date, 1)
+        stop_date = _shift(max(end_date, start_date), CALENDAR_AHEAD_DAYS)
+        pro = pro if pro is not None else fetch.pro_api()
+        df = pro.trade_cal(exchange='SSE', start_date=start_date, end_date=stop_date, fields='cal_date,is_open')
+        rows = [(str(date), int(is_open)) for date, is_open in zip(df['cal_date'], df['is_open'])]
+        with con:
+            con.executemany(f"INSERT OR REPLACE INTO '{TRADE_CAL_TABLE}' (cal_date, is_open) VALUES (?, ?)", rows)
+    finally:
+        if own:
+            con.close()
+
+def get_trade_days(start_date: str, end_date: str, pro=None) -> List[str]:
+    """
+    获取期间内的交易日,使用本地日历,必要时先补充日历
+    :param start_date: 开始日期, 例如: '20240601'
+    :param end_date: 结束日期, 例如: '20240630'
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 升序排列的交易日列表, 例如: ['20240603', '20240604', ...]
+    """
+    con = connect()
+    try:
+        sync_calendar(end_date, con, pro)
+        sql = f"""
+            SELECT cal_date FROM '{TRADE_CAL_TABLE}'
+            WHERE cal_date BETWEEN ? AND ? AND is_open=1 ORDER BY cal_date
+        """
+        return [row[0] for row in con.execute(sql, (start_date, end_date))]
+    finally:
+        con.close()
+
+class TradeCalendar:
+    """
+    内存中的交易日历
+    :param days: 升序排列的交易日序数
+    :param first: 日历第一天的序数
+    :param last: 日历最后一天的序数
+    NOTE:
+    _next[i]为first+i当日或之后第一个交易日在days中的下标,_prev[i]为当日或之前最后一个交易日的下标,
+    不存在时分别为len(days)和-1.
+    单日查询只在[first, last]范围内有效,超出范围时is_open返回False,next_day和prev_day返回None,
+    由get_calendar补充日历后重新查询.
+    """
+    def __init__(self, days: List[int], first: int, last: int):
+        self.days = days
+        self.first = first
+        self.last = last
+        self._open = bytearray(last - first + 1)
+        for day in days:
+            self._open[day - first] = 1
+        self._next = [bisect.bisect_left(days, first + i) for i in range(last - first + 1)]
+        self._prev = [bisect.bisect_right(days, first + i) - 1 for i in range(last - first + 1)]
+
+    def covers(self, ordinal: int) -> bool:
+        """日期是否在日历范围内"""
+        return self.first <= ordinal <= self.last
+
+    def is_open(self, ordinal: int) -> bool:
+        """是否为交易日,超出日历范围时为False"""
+        return self.covers(ordinal) and bool(self._open[ordinal - self.first])
+
+    def next_day(self, ordinal: int) -> int:
+        """当日或之后第一个交易日的序数,不存在或超出日历范围时为None"""
+        if not self.covers(ordinal):
+            return None
+        index = self._next[ordinal - self.first]
+        return self.days[index] if index < len(self.days) else None
+
+    def prev_day(self, ordinal: int) -> int:
+        """当日或之前最后一个交易日的序数,不存在或超出日历范围时为None"""
+        if not self.covers(ordinal):
+            return None
+        index = self._prev[ordinal - self.first]
+        return self.days[index] if index >= 0 else None
+
+_calendar = None  # 进程内共享的交易日历
+_calendar_lock = threading.Lock()
+
+def get_calendar(ordinal: int = None, pro=None) -> TradeCalendar:
+    """
+    获取内存中的交易日历,ordinal超出日历范围时先补充本地日历再重新载入
+    :param ordinal: 需要覆盖的日期序数,默认为今日
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: TradeCalendar
+    """
+    global _calendar
+    ordinal = ordinal if ordinal is not None else datetime.date.today().toordinal()
+    calendar = _calendar
+    if calendar is not None and calendar.last >= ordinal:
+        return calendar
+    with _calendar_lock:
+        if _calendar is None or _calendar.last < ordinal:
+            con = connect()
+            try:
+                sync_calendar(datetime.date.fromordinal(ordinal).strftime('%Y%m%d'), con, pro)
+                rows = con.execute(f"SELECT cal_date, is_open FROM '{TRADE_CAL_TABLE}' ORDER BY cal_date").fetchall()
+            finally:
+                con.close()
+            ordinals = [_to_ordinal(date) for date, _ in rows]
+            days = [day for day, (_, is_open) in zip(ordinals, rows) if is_open]
+            _calendar = TradeCalendar(days, ordinals[0], ordinals[-1])
+        return _calendar
+
+def is_trade_day(date: str = None, pro=None) -> bool:
+    """
+    判断是否为交易日
+    :param date: 日期, 例如: '20240603',默认为今日
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 是否为交易日
+    """
+    ordinal = _to_ordinal(date) if date is not None else datetime.date.today().toordinal()
+    calendar = get_calendar(ordinal, pro)
+    return calendar.is_open(ordinal)
+
+def next_trade_day(date: str, pro=None) -> str:
+    """
+    当日或之后第一个交易日
+    :param date: 日期, 例如: '20240601' or '2024-06-01'
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 交易日,格式与date相同, 例如: '20240603' or '2024-06-03'
+    """
+    ordinal = _to_ordinal(date)
+    calendar = get_calendar(ordinal, pro)
+    day = calendar.next_day(max(ordinal, calendar.first))
+    return _from_ordinal(day, date) if day is not None else None
+
+def prev_trade_day(date: str, pro=None) -> str:
+    """
+    当日或之前最后一个交易日
+    :param date: 日期, 例如: '20240601' or '2024-06-01'
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 交易日,格式与date相同,早于日历第一个交易日时为None
+    """
+    ordinal = _to_ordinal(date)
+    calendar = get_calendar(ordinal, pro)
+    if ordinal < calendar.first:
+        return None
+    day = calendar.prev_day(ordinal)
+    return _from_ordinal(day, date) if day is not None else None
+
+def nearest_trade_day(date: str, pro=None) -> str:
+    """
+    距离最近的交易日,前后距离相同时取之前的交易日,避免使用未来数据
+    :param date: 日期, 例如: '20240601' or '2024-06-01'
+    :param pro: Tushare pro接口,默认为fetch.pro_api()
+    :return: 交易日,格式与date相同
+    """
+    ordinal = _to_ordinal(date)
+    calendar = get_calendar(ordinal, pro)
+    ordinal = max(ordinal, calendar.first)
+    prev_day, next_day = calendar.prev_day(ordinal), calendar.next_day(ordinal)
+    if prev_day is None or (next_day is not None and next_day - ordinal < ordinal - prev_day):
+        day = next_day
+    else:
+        day = prev_day
+    return _from_ordinal(day, date)
+
+def _to_ordinal(date: str) -> int:
+    """
+    日期转换为日期序数
+    :param date: 日期, 例如: '20240603' or '2024-06-03'
+    :return: 日期序数
+    """
+    if '-' in date:
+        return datetime.date.fromisoformat(date).toordinal()
+    return datetime.date(int(date[0:4]), int(date[4:6]), int(date[6:8])).toordinal()
+
+def _from_ordinal(ordinal: int, like: str) -> str:
+    """
+    日期序数转换为与like格式相同的日期
+    :param ordinal: 日期序数
+    :param like: 格式样例, 例如: '20240603' or '2024-06-03'
+    :return: 日期字符串
+    """
+    day = datetime.date.fromordinal(ordinal)
+    return day.isoformat() if '-' in like else day.strftime('%Y%m%d')
+
+def _shift(date: str, days: int) -> str:
+    """
+    日期加减天数
+    :param date: 日期, 例如: '20240603'
+    :param days: 天数
+    :return: 日期字符串
+    """
+    day = datetime.datetime.strptime(date, '%Y%m%d') + datetime.timedelta(days=days)
+    return day.strftime('%Y%m%d')
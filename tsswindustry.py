@@ -2,7 +2,9 @@
 使用TuSharePro数据源重写申万行业分类数据管理接口,
 保证了每个选股策略中组合的样本和申万行业样本动态吻合.(2024年4月26日)
 """
-import tushare as ts
+import threading
+import datasource
+import profiling
 import pandas as pd
 from typing import List
 
@@ -13,7 +15,7 @@ def _get_stock_index_and_classes(src="SW2021", level="L1") -> pd.DataFrame:
     :param level: 申万行业分类级别, 默认为"L1"
     :return: 申万行业分类数据
     """
-    pro = ts.pro_api()
+    pro = datasource.pro_api()
     df = pro.index_classify(
         **{"index_code": "", "level": level, "src": src,}, 
         fields=["index_code", "industry_name"]
@@ -28,7 +30,7 @@ def _get_all_stock_list() -> pd.DataFrame:
     字段名包括index_code, index_name, con_code, con_name, in_date, out_date, is_new
     返回值中包含了某只股票多次进入和退出申万行业指数的情况,此处不能进行去重处理
     """
-    pro = ts.pro_api()
+    pro = datasource.pro_api()
     tmp = _get_stock_index_and_classes()
     indexes = tmp["index_code"].unique().tolist()
     df_list = []
@@ -46,15 +48,38 @@ def _get_all_stock_list() -> pd.DataFrame:
     result = result[result["con_code"].map(lambda x: x.startswith("6") or x.startswith("0"))]
     return result
 
-SWDF = _get_all_stock_list()  # 未去重
-DF = SWDF.drop_duplicates(subset=['con_code'])  # 去重
+_lists = {}  # {'SWDF': 未去重的股票清单, 'DF': 去重的股票清单}
+_lists_lock = threading.Lock()
+
+def _stock_list(unique: bool = True) -> pd.DataFrame:
+    """
+    申万行业股票清单,首次使用时从接口读取,此后使用进程内缓存
+    :param unique: True返回按con_code去重的DF,False返回未去重的SWDF
+    :return: 申万行业股票清单
+    NOTE:
+    导入本模块不再访问接口,回测工作进程只在实际查询行业时读取一次.
+    """
+    with _lists_lock:
+        if not _lists:
+            swdf = _get_all_stock_list()
+            _lists['SWDF'] = swdf
+            _lists['DF'] = swdf.drop_duplicates(subset=['con_code'])
+    return _lists['DF'] if unique else _lists['SWDF']
+
+def __getattr__(name: str):
+    # 兼容原来的模块属性sw.SWDF和sw.DF
+    if name == 'SWDF':
+        return _stock_list(unique=False)
+    if name == 'DF':
+        return _stock_list()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 def get_stock_classes() -> List:
     """
     获取申万行业分类清单
     :return: 申万行业分类清单
     """
-    result = DF['index_name'].unique().tolist()
+    result = _stock_list()['index_name'].unique().tolist()
     return result
 
 def get_code_and_class_by_name(name: str, contain_exit: bool=False) -> List:
@@ -64,12 +89,14 @@ def get_code_and_class_by_name(name: str, contain_exit: bool=False) -> List:
     :param contain_exit: 是否包含退市股票, 默认为False
     :return: [[股票代码, 公司简称，行业分类], ...]
     """
-    tmp = DF.loc[DF['con_name'].str.contains(name)]
+    df = _stock_list()
+    tmp = df.loc[df['con_name'].str.contains(name)]
     if not contain_exit:
         tmp = tmp[~tmp['con_name'].str.contains('退市')]
     result = tmp[['con_code', 'con_name', 'index_name']].values.tolist()
     return result
 
+@profiling.profiled
 def get_name_and_class_by_code(code: str) -> List:
     """
     通过股票代码获取公司简称及行业分类
@@ -77,9 +104,10 @@ def get_name_and_class_by_code(code: str) -> List:
     :return: [公司简称, 行业分类]
     """
     code = code + '.SH' if code.startswith('6') else code + '.SZ'
-    if code not in DF['con_code'].values.tolist():
+    df = _stock_list()
+    if code not in df['con_code'].values.tolist():
         raise ValueError(f"申万指数中不包括股票代码{code}, 请检查.")
-    tmp = DF.loc[DF['con_code'] == code]
+    tmp = df.loc[df['con_code'] == code]
     result = tmp[['con_name', 'index_name']].values.tolist()[0]
     return result
 
@@ -89,7 +117,8 @@ def get_stocks_of_specific_class(stock_class: str) -> List:
     :param stock_class: 行业分类
     :return: [[股票代码, 公司简称, 行业分类], ...]
     """
-    tmp = DF.loc[DF['index_name'] == stock_class]  # 选出类所在的若干行
+    df = _stock_list()
+    tmp = df.loc[df['index_name'] == stock_class]  # 选出类所在的若干行
     result = tmp[['con_code', 'con_name', 'index_name']].values.tolist()
     return result
 
@@ -98,9 +127,10 @@ def get_all_stocks() -> List:
     获取申万指数所有股票代码 公司简称 行业分类
     :return: [[股票代码, 公司简称, 行业分类], ...]
     """
-    result = DF[['con_code', 'con_name', 'index_name']].values.tolist()
+    result = _stock_list()[['con_code', 'con_name', 'index_name']].values.tolist()
     return result
 
+@profiling.profiled
 def in_index_or_not(code: str, date: str) -> bool:
     """
     判断股票在给定的日期是否在申万行业指数中
@@ -112,7 +142,8 @@ def in_index_or_not(code: str, date: str) -> bool:
     当股票存在多次进入和退出申万行业指数的情况时,只要有一次进入申万行业指数,就返回True
     """
     full_code = code + '.SH' if code.startswith('6') else code + '.SZ'
-    row = SWDF.loc[SWDF['con_code'] == full_code]
+    swdf = _stock_list(unique=False)
+    row = swdf.loc[swdf['con_code'] == full_code]
     if row.empty:
         raise ValueError(f"申万指数中不包括股票代码{full_code}, 请检查.")
     date = date.replace('-', '')  # 日期格式转换成20210426
@@ -4,16 +4,22 @@ import sqlite3
 import pandas as pd
 import datetime
 import time
-import matplotlib.pyplot as plt
-from matplotlib.axes import Axes
-from typing import List, Tuple, Literal
-import tushare as ts
+from typing import List, Tuple, Literal, TYPE_CHECKING
 import data
+import fetch
+import generation
+import profiling
+import roestore
+import tradecal
 import tsswindustry as sw
 from path import (INDICATOR_ROE_FROM_1991, CURVE_SQLITE3, CURVE_TABLE, 
-                ROE_TABLE, TRADE_RECORD_PATH, INDEX_VALUE, STOCK_MOS_IMG, 
+                TRADE_RECORD_PATH, INDEX_VALUE, STOCK_MOS_IMG, 
                 INDEX_MOS_IMG, INDEX_UP_DOWN_IMG, STOCK_UP_DOWN_IMG)
 
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes  # matplotlib在绘图函数内导入,导入utils不加载matplotlib
+
+@profiling.profiled
 def calculate_MOS_7_from_2006(code: str, date: str) -> float:
     """
     使用INDICATOR_ROE_FROM_1991等数据库计算7年MOS值,需要获取7年roe平均值 10年期国债收益率和PB.
@@ -42,25 +48,21 @@ def calculate_MOS_7_from_2006(code: str, date: str) -> float:
     end_year = int(year_month_list[0]) - 1 if int(year_month_list[1]) >= 5 else int(year_month_list[0]) - 2
     average_roe_7 = 0.00
     stock_code = f'{code}.SH' if code.startswith('6') else f'{code}.SZ'
-    date_range = [f'Y{year}' for year in range(end_year, end_year-7, -1)]
-    suffix = """stockcode, stockname, stockclass, """
-    for index, item in enumerate(date_range):
-        if index == len(date_range)-1:
-            suffix += item
-        else:
-            suffix += f"{item}, "
-    con = sqlite3.connect(INDICATOR_ROE_FROM_1991)
+    if generation.pinned() is None:
+        con = roestore.connect()
+    else:
+        con = roestore.connect_readonly(generation.path_of(INDICATOR_ROE_FROM_1991))  # 快照只读,不迁移
     with con:
-        sql = f"SELECT {suffix} FROM '{ROE_TABLE}' WHERE stockcode=?"
-        tmp = con.execute(sql, (stock_code, )).fetchone()
-        tmp = [0 if item is None else item for item in tmp]  # None替换成0
-        num_zero = list(tmp).count(0.00)
-        if num_zero == 7:
-            raise ValueError(f'{stock_code}7年roe值均为0.00')
-        try:
-            average_roe_7 = sum(list(tmp)[3:10])/(7-num_zero)  # 剔除0
-        except:
-            raise ValueError(f'未能获取{stock_code}7年roe均值')
+        tmp = roestore.get_roe_range(con, stock_code, end_year, 7)  # 长表主键范围查询
+    con.close()
+    tmp = [0 if item is None else item for item in tmp]  # None替换成0
+    num_zero = list(tmp).count(0.00)
+    if num_zero == 7:
+        raise ValueError(f'{stock_code}7年roe值均为0.00')
+    try:
+        average_roe_7 = sum(tmp)/(7-num_zero)  # 剔除0
+    except:
+        raise ValueError(f'未能获取{stock_code}7年roe均值')
 
     row = find_closest_row_in_curve_table(date=date)  # 获取date参数指定的日期及附近的10年期国债收益率
     try:
@@ -76,6 +78,7 @@ def calculate_MOS_7_from_2006(code: str, date: str) -> float:
     mos_7 = 1 -pb/inner_pb
     return round(mos_7, 4)
 
+@profiling.profiled
 def calculate_index_MOS_from_2006(
     index: Literal["000300", "399006", "000905"], 
     date: str
@@ -96,7 +99,7 @@ def calculate_index_MOS_from_2006(
         raise ValueError('请检查指数代码是否正确(000300, 399006, 000905)')
     full_code = f'{index}.SH' if index.startswith('000') else f'{index}.SZ'
 
-    con = sqlite3.connect(INDEX_VALUE)
+    con = sqlite3.connect(generation.path_of(INDEX_VALUE))
     with con:
         sql = f"SELECT trade_date FROM '{full_code}' ORDER BY trade_date ASC LIMIT 1"
         start_date = con.execute(sql).fetchone()[0]
@@ -104,9 +107,9 @@ def calculate_index_MOS_from_2006(
         if date < max([start_date, "2006-03-01"]):
             date = max([start_date, "2006-03-01"])
 
-        # 获取和当年4月30日最接近的roe_est值
-        sql = f"SELECT * FROM '{full_code}' WHERE trade_date LIKE '{date[0:4]}%'"
-        df = pd.read_sql(sql, con)
+        # 获取和当年4月30日最接近的roe_est值,按主键范围查询
+        sql = f"SELECT trade_date, roe_est FROM '{full_code}' WHERE trade_date BETWEEN ? AND ?"
+        df = pd.read_sql(sql, con, params=(f"{date[0:4]}0101", f"{date[0:4]}1231"))
         df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
         target_date = f"{date[0:4]}0430"
         target_date = datetime.datetime.strptime(target_date, '%Y%m%d')
@@ -130,6 +133,7 @@ def calculate_index_MOS_from_2006(
     mos = 1 - pb/inner_pb
     return round(mos, 4)
 
+@profiling.profiled
 def calculate_index_rising_value(
     index: Literal["000300", "399006", "000905"], 
     start_date: str, 
@@ -154,9 +158,9 @@ def calculate_index_rising_value(
     if date_regex.match(end_date):
         end_date = end_date.replace('-', '')
     full_code = f'{index}.SH' if index.startswith('000') else f'{index}.SZ'
-    if not os.path.exists(INDEX_VALUE):
+    if not os.path.exists(generation.path_of(INDEX_VALUE)):
         data.create_index_indicator_table(index=index)
-    con = sqlite3.connect(INDEX_VALUE)
+    con = sqlite3.connect(generation.path_of(INDEX_VALUE))
     with con:
         sql = f"""
             SELECT trade_date, pct_chg FROM '{full_code}' WHERE 
@@ -222,6 +226,7 @@ def calculate_stock_up_and_down_value_by_MOS(
     potential_down = (mos - mos_high) / (1 - mos)
     return round(potential_up, 2), round(potential_down, 2)
 
+@profiling.profiled
 def calculate_stock_rising_value(code: str, start_date: str, end_date: str) -> float:
     """
     计算单只股票期间涨幅涨幅
@@ -229,6 +234,8 @@ def calculate_stock_rising_value(code: str, start_date: str, end_date: str) -> f
     :param start_date: 开始日期, 例如: '2019-01-01'
     :param end_date: 结束日期, 例如: '2019-01-01'
     :return: 组合的涨幅
+    NOTE:
+    交易记录文件不存在时逐只创建;固定数据集版本时新文件不在版本中,抛出FileNotFoundError.
     """
     date_regex = re.compile(r"^\d{4}-\d{2}-\d{2}$")  # 日期格式转换
     if date_regex.match(start_date):
@@ -237,8 +244,10 @@ def calculate_stock_rising_value(code: str, start_date: str, end_date: str) -> f
         end_date = end_date.replace('-', '')
     full_code = f'{code}.SH' if code.startswith('6') else f'{code}.SZ'
     swindustry = sw.get_name_and_class_by_code(code)[1]
-    csv_file = os.path.join(TRADE_RECORD_PATH, swindustry, f"{code}.csv")
+    csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), swindustry, f"{code}.csv")
     if not os.path.exists(csv_file):
+        if generation.pinned() is not None:  # 新建的文件写入原位置,不在固定的版本中
+            raise FileNotFoundError(f'{code}交易记录文件不在数据集版本{generation.pinned()}中')
         data.create_trade_record_csv_table(code)
     df = pd.read_csv(csv_file, dtype={'trade_date': str}, usecols=['trade_date', 'pct_chg'])
     df = df[(df['trade_date'] >= start_date)]
@@ -250,6 +259,7 @@ def calculate_stock_rising_value(code: str, start_date: str, end_date: str) -> f
         rate = df['rate'].prod() - 1
     return rate
 
+@profiling.profiled
 def calculate_portfolio_rising_value(code_list: List[str], start_date: str, end_date: str) -> float:
     """
     计算股票组合的涨幅,采用等资金权重模式
@@ -340,16 +350,24 @@ def stamp_to_date(stamp: int) -> str:
     date = time.strftime("%Y-%m-%d", timeArray)
     return date
 
+@profiling.profiled
 def find_closest_row_in_trade_record(code: str, date: str):
     """
     在CSV中查找指定日期所在或者最接近的行.
     :param code: 股票代码, 例如: '600000' or '000001'
     :param date: 日期, 例如: '2019-01-01'
     :return: 查找到的行,如果没有精确匹配,则返回最接近的行
+    NOTE:
+    先以交易日历取最接近的交易日精确匹配,只有停牌等没有该交易日记录时才逐行计算日期差.
     """
     sw_industry = sw.get_name_and_class_by_code(code)[1]
-    csv_file = os.path.join(TRADE_RECORD_PATH, sw_industry, f"{code}.csv")
+    csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), sw_industry, f"{code}.csv")
     df = pd.read_csv(csv_file)
+    trade_day = tradecal.nearest_trade_day(date.replace('-', ''))
+    match_row = df.loc[df['trade_date'] == int(trade_day)]  # 精确匹配,trade_date读入为整数
+    if not match_row.empty:
+        return match_row
+
     df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
     date0 = datetime.datetime.strptime(date, '%Y-%m-%d')
     match_row = df.loc[df['trade_date'] == date0]  # 精确匹配        
@@ -360,14 +378,22 @@ def find_closest_row_in_trade_record(code: str, date: str):
         match_row = df.iloc[0:1, :]
     return match_row
 
+@profiling.profiled
 def find_closest_row_in_curve_table(date: str):
     """
     在curve数据库中查找指定日期所在或者最接近的行.
     :param date: 日期, 例如: '2019-01-01'
     :return: 查找到的行,如果没有精确匹配,则返回最接近的行
+    NOTE:
+    先以交易日历取最接近的交易日按主键查询,没有该交易日数据时才读取全表计算日期差.
     """
-    con = sqlite3.connect(CURVE_SQLITE3)
+    con = sqlite3.connect(generation.path_of(CURVE_SQLITE3))
     with con:
+        trade_day = tradecal.nearest_trade_day(date)
+        df = pd.read_sql(f"SELECT * FROM '{CURVE_TABLE}' WHERE date1=?", con, params=(trade_day,))
+        if not df.empty:
+            df['date1'] = pd.to_datetime(df['date1'], format='%Y-%m-%d')
+            return df
         df = pd.read_sql(f"SELECT * FROM '{CURVE_TABLE}'", con)
     df['date1'] = pd.to_datetime(df['date1'], format='%Y-%m-%d')
     date0 = datetime.datetime.strptime(date, '%Y-%m-%d')
@@ -379,6 +405,7 @@ def find_closest_row_in_curve_table(date: str):
         match_row = df.iloc[0:1, :]
     return match_row
 
+@profiling.profiled
 def get_indicator_in_trade_record(code: str, date: str, indicator: str) -> float:
     """
     获取指定股票指定日期的指定字段值
@@ -390,13 +417,26 @@ def get_indicator_in_trade_record(code: str, date: str, indicator: str) -> float
     row = find_closest_row_in_trade_record(code, date)
     return row[indicator].values[0]
 
+@profiling.profiled
+def get_indicators_in_trade_record(code: str, date: str, indicators: List[str]) -> List[float]:
+    """
+    获取指定股票指定日期的多个字段值,只读取一次CSV文件
+    :param code: 股票代码, 例如: '600000' or '000001'
+    :param date: 日期, 例如: '2019-01-01'
+    :param indicators: 指标字段列表, 例如: ['dv_ttm', 'dv_ratio']
+    :return: 与indicators顺序一致的字段值列表
+    """
+    row = find_closest_row_in_trade_record(code, date)
+    return [row[indicator].values[0] for indicator in indicators]
+
 def plot_10y_yield_curve_figure():
     """
     绘制10年期国债到期收益率曲线图.
     """
-    con = sqlite3.connect(CURVE_SQLITE3)
+    import matplotlib.pyplot as plt
+    con = sqlite3.connect(generation.path_of(CURVE_SQLITE3))
     with con:
-        df = pd.read_sql(f"SELECT * FROM '{CURVE_TABLE}'", con)
+        df = pd.read_sql(f"SELECT * FROM '{CURVE_TABLE}' ORDER BY date1 DESC", con)
     date = df['date1'].tolist()[::-1]
     value = df['value1'].tolist()[::-1]
     plt.plot(date, value)
@@ -441,8 +481,9 @@ def save_whole_MOS_7_figure(code: str, dest: str = STOCK_MOS_IMG, show_figure: b
     :param dest: 图形保存目录
     :param show_figure: 是否显示图形
     """
+    import matplotlib.pyplot as plt
     sw_class = sw.get_name_and_class_by_code(code)[1]
-    csv_file = os.path.join(TRADE_RECORD_PATH, sw_class, f"{code}.csv")
+    csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), sw_class, f"{code}.csv")
     df = pd.read_csv(csv_file, dtype={'trade_date': str})
     dates = df['trade_date'].tolist()
     dates = [date for date in dates if date >= '20060301']
@@ -516,11 +557,12 @@ def save_whole_index_MOS_figure(
     :param dest: 图形保存目录
     :param show_figure: 是否显示图形
     """
+    import matplotlib.pyplot as plt
     full_code = f'{index}.SH' if index.startswith('000') else f'{index}.SZ'
-    con = sqlite3.connect(INDEX_VALUE)
+    con = sqlite3.connect(generation.path_of(INDEX_VALUE))
     with con:
-        sql = f"SELECT * FROM '{full_code}' "
-        df = pd.read_sql(sql, con)
+        sql = f"SELECT trade_date FROM '{full_code}' WHERE trade_date>=? ORDER BY trade_date DESC"
+        df = pd.read_sql(sql, con, params=('20060301',))
         date_range = df['trade_date'].tolist()
         date_range = [item for item in date_range if item >= '20060301']
         date_range = [f"{item[0:4]}-{item[4:6]}-{item[6:8]}" for item in date_range][::-1]
@@ -605,8 +647,9 @@ def save_index_up_and_down_value_figure(
     :param remove_existed_img: 是否删除已存在的图形文件
     :param show_figure: 是否显示图形
     """
+    import matplotlib.pyplot as plt
     full_code = f'{index}.SH' if index.startswith('000') else f'{index}.SZ'
-    con = sqlite3.connect(INDEX_VALUE)
+    con = sqlite3.connect(generation.path_of(INDEX_VALUE))
     # 推算开始日期
     today = pd.Timestamp.today()
     end_date = today if not end_date else pd.Timestamp(end_date)
@@ -618,9 +661,9 @@ def save_index_up_and_down_value_figure(
     with con:
         sql = f"""
         SELECT ts_code, trade_date, close FROM '{full_code}' 
-        WHERE trade_date>="{start_date}" AND trade_date<="{end_date}"
+        WHERE trade_date>=? AND trade_date<=? ORDER BY trade_date DESC
         """
-        df = pd.read_sql(sql, con)
+        df = pd.read_sql(sql, con, params=(start_date, end_date))
         df["trade_date"] = df["trade_date"].astype(str)
         dates = df['trade_date'].tolist()
         dates = [date[:4] + '-' + date[4:6] + '-' + date[6:] for date in dates]
@@ -784,9 +827,10 @@ def save_stock_up_and_down_value_figure(
     :param remove_existed_img: 是否删除已存在的图形文件
     :param show_figure: 是否显示图形
     """
+    import matplotlib.pyplot as plt
     name = sw.get_name_and_class_by_code(code)[0]
     sw_class = sw.get_name_and_class_by_code(code)[1]
-    csv_file = os.path.join(TRADE_RECORD_PATH, sw_class, f"{code}.csv")
+    csv_file = os.path.join(generation.path_of(TRADE_RECORD_PATH), sw_class, f"{code}.csv")
     df = pd.read_csv(csv_file, dtype={'trade_date': str})
     # 推算开始日期
     today = pd.Timestamp.today()
@@ -942,7 +986,7 @@ def get_gaps_statistic_data(code: str, is_index: bool = False) -> pd.DataFrame:
     NOTE:
     缺口类型: up(向上跳空)和down(向下跳空)
     """
-    pro = ts.pro_api()
+    pro = fetch.pro_api()
     if not is_index:
         ts_code = f'{code}.SH' if code.startswith('6') else f'{code}.SZ'
         df = pro.daily(ts_code=ts_code)
@@ -0,0 +1,223 @@
+"""
+测试条件评估结果写入器
+使用一个长连接(WAL模式)和后台线程批量写入TEST_CONDITION_SQLITE3,
+多个测试线程共享一个写入器,避免每个测试条件单独建立连接和数据库锁冲突.
+"""
+import json
+import time
+import queue
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+from path import ensure_dirs, TEST_CONDITION_SQLITE3
+
+CONDITION_COLUMNS = [
+    'strategy', 'test_condition', 'total_groups', 'valid_groups', 'valid_percent',
+    'valid_groups_keys', 'basic_ratio', 'inner_rate', 'down_max', 'score', 'date',
+    'rate_list', 'delta_rate'
+]
+# 后新增的字段,旧表格通过ALTER TABLE补齐
+SERIES_COLUMNS = ['rate_list', 'delta_rate']
+
+def create_condition_table_sql(table_name: str) -> str:
+    """
+    测试条件表格的建表语句
+    :param table_name: 表名, 例如: 'condition-2024'
+    :return: CREATE TABLE IF NOT EXISTS语句
+    """
+    sql = f"""
+        CREATE TABLE IF NOT EXISTS '{table_name}'
+        (
+            strategy TEXT,
+            test_condition TEXT,
+            total_groups INTEGER,
+            valid_groups INTEGER,
+            valid_percent REAL,
+            valid_groups_keys TEXT,
+            basic_ratio REAL,
+            inner_rate REAL,
+            down_max REAL,
+            score REAL,
+            date TEXT,
+            rate_list TEXT,
+            delta_rate TEXT,
+            PRIMARY KEY(strategy, test_condition)
+        )
+    """
+    return sql
+
+def ensure_condition_table(con: sqlite3.Connection, table_name: str) -> None:
+    """
+    创建测试条件表格,并为旧表格补齐rate_list和delta_rate字段
+    :param con: sqlite3.Connection
+    :param table_name: 表名, 例如: 'condition-2024'
+    """
+    con.execute(create_condition_table_sql(table_name))
+    existed = {row[1] for row in con.execute(f"PRAGMA table_info('{table_name}')")}
+    for column in SERIES_COLUMNS:
+        if column not in existed:
+            con.execute(f"ALTER TABLE '{table_name}' ADD COLUMN {column} TEXT")
+
+def insert_condition_sql(table_name: str) -> str:
+    """
+    测试条件表格的参数化插入语句
+    :param table_name: 表名, 例如: 'condition-2024'
+    :return: INSERT OR REPLACE语句
+    """
+    columns = ', '.join(CONDITION_COLUMNS)
+    marks = ', '.join(['?'] * len(CONDITION_COLUMNS))
+    return f"""INSERT OR REPLACE INTO '{table_name}' ({columns}) VALUES ({marks})"""
+
+def evaluate_result_to_row(evaluate_result: Dict) -> Tuple:
+    """
+    将evaluate_portfolio_effect的返回值转换为插入参数
+    :param evaluate_result: 测试条件的评估结果
+    :return: 与CONDITION_COLUMNS顺序一致的元组
+    """
+    return (
+        evaluate_result['strategy'],
+        json.dumps(evaluate_result['test_condition']),
+        evaluate_result['total_groups'],
+        evaluate_result['valid_groups'],
+        evaluate_result['valid_percent'],
+        json.dumps(evaluate_result['valid_groups_keys']),
+        evaluate_result['basic_ratio'],
+        evaluate_result['inner_rate'],
+        evaluate_result['down_max'],
+        evaluate_result['score'],
+        evaluate_result['date'],
+        json.dumps(evaluate_result.get('rate_list')),
+        json.dumps(evaluate_result.get('delta_rate')),
+    )
+
+def connect(sqlite_file: str = TEST_CONDITION_SQLITE3, timeout: float = 60) -> sqlite3.Connection:
+    """
+    以WAL模式打开测试条件数据库,读写互不阻塞,写锁等待timeout秒.
+    :param sqlite_file: 数据库文件
+    :param timeout: 等待写锁的秒数
+    :return: sqlite3.Connection
+    """
+    ensure_dirs()
+    con = sqlite3.connect(sqlite_file, timeout=timeout, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA busy_timeout={int(timeout*1000)}")
+    return con
+
+class ConditionWriter:
+    """
+    测试条件批量写入器.write方法只把数据放入队列,由后台线程持有唯一连接,
+    按batch_size条或flush_interval秒(先到者为准)提交一次事务.
+    用法:
+        with ConditionWriter(TEST_CONDITION_SQLITE3) as writer:
+            writer.write('condition-2024', evaluate_result)
+    """
+    def __init__(
+        self,
+        sqlite_file: str = TEST_CONDITION_SQLITE3,
+        batch_size: int = 50,
+        flush_interval: float = 5.0
+    ):
+        self.sqlite_file = sqlite_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0  # 已提交的行数
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='condition-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, table_name: str, evaluate_result: Dict) -> None:
+        """
+        将一条评估结果放入写入队列
+        :param table_name: 目标表名
+        :param evaluate_result: 测试条件的评估结果
+        """
+        self._check_error()
+        self._queue.put((table_name, evaluate_result_to_row(evaluate_result)))
+
+    def flush(self) -> None:
+        """
+        阻塞直到队列中此前的全部数据提交到数据库
+        NOTE:
+        写入线程出错或已经结束时不再等待,抛出RuntimeError.
+        """
+        self._check_error()
+        done = threading.Event()
+        self._queue.put(done)
+        # 写入线程出错退出后放入队列的done不会被set,定时检查线程是否存活
+        while not done.wait(timeout=1.0):
+            if not self._thread.is_alive():
+                break
+        self._check_error()
+        if not done.is_set():
+            raise RuntimeError('测试条件写入线程已结束,数据未提交.')
+
+    def close(self) -> None:
+        """
+        提交剩余数据并关闭连接
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError(f'测试条件写入失败: {self._error}')
+
+    def _run(self):
+        con = None
+        created = set()  # 已执行建表语句的表名
+        pending: Dict[str, List[Tuple]] = {}
+        count = 0
+        deadline = None
+        try:
+            con = connect(self.sqlite_file)  # 打开失败同样记录在_error中
+            while True:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = 'timeout'
+                if isinstance(item, tuple):
+                    table_name, row = item
+                    pending.setdefault(table_name, []).append(row)
+                    count += 1
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    if count < self.batch_size:
+                        continue
+                # 达到批量大小 超时 flush或close时提交
+                if pending:
+                    with con:
+                        for table_name, rows in pending.items():
+                            if table_name not in created:
+                                ensure_condition_table(con, table_name)
+                                created.add(table_name)
+                            con.executemany(insert_condition_sql(table_name), rows)
+                    self.written += count
+                pending, count, deadline = {}, 0, None
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is None:
+                    break
+        except Exception as e:
+            self._error = e
+            # 唤醒等待中的flush调用
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+        finally:
+            if con is not None:
+                con.close()